@@ -0,0 +1,113 @@
+# SPDX-License-Identifier: EUPL-1.2
+# SPDX-FileCopyrightText: 2024 Energy Formula API Contributors
+#
+# Licensed under the EUPL
+"""
+Signed Access Tokens
+
+Self-verifying OAuth2 bearer tokens: the claims (client, scopes, expiry) are
+carried in the token and signed with HMAC-SHA256, so the server keeps no
+token store and verification needs no lookup. Verified claims are cached in
+a bounded LRU keyed by the token, so the repeated requests of a client cost
+one cache lookup plus an expiry comparison instead of an HMAC computation.
+
+Format:
+    <base64url(JSON claims)>.<base64url(HMAC-SHA256 of the first part)>
+
+Tokens signed with the default secret are only valid within one process
+tree (gunicorn workers forked from a preloaded app share it); set
+TOKEN_SECRET when tokens must survive restarts or be accepted by several
+servers.
+
+Environment:
+    TOKEN_SECRET      HMAC key (default: random per process)
+    TOKEN_TTL         Token lifetime in seconds (default: 3600)
+    TOKEN_CACHE_SIZE  Verified tokens kept in the cache (default: 10000)
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import functools
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from typing import FrozenSet, Iterable, NamedTuple, Optional
+
+SECRET = os.environ.get('TOKEN_SECRET', '').encode('utf-8') or secrets.token_bytes(32)
+TTL = int(os.environ.get('TOKEN_TTL', '3600'))
+CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '10000'))
+
+SCOPES = ('formula.read', 'formula.write', 'timeseries.read', 'timeseries.write', 'calculations.execute', 'admin')
+
+# Granted when a token request names no scope; admin (request profiles, which
+# show other clients' requests) only when requested explicitly
+DEFAULT_SCOPES = tuple(scope for scope in SCOPES if scope != 'admin')
+
+# Longer bearer values are rejected before they reach the cache
+MAX_TOKEN_LENGTH = 1024
+
+
+class TokenClaims(NamedTuple):
+    client_id: str
+    scopes: FrozenSet[str]
+    issued_at: int
+    expires_at: int
+
+
+def _encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _encode(hmac.new(SECRET, payload.encode('ascii'), hashlib.sha256).digest())
+
+
+def issue(client_id: str, scopes: Iterable[str], ttl: int = TTL) -> str:
+    """Issue a signed token for client_id with the given scopes, valid for ttl seconds"""
+    now = int(time.time())
+    claims = {
+        'sub': client_id,
+        'scope': ' '.join(sorted(scopes)),
+        'iat': now,
+        'exp': now + ttl,
+        'jti': secrets.token_hex(8),
+    }
+    payload = _encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    return f'{payload}.{_sign(payload)}'
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _verified_claims(token: str) -> Optional[TokenClaims]:
+    """Signature check and claim decoding, cached per token (invalid tokens cache None)"""
+    payload, _, signature = token.partition('.')
+    if not signature or not hmac.compare_digest(signature, _sign(payload)):
+        return None
+    try:
+        claims = json.loads(_decode(payload))
+        return TokenClaims(str(claims['sub']), frozenset(claims['scope'].split()), int(claims['iat']), int(claims['exp']))
+    except (ValueError, binascii.Error, KeyError, TypeError, AttributeError):
+        return None
+
+
+def verify(token: str) -> Optional[TokenClaims]:
+    """Claims of a valid, unexpired token, None otherwise"""
+    if len(token) > MAX_TOKEN_LENGTH or not token.isascii():
+        return None
+    claims = _verified_claims(token)
+    if claims is None or claims.expires_at <= time.time():
+        return None
+    return claims
+
+
+def cache_info():
+    """functools cache statistics of the verification cache (hits, misses, maxsize, currsize)"""
+    return _verified_claims.cache_info()
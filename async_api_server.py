@@ -0,0 +1,532 @@
+# SPDX-License-Identifier: EUPL-1.2
+# SPDX-FileCopyrightText: 2024 Energy Formula API Contributors
+#
+# Licensed under the EUPL
+"""
+EDI@Energy Formula API Server - asyncio variant
+
+Serves the formula, time series and calculation routes on aiohttp for
+high-concurrency, I/O-bound traffic such as long, slow EDI partner uploads.
+Request bodies are read without pinning a worker thread; validation,
+calculation and large JSON (de)serialization run on a bounded thread pool.
+
+Validation, storage and the calculation engine are shared with
+mock_api_server, including its in-memory stores. Event streams
+(GET /v1/events) wait on the event loop, so many clients can listen
+without holding a thread each.
+
+Usage:
+    python async_api_server.py
+    gunicorn async_api_server:app --worker-class aiohttp.GunicornWebWorker --bind 0.0.0.0:8000
+
+Environment:
+    PORT                   Listen port (default: 8000)
+    ASYNC_EXECUTOR_WORKERS Threads for CPU-bound work (default: 8)
+    ASYNC_MAX_BODY_BYTES   Maximum request body size (default: 256 MiB)
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import time
+
+from aiohttp import web
+
+import access_tokens
+import metrics
+import mock_api_server as core
+import notifications
+import profiling
+import scheduling
+import timeseries_codec
+
+EXECUTOR_WORKERS = int(os.environ.get('ASYNC_EXECUTOR_WORKERS', '8'))
+MAX_BODY_BYTES = int(os.environ.get('ASYNC_MAX_BODY_BYTES', str(256 * 1024 * 1024)))
+
+EXECUTOR_KEY = web.AppKey('executor', ThreadPoolExecutor)
+
+
+# =============================================================================
+# Helpers
+# =============================================================================
+
+async def offload(request: web.Request, fn: Callable, *args: Any) -> Any:
+    """Run CPU-bound work on the executor so the event loop keeps serving I/O"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(request.app[EXECUTOR_KEY], fn, *args)
+
+
+async def offload_profiled(request: web.Request, name: str, fn: Callable, *args: Any,
+                           location_id: Optional[str] = None) -> Tuple[Any, Optional[str]]:
+    """
+    offload(), under cProfile when profiling.should_profile selects the request
+
+    Returns:
+        (fn result, profile ID or None)
+    """
+    trigger = profiling.should_profile(request.headers.get(profiling.HEADER))
+    if trigger is None:
+        return await offload(request, fn, *args), None
+
+    metadata = {'trigger': trigger, 'locationId': location_id}
+    return await offload(request, functools.partial(profiling.run_profiled, name, fn, *args, metadata=metadata))
+
+
+def with_profile_id(response: web.Response, profile_id: Optional[str]) -> web.Response:
+    if profile_id is not None:
+        response.headers[profiling.ID_HEADER] = profile_id
+    return response
+
+
+async def json_response(request: web.Request, body: Any, status: int = 200) -> web.Response:
+    text = await offload(request, json.dumps, body)
+    return web.Response(text=text, status=status, content_type='application/json')
+
+
+def authorize(request: web.Request, scope: Optional[str] = None
+              ) -> Tuple[Optional[access_tokens.TokenClaims], Optional[web.Response]]:
+    """(claims, None) if the Bearer token is valid and has scope, otherwise (None, 401/403 response)"""
+    claims, denied = core.authorize(request.headers.get('Authorization'), scope)
+    if denied is None:
+        return claims, None
+    return None, web.json_response(denied[0], status=denied[1])
+
+
+@contextlib.asynccontextmanager
+async def calculation_slot(client_id: str, cost: Callable[[], Optional[float]],
+                           timeout: Optional[float] = scheduling.CALCULATION_QUEUE_TIMEOUT, bounded: bool = True):
+    """
+    core.calculation_slot for coroutines: waits for the fair-queue grant on
+    the event loop instead of blocking a thread
+
+    Raises:
+        scheduling.Throttled: The client's queue is full or no slot was granted within timeout
+    """
+    queue = scheduling.calculation_queue
+    loop = asyncio.get_running_loop()
+    granted = asyncio.Event()
+    ticket = queue.submit(client_id, cost, lambda: loop.call_soon_threadsafe(granted.set), bounded)
+    if not ticket.granted:
+        try:
+            await asyncio.wait_for(granted.wait(), timeout)
+        except asyncio.TimeoutError:
+            if not queue.cancel(ticket):
+                raise scheduling.Throttled(f'No calculation slot available within {timeout:g}s', 1.0, 'timeout')
+        except asyncio.CancelledError:
+            if queue.cancel(ticket, 'disconnected'):
+                queue.release(ticket)
+            raise
+    core.calculation_queue_wait.observe(time.monotonic() - ticket.queued_at)
+    try:
+        yield
+    finally:
+        queue.release(ticket)
+
+
+def accepts_packed(request: web.Request) -> bool:
+    """True if the Accept header prefers the packed format over JSON"""
+    quality = {}
+    for part in request.headers.get('Accept', '').split(','):
+        media_type, _, params = part.strip().partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        quality[media_type.strip()] = q
+
+    packed = quality.get(timeseries_codec.MEDIA_TYPE, 0.0)
+    return packed > 0 and packed > quality.get('application/json', 0.0)
+
+
+# =============================================================================
+# Metrics
+# =============================================================================
+
+@web.middleware
+async def metrics_middleware(request: web.Request, handler: Callable) -> web.StreamResponse:
+    """Record latency and body sizes in the shared Prometheus metrics"""
+    started = time.perf_counter()
+    core.http_requests_in_flight.inc()
+    status = 500
+    response = None
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        core.http_requests_in_flight.dec()
+        # Label by route pattern, not path, to keep the number of series bounded
+        resource = request.match_info.route.resource
+        endpoint = resource.canonical if resource is not None else 'unmatched'
+        core.http_request_duration.observe(time.perf_counter() - started, request.method, endpoint, str(status))
+        core.http_request_size.observe(request.content_length or 0, request.method, endpoint)
+        if response is not None and response.content_length is not None:
+            core.http_response_size.observe(response.content_length, request.method, endpoint)
+
+
+@web.middleware
+async def throttle_middleware(request: web.Request, handler: Callable) -> web.StreamResponse:
+    """Answer rate-limited and queue-rejected requests with 429 and Retry-After"""
+    try:
+        return await handler(request)
+    except scheduling.Throttled as e:
+        return web.json_response(core.throttled_body(e), status=429, headers={'Retry-After': e.retry_after_header})
+
+
+def _executor_queue_depth() -> Dict[tuple, float]:
+    executor = app.get(EXECUTOR_KEY)
+    # ThreadPoolExecutor exposes no public queue size; _work_queue holds submitted, not yet started work
+    return {(): executor._work_queue.qsize() if executor is not None else 0}
+
+
+metrics.REGISTRY.gauge('formula_api_executor_queue_depth', 'Offloaded tasks waiting for an executor thread',
+                       (), _executor_queue_depth)
+
+
+# =============================================================================
+# Routes
+# =============================================================================
+
+routes = web.RouteTableDef()
+
+
+@routes.post('/oauth/token')
+async def oauth_token(request: web.Request) -> web.Response:
+    """Mock OAuth2 token endpoint"""
+    form = await request.post()
+    response, status_code = core.issue_token(
+        form.get('grant_type'), form.get('client_id'), form.get('client_secret'), form.get('scope')
+    )
+    return web.json_response(response, status=status_code)
+
+
+@routes.post('/formula/v0.0.1')
+async def submit_formula_edi(request: web.Request) -> web.Response:
+    """EDI@Energy compliant formula submission endpoint (see mock_api_server.submit_formula_edi)"""
+    body = await request.read()
+    (response, status_code), profile_id = await offload_profiled(
+        request, 'submit_formula_edi', core.handle_formula_submission, request.headers, lambda: json.loads(body)
+    )
+    return with_profile_id(await json_response(request, response, status_code), profile_id)
+
+
+@routes.route('*', '/formula/v0.0.1')
+async def formula_method_not_allowed(request: web.Request) -> web.Response:
+    """Return 405 for non-POST methods per EDI@Energy specification"""
+    return web.json_response({
+        'error': 'Method Not Allowed',
+        'message': 'Only POST method is allowed for /formula/v0.0.1',
+        'allowedMethods': ['POST']
+    }, status=405)
+
+
+@routes.post('/v1/time-series')
+async def submit_time_series(request: web.Request) -> web.Response:
+    """Submit time series data (JSON or packed binary format)"""
+    claims, denied = authorize(request, 'timeseries.write')
+    if denied is not None:
+        return denied
+    core.admit_submission(claims)
+
+    body = await request.read()
+
+    if request.content_type == timeseries_codec.MEDIA_TYPE:
+        try:
+            time_series_list = await offload(request, timeseries_codec.decode_time_series, body)
+        except ValueError as e:
+            return web.json_response({'error': 'Bad Request', 'message': f'Invalid packed time series: {e}'}, status=400)
+    else:
+        try:
+            data = await offload(request, json.loads, body)
+        except ValueError as e:
+            return web.json_response({'error': 'Bad Request', 'message': f'Invalid JSON: {e}'}, status=400)
+        if not isinstance(data, dict):
+            return web.json_response({'error': 'Bad Request', 'message': 'Body must be a JSON object'}, status=400)
+        time_series_list = data.get('timeSeries', [])
+
+    # Storing runs every listener (indexes, rollups, WAL encoding): off the event loop
+    response = await offload(request, core.store_time_series, time_series_list)
+    return await json_response(request, response, status=201)
+
+
+@routes.get('/v1/time-series')
+async def query_time_series(request: web.Request) -> web.Response:
+    """Query time series data"""
+    _, denied = authorize(request, 'timeseries.read')
+    if denied is not None:
+        return denied
+
+    results = await offload(request, core.find_time_series,
+                            request.query.get('marketLocationId'), request.query.get('meterLocationId'))
+    if request.query.get('view') == 'summary':
+        results = [core.summarize_time_series(ts) for ts in results]
+    return await json_response(request, {'timeSeries': results, 'totalCount': len(results)})
+
+
+@routes.get('/v1/time-series/{time_series_id}')
+async def get_time_series(request: web.Request) -> web.Response:
+    """Get specific time series (rollups/downsampling via query, packed format via Accept)"""
+    _, denied = authorize(request, 'timeseries.read')
+    if denied is not None:
+        return denied
+
+    time_series_id = request.match_info['time_series_id']
+    ts_data = await offload(request, core.read_time_series, time_series_id)
+    if ts_data is None:
+        return web.json_response({'error': 'Not found'}, status=404)
+
+    ts_data, status_code = await offload(request, core.time_series_view, time_series_id, ts_data, request.query)
+    if status_code != 200:
+        return web.json_response(ts_data, status=status_code)
+
+    if accepts_packed(request):
+        try:
+            payload = await offload(request, timeseries_codec.encode_time_series, [ts_data])
+        except ValueError as e:
+            return web.json_response({'error': 'Not Acceptable', 'message': str(e)}, status=406)
+        return web.Response(body=payload, content_type=timeseries_codec.MEDIA_TYPE)
+
+    return await json_response(request, ts_data)
+
+
+@routes.post('/v1/metering-points/{metering_point_id}/values')
+async def submit_metering_values(request: web.Request) -> web.Response:
+    """Append metering point values (see mock_api_server.submit_metering_point_values)"""
+    claims, denied = authorize(request, 'timeseries.write')
+    if denied is not None:
+        return denied
+    core.admit_submission(claims)
+
+    try:
+        data = json.loads(await request.read())
+    except ValueError:
+        data = None
+
+    response, status_code = await offload(
+        request, core.submit_metering_values, request.match_info['metering_point_id'], data
+    )
+    return web.json_response(response, status=status_code)
+
+
+@routes.post('/v1/calculations')
+async def execute_calculation(request: web.Request) -> web.Response:
+    """Execute calculation using stored formula (runs on the executor)"""
+    claims, denied = authorize(request, 'calculations.execute')
+    if denied is not None:
+        return denied
+    client_id = core.admit_submission(claims)
+
+    try:
+        data = json.loads(await request.read())
+    except ValueError as e:
+        return web.json_response({'error': 'Bad Request', 'message': f'Invalid JSON: {e}'}, status=400)
+    if not isinstance(data, dict):
+        return web.json_response({'error': 'Bad Request', 'message': 'Body must be a JSON object'}, status=400)
+
+    async with calculation_slot(client_id, lambda: core.estimate_calculation_cost(data)):
+        (response, status_code), profile_id = await offload_profiled(
+            request, 'execute_calculation', core.run_calculation, data,
+            location_id=data.get('maloId') or data.get('neloId')
+        )
+    return with_profile_id(web.json_response(response, status=status_code), profile_id)
+
+
+@routes.post('/v1/calculations/batch')
+async def execute_calculation_batch(request: web.Request) -> web.Response:
+    """
+    Execute a calculation batch ordered by estimated cost
+
+    Each pack runs as its own executor task, so other requests are served
+    between packs of a long settlement run.
+    """
+    claims, denied = authorize(request, 'calculations.execute')
+    if denied is not None:
+        return denied
+    client_id = core.admit_submission(claims)
+
+    try:
+        data = await offload(request, json.loads, await request.read())
+    except ValueError as e:
+        return web.json_response({'error': 'Bad Request', 'message': f'Invalid JSON: {e}'}, status=400)
+
+    try:
+        jobs = core.calculation_batch_jobs(data)
+    except ValueError as e:
+        return web.json_response({'error': 'Bad Request', 'message': str(e)}, status=400)
+
+    results, packs, costs = await offload(request, core.plan_calculation_batch, jobs)
+    for pack in packs:
+        async with calculation_slot(client_id, functools.partial(core.pack_cost, pack, costs),
+                                    timeout=None, bounded=False):
+            outcomes = await offload(request, core.run_calculation_pack, jobs, pack)
+        for index, result in outcomes:
+            results[index] = result
+    return await json_response(request, core.calculation_batch_result(results, packs, costs))
+
+
+@routes.get('/v1/calculations/{calculation_id}')
+async def get_calculation(request: web.Request) -> web.Response:
+    """Get calculation result"""
+    _, denied = authorize(request, 'calculations.execute')
+    if denied is not None:
+        return denied
+
+    calculation = core.calculation_store.get(request.match_info['calculation_id'])
+    if calculation is None:
+        return web.json_response({'error': 'Not found'}, status=404)
+
+    return web.json_response(calculation)
+
+
+@routes.get('/v1/events')
+async def stream_events(request: web.Request) -> web.StreamResponse:
+    """Server-Sent Events stream (see mock_api_server.stream_events)"""
+    loop = asyncio.get_running_loop()
+    woken = asyncio.Event()
+    subscription, status_code = core.open_event_stream(
+        core.event_stream_authorization(request.headers.get('Authorization'), request.query),
+        request.headers.get('Last-Event-ID'), request.query, lambda: loop.call_soon_threadsafe(woken.set)
+    )
+    if status_code != 200:
+        return web.json_response(subscription, status=status_code)
+
+    broker = notifications.broker
+    response = web.StreamResponse(headers={**core.EVENT_STREAM_HEADERS, 'Content-Type': 'text/event-stream'})
+    try:
+        await response.prepare(request)
+        await response.write(notifications.STREAM_PREAMBLE)
+        while True:
+            for event in broker.drain(subscription):
+                await response.write(event.frame)
+            if subscription.closed:
+                break
+            try:
+                await asyncio.wait_for(woken.wait(), notifications.EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                await response.write(notifications.HEARTBEAT_FRAME)
+            woken.clear()
+    except ConnectionResetError:
+        pass
+    finally:
+        broker.unsubscribe(subscription)
+    return response
+
+
+@routes.post('/v1/webhooks')
+async def create_webhook(request: web.Request) -> web.Response:
+    """Register a webhook for calculation, formula and time series events"""
+    try:
+        data = json.loads(await request.read())
+    except ValueError:
+        data = None
+    # Offloaded: validating the URL resolves its host
+    response, status_code = await offload(request, core.register_webhook,
+                                          request.headers.get('Authorization'), data)
+    return web.json_response(response, status=status_code)
+
+
+@routes.get('/v1/webhooks')
+async def get_webhooks(request: web.Request) -> web.Response:
+    """List the client's webhooks"""
+    response, status_code = core.list_webhooks(request.headers.get('Authorization'))
+    return web.json_response(response, status=status_code)
+
+
+@routes.delete('/v1/webhooks/{webhook_id}')
+async def remove_webhook(request: web.Request) -> web.Response:
+    """Remove a webhook"""
+    response, status_code = core.delete_webhook(request.headers.get('Authorization'), request.match_info['webhook_id'])
+    if response is None:
+        return web.Response(status=status_code)
+    return web.json_response(response, status=status_code)
+
+
+@routes.get('/health')
+async def health_check(request: web.Request) -> web.Response:
+    """Health check endpoint"""
+    return web.json_response(core.health_status())
+
+
+@routes.get('/admin/profiles')
+async def list_profiles(request: web.Request) -> web.Response:
+    """List captured request profiles (newest first)"""
+    _, denied = authorize(request, 'admin')
+    if denied is not None:
+        return denied
+
+    return web.json_response(core.profile_listing())
+
+
+@routes.get('/admin/profiles/{profile_id}')
+async def get_profile(request: web.Request) -> web.Response:
+    """Get a captured profile as collapsed stacks (default) or pstats text"""
+    _, denied = authorize(request, 'admin')
+    if denied is not None:
+        return denied
+
+    text, status_code = await offload(
+        request, core.render_profile, request.match_info['profile_id'], request.query.get('format', 'collapsed')
+    )
+    if status_code != 200:
+        error = 'Not Found' if status_code == 404 else 'Bad Request'
+        return web.json_response({'error': error, 'message': text}, status=status_code)
+    return web.Response(text=text, content_type='text/plain')
+
+
+@routes.get('/metrics')
+async def metrics_endpoint(request: web.Request) -> web.Response:
+    """Prometheus metrics: request latency, calculation stages, caches, stores"""
+    body = await offload(request, metrics.REGISTRY.render)
+    return web.Response(body=body.encode('utf-8'), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+# =============================================================================
+# Application
+# =============================================================================
+
+async def _executor_context(app: web.Application):
+    executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix='calc')
+    app[EXECUTOR_KEY] = executor
+    await asyncio.get_running_loop().run_in_executor(executor, core.warmup)
+    yield
+    executor.shutdown(wait=True)
+
+
+async def _close_event_streams(app: web.Application) -> None:
+    # Open streams end after their pending events, so shutdown does not wait for the clients
+    notifications.broker.close_all()
+
+
+def create_app() -> web.Application:
+    """Build the aiohttp application"""
+    application = web.Application(client_max_size=MAX_BODY_BYTES, middlewares=[metrics_middleware, throttle_middleware])
+    application.add_routes(routes)
+    application.cleanup_ctx.append(_executor_context)
+    application.on_shutdown.append(_close_event_streams)
+    return application
+
+
+app = create_app()
+
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', '8000'))
+    print('=' * 70)
+    print('EDI@Energy Formula API Server (asyncio)')
+    print(f'Server starting on: http://localhost:{port}')
+    print(f'Executor threads: {EXECUTOR_WORKERS}')
+    print('=' * 70)
+    web.run_app(app, port=port, shutdown_timeout=30)
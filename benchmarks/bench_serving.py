@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: EUPL-1.2
+"""
+Serving Mode Benchmark
+
+Starts the API server in each requested mode, drives it with concurrent
+keep-alive clients and reports throughput and latency percentiles as JSON.
+
+Modes:
+    dev       python mock_api_server.py (Flask development server)
+    gunicorn  gunicorn --config gunicorn.conf.py mock_api_server:app
+
+Usage:
+    python benchmarks/bench_serving.py
+    python benchmarks/bench_serving.py --modes dev gunicorn --duration 20 --concurrency 64
+    python benchmarks/bench_serving.py --url http://localhost:8000   # existing server
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Optional
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MELO_ID = "DE00014545768S0000000000000003054"
+MALO_ID = "12345678901"
+SERIES_ID = "TS-BENCH-SERVING"
+
+SERVER_COMMANDS = {
+    "dev": [sys.executable, "mock_api_server.py"],
+    "gunicorn": [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "mock_api_server:app"],
+}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def start_server(mode: str, port: int) -> subprocess.Popen:
+    # All load comes from one client, so the per-client rate limit is off unless set explicitly
+    env = {"RATE_LIMIT_RATE": "0", **os.environ, "PORT": str(port), "GUNICORN_ACCESS_LOG": "/dev/null"}
+    command = SERVER_COMMANDS[mode]
+    if mode == "dev" and port != 8000:
+        raise SystemExit("The development server always listens on port 8000")
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_for_health(base_url: str, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"Server at {base_url} did not become healthy")
+
+
+def prepare_data(base_url: str) -> str:
+    """Load one formula and one series, return a bearer token"""
+    token = requests.post(f"{base_url}/oauth/token", data={
+        "grant_type": "client_credentials", "client_id": "bench", "client_secret": "bench",
+    }).json()["access_token"]
+
+    formula_location = {
+        "maloId": MALO_ID,
+        "calculationFormulaTimeSlices": [{
+            "timeSliceId": 1,
+            "timeSliceQuality": "Gültige Daten",
+            "periodOfUseFrom": "2024-01-01T00:00:00Z",
+            "periodOfUseTo": "2024-12-31T23:59:59Z",
+            "calculationFormula": {"add": [
+                {"meloOperand": {
+                    "meloId": MELO_ID, "energyDirection": "consumption",
+                    "lossFactorTransformer": {"percentvalue": 0.02},
+                    "lossFactorConduction": {"percentvalue": 0.01},
+                    "distributionFactorEnergyQuantity": {"percentvalue": 0.95}}},
+                {"const": "1.5"},
+            ]},
+        }],
+    }
+    requests.post(f"{base_url}/formula/v0.0.1", json=formula_location, headers={
+        "transactionId": str(uuid.uuid4()),
+        "creationDateTime": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+    }).raise_for_status()
+
+    base_time = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    intervals = []
+    for i in range(96):
+        start = base_time + timedelta(minutes=15 * i)
+        intervals.append({
+            "position": i + 1,
+            "start": start.isoformat().replace("+00:00", "Z"),
+            "end": (start + timedelta(minutes=15)).isoformat().replace("+00:00", "Z"),
+            "quantity": f"{100 + i % 10:.3f}",
+            "quality": "VALIDATED",
+        })
+    requests.post(f"{base_url}/v1/time-series", headers={"Authorization": f"Bearer {token}"}, json={
+        "timeSeries": [{
+            "timeSeriesId": SERIES_ID, "marketLocationId": MALO_ID, "meterLocationId": MELO_ID,
+            "measurementType": "CONSUMPTION", "unit": "KWH", "resolution": "PT15M",
+            "period": {"start": "2024-06-01T00:00:00Z", "end": "2024-06-02T00:00:00Z"},
+            "intervals": intervals,
+        }],
+    }).raise_for_status()
+
+    return token
+
+
+def run_load(base_url: str, token: str, duration: float, concurrency: int) -> Dict[str, Any]:
+    """Run the request mix from `concurrency` keep-alive clients for `duration` seconds"""
+    headers = {"Authorization": f"Bearer {token}"}
+    calculation = {"maloId": MALO_ID, "timeSliceId": 1, "inputTimeSeries": {MELO_ID: SERIES_ID},
+                   "outputTimeSeriesId": "TS-BENCH-OUT"}
+    requests_mix = [
+        ("GET /health", lambda s: s.get(f"{base_url}/health")),
+        ("GET /v1/time-series/{id}", lambda s: s.get(f"{base_url}/v1/time-series/{SERIES_ID}", headers=headers)),
+        ("POST /v1/calculations", lambda s: s.post(f"{base_url}/v1/calculations", headers=headers, json=calculation)),
+    ]
+
+    latencies: Dict[str, List[float]] = {name: [] for name, _ in requests_mix}
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(offset: int) -> None:
+        session = requests.Session()
+        local: Dict[str, List[float]] = {name: [] for name, _ in requests_mix}
+        local_errors = 0
+        i = offset
+        while time.monotonic() < deadline:
+            name, call = requests_mix[i % len(requests_mix)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                ok = call(session).status_code < 400
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            if ok:
+                local[name].append(elapsed)
+            else:
+                local_errors += 1
+        with lock:
+            for name, values in local.items():
+                latencies[name].extend(values)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total = sum(len(values) for values in latencies.values())
+    endpoints = {}
+    for name, values in latencies.items():
+        values.sort()
+        endpoints[name] = {
+            "requests": len(values),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        }
+
+    return {
+        "requests": total,
+        "errors": errors[0],
+        "requests_per_second": round(total / elapsed, 1),
+        "endpoints": endpoints,
+    }
+
+
+def benchmark_mode(mode: Optional[str], url: Optional[str], port: int, duration: float, concurrency: int) -> Dict[str, Any]:
+    base_url = url or f"http://127.0.0.1:{port}"
+    process = start_server(mode, port) if mode else None
+    try:
+        wait_for_health(base_url)
+        token = prepare_data(base_url)
+        result = run_load(base_url, token, duration, concurrency)
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=30)
+    return {"mode": mode or base_url, "duration_s": duration, "concurrency": concurrency, **result}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare API throughput across serving modes")
+    parser.add_argument("--modes", nargs="+", choices=sorted(SERVER_COMMANDS), default=["dev", "gunicorn"])
+    parser.add_argument("--url", help="Benchmark an already running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per mode")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent keep-alive clients")
+    args = parser.parse_args()
+
+    if args.url:
+        results = [benchmark_mode(None, args.url, args.port, args.duration, args.concurrency)]
+    else:
+        results = [benchmark_mode(mode, None, args.port, args.duration, args.concurrency) for mode in args.modes]
+
+    print(json.dumps({"benchmark": "serving", "results": results}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: EUPL-1.2
+"""
+Engine and API Benchmark Suite
+
+Reproducible in-process benchmarks of the formula engine, validation, time
+series storage and the Flask endpoints. Results are emitted as JSON; pass a
+previous result file as --baseline to flag regressions between versions.
+
+Groups:
+    engine      calculate_time_slice across formula depth/width and interval counts,
+                with all-good and with substitute/missing input qualities
+    validation  validate_formula_location on large FormulaLocations
+    storage     series ingest, metering appends and reads (rollups, downsampling)
+    persistence state snapshots (cold and incremental), restore and WAL appends
+    api         end-to-end request latency through the Flask test client, and a
+                small client's calculation latency while another floods the queue
+
+Usage:
+    python benchmarks/bench_suite.py                                 # quick profile
+    python benchmarks/bench_suite.py --profile full --output results.json
+    python benchmarks/bench_suite.py --groups engine --baseline results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# One client drives all requests; measure latency, not the per-client rate limit
+os.environ.setdefault("RATE_LIMIT_RATE", "0")
+
+import mock_api_server as server  # noqa: E402
+import timeseries_codec  # noqa: E402
+
+MALO_ID = "12345678901"
+BASE_EPOCH = 1704067200  # 2024-01-01T00:00:00Z
+
+PROFILES = {
+    "quick": {
+        "repeats": 5,
+        "engine_depths": [1, 8, 32],
+        "engine_widths": [1, 8],
+        "engine_intervals": [96, 35040],
+        "interpreter_intervals": [96],
+        "validation_time_slices": [1, 10, 100],
+        "storage_intervals": 35040,
+        "persistence_series": 8,
+        "api_requests": 200,
+    },
+    "full": {
+        "repeats": 3,
+        "engine_depths": [1, 8, 32],
+        "engine_widths": [1, 8, 32],
+        "engine_intervals": [96, 35040, 140160],
+        "interpreter_intervals": [96, 35040],
+        "validation_time_slices": [1, 10, 100, 1000],
+        "storage_intervals": 140160,
+        "persistence_series": 64,
+        "api_requests": 1000,
+    },
+}
+
+# Depth beyond VECTORIZED_MAX_DEPTH exercises the per-interval interpreter
+INTERPRETER_DEPTH = server.VECTORIZED_MAX_DEPTH + 8
+
+
+# =============================================================================
+# Fixtures
+# =============================================================================
+
+def melo_id(index: int) -> str:
+    return f"DE{index:011d}" + "0" * 20
+
+
+def melo_operand(index: int) -> Dict[str, Any]:
+    return {"meloOperand": {
+        "meloId": melo_id(index),
+        "energyDirection": "consumption",
+        "lossFactorTransformer": {"percentvalue": 0.02},
+        "lossFactorConduction": {"percentvalue": 0.01},
+        "distributionFactorEnergyQuantity": {"percentvalue": 0.95},
+    }}
+
+
+def make_formula(depth: int, width: int) -> Dict[str, Any]:
+    """Formula nested `depth` levels deep over `width` distinct meloOperands"""
+    formula: Dict[str, Any] = {"add": [melo_operand(i) for i in range(width)]}
+    for level in range(1, depth):
+        kind = level % 3
+        if kind == 0:
+            formula = {"add": [{"calculationFormula": formula}, melo_operand(level % width)]}
+        elif kind == 1:
+            formula = {"mul": [{"calculationFormula": formula}, {"const": "1.0001"}]}
+        else:
+            formula = {"sub": {"minuend": {"calculationFormula": formula}, "subtrahend": {"const": "0.5"}}}
+    return formula
+
+
+def make_intervals(count: int, start: int = BASE_EPOCH) -> List[Dict[str, Any]]:
+    intervals = []
+    for i in range(count):
+        begin = start + 900 * i
+        intervals.append({
+            "position": i + 1,
+            "start": timeseries_codec.format_timestamp(begin),
+            "end": timeseries_codec.format_timestamp(begin + 900),
+            "quantity": f"{100 + i % 10:.3f}",
+            "quality": "VALIDATED",
+        })
+    return intervals
+
+
+def make_time_slice(time_slice_id: int, formula: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "timeSliceId": time_slice_id,
+        "timeSliceQuality": "Gültige Daten",
+        "periodOfUseFrom": "2024-01-01T00:00:00Z",
+        "periodOfUseTo": "2024-12-31T23:59:59Z",
+        "calculationFormula": formula,
+    }
+
+
+def make_series(ts_id: str, intervals: List[Dict[str, Any]], melo: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "timeSeriesId": ts_id, "marketLocationId": MALO_ID, "meterLocationId": melo or melo_id(0),
+        "measurementType": "CONSUMPTION", "unit": "KWH", "resolution": "PT15M",
+        "period": {"start": intervals[0]["start"], "end": intervals[-1]["end"]},
+        "intervals": intervals,
+    }
+
+
+def edi_headers() -> Dict[str, str]:
+    return {
+        "transactionId": str(uuid.uuid4()),
+        "creationDateTime": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+    }
+
+
+# =============================================================================
+# Measurement
+# =============================================================================
+
+def measure(fn: Callable[[], Any], repeats: int) -> Dict[str, float]:
+    """Run fn `repeats` times, return min/median/mean wall time in seconds"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return {
+        "min_s": round(min(timings), 6),
+        "median_s": round(statistics.median(timings), 6),
+        "mean_s": round(statistics.fmean(timings), 6),
+    }
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def result(group: str, name: str, params: Dict[str, Any], metrics: Dict[str, Any]) -> Dict[str, Any]:
+    return {"group": group, "name": name, "params": params, **metrics}
+
+
+# =============================================================================
+# Groups
+# =============================================================================
+
+def bench_engine(profile: Dict[str, Any]) -> List[Dict[str, Any]]:
+    results = []
+    cases = [(d, w, n, False) for n in profile["engine_intervals"]
+             for d in profile["engine_depths"] for w in profile["engine_widths"]]
+    cases += [(INTERPRETER_DEPTH, 1, n, False) for n in profile["interpreter_intervals"]]
+    cases += [(8, 8, n, True) for n in profile["engine_intervals"]]
+
+    for depth, width, count, degraded in cases:
+        formula = make_formula(depth, width)
+        intervals = make_intervals(count)
+        input_data = {melo_id(i): intervals for i in range(width)}
+        if degraded:
+            # Every 50th value of one input substituted, the last hour of another missing
+            substituted = [dict(interval, quality="SUBSTITUTE") if i % 50 == 0 else interval
+                           for i, interval in enumerate(intervals)]
+            input_data[melo_id(0)] = substituted
+            input_data[melo_id(width - 1)] = intervals[:-4]
+        time_slice = make_time_slice(1, formula)
+
+        compile_timing = measure(lambda: server.CompiledFormula(formula, server.formula_hash(formula)), 1)
+        compiled = server.get_compiled_formula(formula)
+        server.calculate_time_slice(time_slice, input_data)  # warm
+
+        timing = measure(lambda: server.calculate_time_slice(time_slice, input_data), profile["repeats"])
+        results.append(result(
+            "engine", f"calculate_time_slice depth={depth} width={width} intervals={count}"
+                      + (" degraded_quality" if degraded else ""),
+            {"depth": depth, "width": width, "intervals": count, "nodes": compiled.node_count,
+             "vectorized": compiled.vectorized, "degraded_quality": degraded},
+            {**timing, "compile_s": compile_timing["min_s"],
+             "intervals_per_s": round(count / timing["median_s"]) if timing["median_s"] else None},
+        ))
+    return results
+
+
+def bench_validation(profile: Dict[str, Any]) -> List[Dict[str, Any]]:
+    results = []
+    formula = make_formula(8, 32)
+    for slices in profile["validation_time_slices"]:
+        location = {"maloId": MALO_ID,
+                    "calculationFormulaTimeSlices": [make_time_slice(i + 1, formula) for i in range(slices)]}
+        errors = server.validate_formula_location(location)
+        if errors:
+            raise RuntimeError(f"Benchmark FormulaLocation is invalid: {errors[:3]}")
+
+        timing = measure(lambda: server.validate_formula_location(location), profile["repeats"])
+        results.append(result(
+            "validation", f"validate_formula_location time_slices={slices}",
+            {"time_slices": slices, "payload_bytes": len(json.dumps(location))},
+            timing,
+        ))
+    return results
+
+
+def bench_storage(profile: Dict[str, Any]) -> List[Dict[str, Any]]:
+    results = []
+    count = profile["storage_intervals"]
+    intervals = make_intervals(count)
+    series = make_series("TS-BENCH-STORE", intervals)
+
+    timing = measure(lambda: server.store_time_series([series]), profile["repeats"])
+    results.append(result("storage", f"store_time_series intervals={count}", {"intervals": count},
+                          {**timing, "intervals_per_s": round(count / timing["median_s"])}))
+
+    timing = measure(lambda: server.read_time_series("TS-BENCH-STORE"), profile["repeats"])
+    results.append(result("storage", "read_time_series", {"intervals": count}, timing))
+
+    for name, params in [("rollup P1D sum", {"resolution": "P1D"}),
+                         ("rollup PT1H max", {"resolution": "PT1H", "aggregate": "max"}),
+                         ("downsample 500", {"downsample": "500"})]:
+        ts = server.read_time_series("TS-BENCH-STORE")
+        timing = measure(lambda: server.time_series_view("TS-BENCH-STORE", ts, params), profile["repeats"])
+        results.append(result("storage", f"time_series_view {name}", {"intervals": count, **params}, timing))
+
+    timing = measure(lambda: server.timeseries_codec.encode_time_series([series]), profile["repeats"])
+    results.append(result("storage", "encode_time_series (packed)", {"intervals": count}, timing))
+
+    # Metering appends: one day (96 values) per submission, in order
+    days = count // 96
+    submissions = []
+    for day in range(days):
+        submissions.append({
+            "messageId": f"MSG-{day}", "measurementDate": "2024-01-01T00:00:00Z",
+            "values": [{"timestamp": interval["start"], "value": interval["quantity"], "unit": "KWH"}
+                       for interval in intervals[day * 96:(day + 1) * 96]],
+        })
+
+    def append_all() -> None:
+        metering_point = f"MP-BENCH-{uuid.uuid4().hex[:8]}"
+        for submission in submissions:
+            server.submit_metering_values(metering_point, submission)
+        server.flush_meter_writers()
+
+    timing = measure(append_all, profile["repeats"])
+    results.append(result("storage", f"submit_metering_values days={days}", {"values": days * 96},
+                          {**timing, "values_per_s": round(days * 96 / timing["median_s"])}))
+    return results
+
+
+def bench_persistence(profile: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Snapshot and restore of `persistence_series` year-long PT15M series (35040 intervals each)"""
+    results = []
+    intervals = make_intervals(35040)
+    ts_ids = [f"TS-BENCH-PERSIST-{i}" for i in range(profile["persistence_series"])]
+    for i, ts_id in enumerate(ts_ids):
+        server.store_time_series([make_series(ts_id, intervals, melo_id(i))])
+    total = len(ts_ids) * len(intervals)
+    params = {"series": len(ts_ids), "intervals": total}
+
+    def collect() -> Dict[str, Dict[str, Any]]:
+        return {"timeSeries": {ts_id: server.time_series_store.get(ts_id) for ts_id in ts_ids}}
+
+    with tempfile.TemporaryDirectory() as directory:
+        def snapshot_cold() -> None:
+            persistence = server.snapshots.StatePersistence(directory)
+            persistence.restore(lambda store, key, value: None)
+            persistence.snapshot(collect)
+            persistence.close()
+
+        timing = measure(snapshot_cold, profile["repeats"])
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        results.append(result("persistence", "snapshot (cold)", params,
+                              {**timing, "intervals_per_s": round(total / timing["median_s"]), "bytes": size}))
+
+        # Incremental: only the series written since the previous snapshot are encoded
+        persistence = server.snapshots.StatePersistence(directory)
+        persistence.restore(lambda store, key, value: None)
+
+        def snapshot_incremental() -> None:
+            server.store_time_series([make_series(ts_ids[0], intervals, melo_id(0))])
+            persistence.snapshot(collect)
+
+        timing = measure(snapshot_incremental, profile["repeats"])
+        results.append(result("persistence", "snapshot (1 series changed)", params, timing))
+
+        record = {"calculationId": "CALC-BENCH", "status": "COMPLETED", "acceptedAt": "2024-01-01T00:00:00Z",
+                  "outputTimeSeriesId": "TS-BENCH-OUT", "intervalsCalculated": 96}
+        entries = 10000
+        timing = measure(lambda: [persistence.log("calculations", f"CALC-{i}", record) for i in range(entries)],
+                         profile["repeats"])
+        results.append(result("persistence", "WAL append (calculation record)", {"entries": entries},
+                              {**timing, "entries_per_s": round(entries / timing["median_s"])}))
+        persistence.snapshot(collect)
+        persistence.close()
+
+        def restore(apply: Callable[[str, str, Any], None]) -> None:
+            restored = server.snapshots.StatePersistence(directory)
+            restored.restore(apply)
+            restored.close()
+
+        timing = measure(lambda: restore(lambda store, key, value: None), profile["repeats"])
+        results.append(result("persistence", "restore (decode)", params,
+                              {**timing, "intervals_per_s": round(total / timing["median_s"])}))
+        # Including the rebuild of derived state (location index, rollups) through the listeners
+        timing = measure(lambda: restore(server.apply_restored_record), profile["repeats"])
+        results.append(result("persistence", "restore (decode + derived state)", params,
+                              {**timing, "intervals_per_s": round(total / timing["median_s"])}))
+    return results
+
+
+def bench_api(profile: Dict[str, Any]) -> List[Dict[str, Any]]:
+    client = server.app.test_client()
+    token = client.post("/oauth/token", data={
+        "grant_type": "client_credentials", "client_id": "bench", "client_secret": "bench",
+    }).get_json()["access_token"]
+    auth = {"Authorization": f"Bearer {token}"}
+
+    formula_location = {"maloId": MALO_ID, "calculationFormulaTimeSlices": [make_time_slice(1, make_formula(4, 4))]}
+    day = make_intervals(96)
+    year = make_intervals(35040)
+    client.post("/formula/v0.0.1", json=formula_location, headers=edi_headers())
+    client.post("/v1/time-series", headers=auth, json={"timeSeries": [
+        make_series("TS-BENCH-DAY", day), make_series("TS-BENCH-YEAR", year)]})
+    calculation = {"maloId": MALO_ID, "timeSliceId": 1,
+                   "inputTimeSeries": {melo_id(i): "TS-BENCH-DAY" for i in range(4)},
+                   "outputTimeSeriesId": "TS-BENCH-OUT"}
+
+    requests_to_time = [
+        ("GET /health", lambda: client.get("/health")),
+        ("POST /formula/v0.0.1", lambda: client.post("/formula/v0.0.1", json=formula_location, headers=edi_headers())),
+        ("POST /v1/time-series (96 intervals)",
+         lambda: client.post("/v1/time-series", headers=auth, json={"timeSeries": [make_series("TS-BENCH-POST", day)]})),
+        ("GET /v1/time-series/{id} (96 intervals)", lambda: client.get("/v1/time-series/TS-BENCH-DAY", headers=auth)),
+        ("GET /v1/time-series/{id}?resolution=P1D (35040 intervals)",
+         lambda: client.get("/v1/time-series/TS-BENCH-YEAR?resolution=P1D", headers=auth)),
+        ("GET /v1/time-series/{id}?downsample=500 (35040 intervals)",
+         lambda: client.get("/v1/time-series/TS-BENCH-YEAR?downsample=500", headers=auth)),
+        ("POST /v1/calculations (cached)", lambda: client.post("/v1/calculations", headers=auth, json=calculation)),
+        ("POST /v1/calculations (uncached)",
+         lambda: client.post("/v1/calculations", headers=auth,
+                             json={**calculation, "outputTimeSeriesId": f"TS-BENCH-{uuid.uuid4().hex[:8]}"})),
+    ]
+
+    results = []
+    for name, call in requests_to_time:
+        if call().status_code >= 400:
+            raise RuntimeError(f"{name} failed during warmup")
+        latencies = []
+        for _ in range(profile["api_requests"]):
+            started = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        results.append(result("api", name, {"requests": len(latencies)}, {
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            "requests_per_s": round(len(latencies) / sum(latencies), 1),
+        }))
+    results.append(bench_fair_share(client, auth, calculation, profile["api_requests"] // 4))
+    return results
+
+
+def bench_fair_share(client: Any, auth: Dict[str, str], calculation: Dict[str, Any],
+                     requests_count: int, flooding_threads: int = 8) -> Dict[str, Any]:
+    """Latency of one client's small calculations while another client floods year-long ones"""
+    heavy_token = client.post("/oauth/token", data={
+        "grant_type": "client_credentials", "client_id": "bench-heavy", "client_secret": "bench",
+    }).get_json()["access_token"]
+    heavy_auth = {"Authorization": f"Bearer {heavy_token}"}
+    heavy_calculation = {**calculation, "inputTimeSeries": {melo_id(i): "TS-BENCH-YEAR" for i in range(4)}}
+    stop = threading.Event()
+    completed = [0] * flooding_threads
+
+    def flood(slot: int) -> None:
+        heavy_client = server.app.test_client()
+        while not stop.is_set():
+            heavy_client.post("/v1/calculations", headers=heavy_auth,
+                              json={**heavy_calculation, "outputTimeSeriesId": f"TS-BENCH-{uuid.uuid4().hex[:8]}"})
+            completed[slot] += 1
+
+    threads = [threading.Thread(target=flood, args=(slot,)) for slot in range(flooding_threads)]
+    for thread in threads:
+        thread.start()
+    try:
+        latencies = []
+        for _ in range(requests_count):
+            started = time.perf_counter()
+            client.post("/v1/calculations", headers=auth,
+                        json={**calculation, "outputTimeSeriesId": f"TS-BENCH-{uuid.uuid4().hex[:8]}"})
+            latencies.append(time.perf_counter() - started)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    latencies.sort()
+    return result("api", "POST /v1/calculations (small client, flooded queue)", {
+        "requests": len(latencies), "flooding_threads": flooding_threads,
+        "calculation_concurrency": server.scheduling.CALCULATION_CONCURRENCY,
+    }, {
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "flood_completed": sum(completed),
+    })
+
+
+GROUPS = {
+    "engine": bench_engine,
+    "validation": bench_validation,
+    "storage": bench_storage,
+    "persistence": bench_persistence,
+    "api": bench_api,
+}
+
+
+# =============================================================================
+# Baseline Comparison
+# =============================================================================
+
+def primary_metric(entry: Dict[str, Any]) -> Optional[float]:
+    return entry.get("min_s", entry.get("p50_ms"))
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, threshold: float) -> Dict[str, Any]:
+    """Compare min time (p50 for API latency) against a previous run; ratio > threshold is a regression"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {entry["name"]: entry for entry in json.load(f)["results"]}
+
+    changes = []
+    for entry in results:
+        previous = baseline.get(entry["name"])
+        if previous is None or not primary_metric(previous):
+            continue
+        ratio = primary_metric(entry) / primary_metric(previous)
+        changes.append({"name": entry["name"], "baseline": primary_metric(previous),
+                        "current": primary_metric(entry), "ratio": round(ratio, 3),
+                        "regression": ratio > threshold})
+
+    return {"baseline": baseline_path, "threshold": threshold,
+            "regressions": sum(1 for change in changes if change["regression"]), "changes": changes}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the formula engine and API in-process")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--groups", nargs="+", choices=list(GROUPS), default=list(GROUPS))
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="Previous JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Slowdown ratio reported as regression (default: 1.2)")
+    args = parser.parse_args()
+
+    profile = PROFILES[args.profile]
+    results = []
+    for group in args.groups:
+        print(f"Running {group} benchmarks...", file=sys.stderr)
+        results.extend(GROUPS[group](profile))
+
+    report: Dict[str, Any] = {
+        "benchmark": "suite",
+        "profile": args.profile,
+        "timestamp": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.baseline:
+        report["comparison"] = compare(results, args.baseline, args.threshold)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline and report["comparison"]["regressions"]:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: EUPL-1.2
+"""
+Bulk FormulaLocation Loader
+
+Loads FormulaLocations from an NDJSON file into POST /formulas/bulk.
+
+Each input line is either a record envelope
+    {"transactionId": ..., "creationDateTime": ..., "formulaLocation": {...}}
+or a bare FormulaLocation. Bare FormulaLocations get a transactionId derived
+from their content (UUID v5), so re-running the same file is idempotent.
+
+Records are validated locally first (formula_validation); invalid records
+are reported without being uploaded. Batches are sent concurrently over the
+pooled FormulaApiClient session (token refresh included). Per-record
+results are written as NDJSON (line numbers refer to the input file).
+
+Usage:
+    python bulk_import.py formulas.ndjson
+    python bulk_import.py formulas.ndjson --batch-size 1000 --workers 8 --results results.ndjson
+"""
+
+import argparse
+import json
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+
+from formula_api_client import BASE_URL, FormulaApiClient, get_timestamp
+from formula_validation import check_formula_record, validate_formula_location
+
+# Namespace for content-derived transactionIds of bare FormulaLocations
+TRANSACTION_NAMESPACE = uuid.UUID("6f1c1f0e-5d8b-4a8e-9a43-3c0c7d4f0b21")
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def to_record(entry: Dict[str, Any], creation_datetime: str) -> Dict[str, Any]:
+    """Wrap a bare FormulaLocation in a record envelope (envelopes pass through)"""
+    if "formulaLocation" in entry:
+        return entry
+
+    canonical = json.dumps(entry, sort_keys=True, separators=(',', ':'))
+    return {
+        "transactionId": str(uuid.uuid5(TRANSACTION_NAMESPACE, canonical)),
+        "creationDateTime": creation_datetime,
+        "formulaLocation": entry,
+    }
+
+
+def check_record(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Validate a record envelope and its FormulaLocation locally, returns the rejection or None"""
+    rejection, headers = check_formula_record(record)
+    if rejection:
+        return rejection
+
+    validation_errors = validate_formula_location(record["formulaLocation"])
+    if validation_errors:
+        return {
+            "status": "rejected",
+            "statusCode": 400,
+            "transactionId": headers["transactionId"],
+            "message": "Validation failed",
+            "validationErrors": validation_errors,
+        }
+    return None
+
+
+def read_records(path: str, validate: bool = True) -> Tuple[List[Tuple[int, str]], List[Dict[str, Any]]]:
+    """
+    Read an NDJSON file
+
+    With validate, records failing local validation are returned as errors
+    (in the server's result format) instead of being queued for upload.
+
+    Returns:
+        (records, errors) where records are (input line number, serialized record)
+    """
+    creation_datetime = get_timestamp()
+    records = []
+    errors = []
+
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                errors.append({"line": line_no, "status": "rejected", "message": f"Invalid JSON: {e}"})
+                continue
+            if not isinstance(entry, dict):
+                errors.append({"line": line_no, "status": "rejected", "message": "Record must be a JSON object"})
+                continue
+            record = to_record(entry, creation_datetime)
+            rejection = check_record(record) if validate else None
+            if rejection:
+                errors.append({"line": line_no, **rejection})
+                continue
+            records.append((line_no, json.dumps(record, ensure_ascii=False)))
+
+    return records, errors
+
+
+def submit_batch(client: FormulaApiClient, batch: List[Tuple[int, str]]) -> List[Dict[str, Any]]:
+    """Submit one batch and map server line numbers back to input line numbers"""
+    body = "\n".join(record for _, record in batch).encode("utf-8")
+    response = client.post(
+        "/formulas/bulk",
+        headers={"Content-Type": NDJSON_MEDIA_TYPE},
+        data=body
+    )
+
+    if response.status_code != 200:
+        return [
+            {"line": line_no, "status": "rejected", "statusCode": response.status_code, "message": response.text}
+            for line_no, _ in batch
+        ]
+
+    results = response.json()["results"]
+    for result in results:
+        result["line"] = batch[result["line"] - 1][0]
+    return results
+
+
+def run_import(path: str, batch_size: int, workers: int, client_id: str, client_secret: str,
+               validate: bool = True) -> List[Dict[str, Any]]:
+    """Import all records from an NDJSON file, returns per-record results ordered by line"""
+    records, results = read_records(path, validate)
+    batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+
+    with FormulaApiClient(BASE_URL, client_id, client_secret, scope="formula.write", pool_size=workers) as client:
+        client.token()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch_results in executor.map(lambda batch: submit_batch(client, batch), batches):
+                results.extend(batch_results)
+
+    results.sort(key=lambda r: r["line"])
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Bulk import FormulaLocations from an NDJSON file")
+    parser.add_argument("path", help="NDJSON file with one FormulaLocation or record envelope per line")
+    parser.add_argument("--batch-size", type=int, default=500, help="Records per request (default: 500)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent requests (default: 4)")
+    parser.add_argument("--results", help="Write per-record results as NDJSON to this file")
+    parser.add_argument("--no-validate", action="store_true",
+                        help="Upload records without validating them locally first")
+    parser.add_argument("--client-id", default="bulk-import")
+    parser.add_argument("--client-secret", default="bulk-import-secret")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    results = run_import(args.path, args.batch_size, args.workers, args.client_id, args.client_secret,
+                         validate=not args.no_validate)
+    elapsed = time.perf_counter() - started
+
+    if args.results:
+        with open(args.results, "w", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    counts = {"accepted": 0, "rejected": 0, "duplicate": 0}
+    for result in results:
+        counts[result["status"]] += 1
+        if result["status"] == "rejected" and not args.results:
+            print(f"line {result['line']}: {result.get('message')} {result.get('validationErrors', '')}", file=sys.stderr)
+
+    rate = len(results) / elapsed if elapsed > 0 else 0.0
+    print(f"Imported {len(results)} records in {elapsed:.2f}s ({rate:.0f} records/s): "
+          f"{counts['accepted']} accepted, {counts['duplicate']} duplicate, {counts['rejected']} rejected")
+
+    return 1 if counts["rejected"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
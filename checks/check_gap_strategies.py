@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: EUPL-1.2
+"""
+Gap Strategy Check
+
+Runs calculations through the API over an input series with gaps at the
+start, in the middle and at the end of the period, and compares the output
+values, qualities and timestamps with the values each gapStrategy must give:
+
+    fail          422 with the gap report, nothing stored
+    zero          0.0, quality MISSING
+    linear        interpolated between the neighbours, SUBSTITUTE; the
+                  nearest value at the start and end
+    carryForward  last value before the gap, SUBSTITUTE; the first value
+                  at the start
+
+Inputs that are empty or not found must be missing throughout (422 under
+fail, 0.0 MISSING otherwise), and rejected with 400 when no period gives
+the timeline.
+
+Exits 1 if any result differs.
+
+Usage:
+    python checks/check_gap_strategies.py
+"""
+
+import os
+import sys
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+os.environ.pop("STATE_DIR", None)
+os.environ.setdefault("RATE_LIMIT_RATE", "0")
+
+import mock_api_server as server  # noqa: E402
+import timeseries_codec  # noqa: E402
+
+BASE_EPOCH = 1704067200  # 2024-01-01T00:00:00Z
+STEP = 900
+SLOTS = 8
+MALO_ID = "12345678901"
+MELO_ID = "DE00014545768S0000000000000003054"
+PERIOD = {"start": timeseries_codec.format_timestamp(BASE_EPOCH),
+          "end": timeseries_codec.format_timestamp(BASE_EPOCH + SLOTS * STEP)}
+GOOD = "Gültige Daten"
+
+# Input values per slot, None where the interval is missing
+INPUT = [None, 10.0, None, None, 40.0, 50.0, None, None]
+EXPECTED = {
+    "zero": ([0.0, 10.0, 0.0, 0.0, 40.0, 50.0, 0.0, 0.0],
+             ["MISSING", GOOD, "MISSING", "MISSING", GOOD, GOOD, "MISSING", "MISSING"]),
+    "linear": ([10.0, 10.0, 20.0, 30.0, 40.0, 50.0, 50.0, 50.0],
+               ["SUBSTITUTE", GOOD, "SUBSTITUTE", "SUBSTITUTE", GOOD, GOOD, "SUBSTITUTE", "SUBSTITUTE"]),
+    "carryForward": ([10.0, 10.0, 10.0, 10.0, 40.0, 50.0, 50.0, 50.0],
+                     ["SUBSTITUTE", GOOD, "SUBSTITUTE", "SUBSTITUTE", GOOD, GOOD, "SUBSTITUTE", "SUBSTITUTE"]),
+}
+EXPECTED_GAPS = [(0, 1), (2, 4), (6, 8)]
+
+
+def edi_headers() -> Dict[str, str]:
+    return {"transactionId": str(uuid.uuid4()),
+            "creationDateTime": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")}
+
+
+def interval(slot: int, value: float) -> Dict[str, Any]:
+    return {"position": slot + 1, "start": timeseries_codec.format_timestamp(BASE_EPOCH + slot * STEP),
+            "end": timeseries_codec.format_timestamp(BASE_EPOCH + (slot + 1) * STEP),
+            "quantity": f"{value:.3f}", "quality": "VALIDATED"}
+
+
+def series(ts_id: str, values: List[Optional[float]]) -> Dict[str, Any]:
+    return {"timeSeriesId": ts_id, "marketLocationId": MALO_ID, "meterLocationId": MELO_ID,
+            "measurementType": "CONSUMPTION", "unit": "KWH", "resolution": "PT15M",
+            "intervals": [interval(slot, value) for slot, value in enumerate(values) if value is not None]}
+
+
+class Check:
+    def __init__(self) -> None:
+        self.client = server.app.test_client()
+        token = self.client.post("/oauth/token", data={"grant_type": "client_credentials", "client_id": "check",
+                                                       "client_secret": "check"}).get_json()["access_token"]
+        self.auth = {"Authorization": f"Bearer {token}"}
+        self.failures: List[str] = []
+
+        # Output = input, so output values are the filled input values
+        response = self.client.post("/formula/v0.0.1", headers=edi_headers(), json={
+            "maloId": MALO_ID, "calculationFormulaTimeSlices": [{
+                "timeSliceId": 1, "timeSliceQuality": GOOD,
+                "periodOfUseFrom": "2024-01-01T00:00:00Z", "periodOfUseTo": "2024-12-31T23:59:59Z",
+                "calculationFormula": {"add": [
+                    {"meloOperand": {"meloId": MELO_ID, "energyDirection": "consumption",
+                                     "lossFactorTransformer": {"percentvalue": 0},
+                                     "lossFactorConduction": {"percentvalue": 0},
+                                     "distributionFactorEnergyQuantity": {"percentvalue": 1}}},
+                    {"const": "0"}]}}]})
+        if not self.expect("formula", response.status_code, 202):
+            raise SystemExit(f"formula rejected: {response.get_data(as_text=True)}")
+        self.expect("input series", self.client.post("/v1/time-series", headers=self.auth, json={"timeSeries": [
+            series("TS-GAPS", INPUT), series("TS-EMPTY", [])]}).status_code, 201)
+
+    def expect(self, what: str, actual: Any, expected: Any) -> bool:
+        if actual != expected:
+            self.failures.append(f"{what}: {actual!r} != {expected!r}")
+        return actual == expected
+
+    def calculate(self, ts_id: str, strategy: str, period: Optional[Dict[str, str]]) -> Any:
+        body = {"maloId": MALO_ID, "timeSliceId": 1, "inputTimeSeries": {MELO_ID: ts_id},
+                "outputTimeSeriesId": f"TS-OUT-{ts_id}-{strategy}-{period is not None}", "gapStrategy": strategy}
+        if period is not None:
+            body["period"] = period
+        return self.client.post("/v1/calculations", headers=self.auth, json=body)
+
+    def output(self, response: Any) -> List[Dict[str, Any]]:
+        ts_id = response.get_json()["outputTimeSeriesId"]
+        return self.client.get(f"/v1/time-series/{ts_id}", headers=self.auth).get_json()["intervals"]
+
+    def check_fail(self) -> None:
+        response = self.calculate("TS-GAPS", "fail", PERIOD)
+        if not self.expect("fail: status", response.status_code, 422):
+            return
+        gaps = response.get_json()["gaps"]
+        self.expect("fail: missing intervals", gaps["missingIntervals"], sum(end - first for first, end in EXPECTED_GAPS))
+        self.expect("fail: gap ranges", [
+            (gap["start"], gap["end"], gap["intervals"]) for gap in gaps["inputs"][MELO_ID]["gaps"]], [
+            (timeseries_codec.format_timestamp(BASE_EPOCH + first * STEP),
+             timeseries_codec.format_timestamp(BASE_EPOCH + end * STEP), end - first)
+            for first, end in EXPECTED_GAPS])
+
+    def check_filled(self, strategy: str) -> None:
+        values, qualities = EXPECTED[strategy]
+        response = self.calculate("TS-GAPS", strategy, PERIOD)
+        if not self.expect(f"{strategy}: status", response.status_code, 202):
+            return
+        self.expect(f"{strategy}: calculation status", response.get_json()["status"], "COMPLETED")
+        intervals = self.output(response)
+        self.expect(f"{strategy}: values", [float(i["quantity"]) for i in intervals], values)
+        self.expect(f"{strategy}: qualities", [i["quality"] for i in intervals], qualities)
+        self.expect(f"{strategy}: starts", [i["start"] for i in intervals],
+                    [interval(slot, 0)["start"] for slot in range(SLOTS)])
+
+    def check_no_input(self, ts_id: str) -> None:
+        for strategy in ("fail",) + tuple(EXPECTED):
+            self.expect(f"{ts_id} without period, {strategy}: status",
+                        self.calculate(ts_id, strategy, None).status_code, 400)
+        response = self.calculate(ts_id, "fail", PERIOD)
+        if self.expect(f"{ts_id}, fail: status", response.status_code, 422):
+            self.expect(f"{ts_id}, fail: missing intervals", response.get_json()["gaps"]["missingIntervals"], SLOTS)
+        for strategy in EXPECTED:
+            response = self.calculate(ts_id, strategy, PERIOD)
+            if self.expect(f"{ts_id}, {strategy}: status", response.status_code, 202):
+                intervals = self.output(response)
+                self.expect(f"{ts_id}, {strategy}: values", [float(i["quantity"]) for i in intervals], [0.0] * SLOTS)
+                self.expect(f"{ts_id}, {strategy}: qualities", [i["quality"] for i in intervals], ["MISSING"] * SLOTS)
+
+
+def main() -> int:
+    check = Check()
+    check.check_fail()
+    for strategy in EXPECTED:
+        check.check_filled(strategy)
+    check.check_no_input("TS-EMPTY")
+    check.check_no_input("TS-NOT-FOUND")
+
+    for failure in check.failures:
+        print(f"  {failure}", file=sys.stderr)
+    print(f"gap strategies: {'ok' if not check.failures else f'{len(check.failures)} differences'}")
+    return 1 if check.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
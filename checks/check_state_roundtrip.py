@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: EUPL-1.2
+"""
+State Snapshot and WAL Round-Trip Check
+
+Persistence must give back exactly what was stored: equal values and the
+same JSON text (key order, quantity strings, timestamps). Three levels:
+
+    codec    encode_value/decode_value of time series shapes the columnar
+             frame handles specially (regular and irregular timestamps,
+             quantity formats, missing or unknown qualities, extra interval
+             keys, mixed key order) and of plain JSON records
+    log      StatePersistence: writes before and after a snapshot,
+             overwrites, and a torn entry at the end of the WAL
+    server   the API server with STATE_DIR: formulas (versions), time
+             series, metering values and calculations are written through
+             the Flask test client, then a fresh process restores them
+
+Exits 1 on the first difference.
+
+Usage:
+    python checks/check_state_roundtrip.py
+"""
+
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import snapshots  # noqa: E402
+import timeseries_codec  # noqa: E402
+
+BASE_EPOCH = 1704067200  # 2024-01-01T00:00:00Z
+MALO_ID = "12345678901"
+MELO_ID = "DE00014545768S0000000000000003054"
+
+
+def timestamp(epoch: int) -> str:
+    return timeseries_codec.format_timestamp(epoch)
+
+
+def series(ts_id: str, intervals: List[Dict[str, Any]], **fields: Any) -> Dict[str, Any]:
+    return {"timeSeriesId": ts_id, "marketLocationId": MALO_ID, "measurementType": "CONSUMPTION",
+            "unit": "KWH", "resolution": "PT15M", **fields, "intervals": intervals, "version": 3}
+
+
+def regular(count: int, quantity=lambda i: f"{100 + i % 7:.3f}", quality=lambda i: "VALIDATED",
+            step: int = 900, start: int = BASE_EPOCH) -> List[Dict[str, Any]]:
+    return [{"position": i + 1, "start": timestamp(start + step * i), "end": timestamp(start + step * (i + 1)),
+             "quantity": quantity(i), "quality": quality(i)} for i in range(count)]
+
+
+def series_cases(rng: random.Random) -> Dict[str, Any]:
+    """Time series shapes the columnar frame encodes differently"""
+    cases: Dict[str, Any] = {
+        "empty": series("TS-EMPTY", []),
+        "regular": series("TS-REGULAR", regular(96)),
+        "hourly": series("TS-HOURLY", regular(48, step=3600), resolution="PT1H"),
+        "float quantities": series("TS-FLOAT", regular(50, quantity=lambda i: rng.uniform(-1e6, 1e6))),
+        "int quantities": series("TS-INT", regular(50, quantity=lambda i: i * 3)),
+        "mixed decimals": series("TS-DECIMALS", regular(50, quantity=lambda i: f"{i / 8:.{i % 4}f}")),
+        "exponent quantities": series("TS-EXP", regular(20, quantity=lambda i: f"{i}e3")),
+        "qualities": series("TS-QUALITY", regular(40, quality=lambda i: [
+            "VALIDATED", "ESTIMATED", "SUBSTITUTE", "FORECASTED", "MISSING", "METERED"][i % 6])),
+        "unknown quality": series("TS-UNKNOWN-QUALITY", regular(20, quality=lambda i: "Gültige Daten")),
+    }
+
+    irregular = regular(60)
+    for i, interval in enumerate(irregular):
+        shift = rng.choice([0, 0, 60, 900])
+        interval["start"] = timestamp(BASE_EPOCH + 1800 * i + shift)
+        interval["end"] = timestamp(BASE_EPOCH + 1800 * i + shift + 900)
+    cases["irregular timestamps"] = series("TS-IRREGULAR", irregular)
+
+    odd = regular(80)
+    del odd[10]["quality"]
+    odd[11]["quantity"] = None
+    odd[12]["note"] = "manually corrected"
+    odd[13] = {"start": odd[13]["start"], "quantity": odd[13]["quantity"], "position": 14,
+               "end": odd[13]["end"], "quality": "VALIDATED"}
+    odd[14]["start"] = "2024-01-01T03:30:00.000Z"
+    odd[15]["end"] = "2024-01-01T04:00:00+00:00"
+    odd[16]["position"] = 99
+    cases["verbatim intervals"] = series("TS-ODD", odd)
+
+    mostly_odd = regular(40)
+    for interval in mostly_odd[::2]:
+        interval["comment"] = "x"
+    cases["JSON fallback"] = series("TS-MOSTLY-ODD", mostly_odd)
+
+    cases["plain record"] = {"calculationId": "CALC-1", "status": "COMPLETED", "nested": {"b": [1, 2.5, None], "a": "ü"}}
+    return cases
+
+
+def same(restored: Any, original: Any) -> bool:
+    return restored == original and json.dumps(restored) == json.dumps(original)
+
+
+def check_codec() -> List[str]:
+    failures = []
+    for name, value in series_cases(random.Random(1)).items():
+        kind, payload = snapshots.encode_value(value)
+        restored = snapshots.decode_value(kind, memoryview(payload))
+        if not same(restored, value):
+            failures.append(f"codec: {name} (record kind {kind}) differs after decoding")
+    return failures
+
+
+def check_log() -> List[str]:
+    rng = random.Random(2)
+    cases = series_cases(rng)
+    expected: Dict[tuple, Any] = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        persistence = snapshots.StatePersistence(directory)
+        persistence.restore(lambda store, key, value: None)
+
+        def write(store: str, key: str, value: Any) -> None:
+            expected[(store, key)] = value
+            persistence.log(store, key, value)
+
+        def collect() -> Dict[str, Dict[str, Any]]:
+            stores: Dict[str, Dict[str, Any]] = {}
+            for (store, key), value in expected.items():
+                stores.setdefault(store, {})[key] = value
+            return stores
+
+        for name, value in cases.items():
+            write("timeSeries", name, value)
+        for i in range(200):
+            write("calculations", f"CALC-{i % 50}", {"calculationId": f"CALC-{i % 50}", "round": i})
+        persistence.snapshot(collect)
+        # After the snapshot: overwrites and new keys go to the next WAL segment only
+        for i in range(30):
+            write("calculations", f"CALC-{i}", {"calculationId": f"CALC-{i}", "round": 1000 + i})
+            write("transactions", f"TX-{i}", {"transactionId": f"TX-{i}", "status": "ACCEPTED"})
+        write("timeSeries", "regular", cases["irregular timestamps"])
+        persistence.close()
+
+        # A crash in the middle of a write leaves a torn entry at the end of the segment
+        segment = max(snapshots._numbered_files(directory, snapshots._SEGMENT_NAME))[1]
+        with open(segment, "ab") as f:
+            f.write(b"\x40\x00\x00\x00\x12\x34")
+
+        restored: Dict[tuple, Any] = {}
+        persistence = snapshots.StatePersistence(directory)
+        persistence.restore(lambda store, key, value: restored.__setitem__((store, key), value))
+        persistence.close()
+
+    failures = [f"log: {store}/{key} differs after restore" for (store, key), value in expected.items()
+                if not same(restored.get((store, key)), value)]
+    failures += [f"log: {store}/{key} restored but never written" for store, key in restored.keys() - expected.keys()]
+    return failures
+
+
+# =============================================================================
+# Server restart (runs in child processes with STATE_DIR set)
+# =============================================================================
+
+def edi_headers() -> Dict[str, str]:
+    return {"transactionId": str(uuid.uuid4()),
+            "creationDateTime": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")}
+
+
+def formula_location(constant: str) -> Dict[str, Any]:
+    return {"maloId": MALO_ID, "calculationFormulaTimeSlices": [{
+        "timeSliceId": 1, "timeSliceQuality": "Gültige Daten",
+        "periodOfUseFrom": "2024-01-01T00:00:00Z", "periodOfUseTo": "2024-12-31T23:59:59Z",
+        "calculationFormula": {"add": [
+            {"meloOperand": {"meloId": MELO_ID, "energyDirection": "consumption",
+                             "lossFactorTransformer": {"percentvalue": 0.02},
+                             "lossFactorConduction": {"percentvalue": 0.01},
+                             "distributionFactorEnergyQuantity": {"percentvalue": 0.95}}},
+            {"const": constant}]}}]}
+
+
+def server_write(server: Any) -> None:
+    client = server.app.test_client()
+    token = client.post("/oauth/token", data={"grant_type": "client_credentials", "client_id": "check",
+                                              "client_secret": "check"}).get_json()["access_token"]
+    auth = {"Authorization": f"Bearer {token}"}
+
+    def ok(response: Any) -> None:
+        if response.status_code >= 300:
+            raise RuntimeError(f"{response.status_code}: {response.get_data(as_text=True)}")
+
+    for constant in ("0", "1.5", "2"):
+        ok(client.post("/formula/v0.0.1", json=formula_location(constant), headers=edi_headers()))
+    cases = series_cases(random.Random(3))
+    ok(client.post("/v1/time-series", headers=auth, json={"timeSeries": [
+        value for value in cases.values() if "timeSeriesId" in value]}))
+    ok(client.post("/v1/time-series", headers=auth, json={"timeSeries": [
+        series("TS-INPUT", regular(96), meterLocationId=MELO_ID)]}))
+    for message in range(3):
+        ok(client.post(f"/v1/metering-points/{MELO_ID}/values", headers=auth, json={
+            "messageId": f"MSG-{message}", "measurementDate": timestamp(BASE_EPOCH + 86400),
+            "values": [{"timestamp": timestamp(BASE_EPOCH + 900 * (10 * message + i)), "value": f"{i}.250",
+                        "unit": "KWH", "quality": "METERED"} for i in range(10)]}))
+    ok(client.post("/v1/calculations", headers=auth, json={
+        "maloId": MALO_ID, "timeSliceId": 1, "inputTimeSeries": {MELO_ID: "TS-INPUT"},
+        "outputTimeSeriesId": "TS-OUTPUT", "calculationId": "CALC-CHECK"}))
+    # Part of the writes only in the snapshot, part only in the WAL
+    server.snapshot_state()
+    ok(client.post("/formula/v0.0.1", json=formula_location("3"), headers=edi_headers()))
+    ok(client.post("/v1/time-series", headers=auth, json={"timeSeries": [series("TS-REGULAR", regular(10))]}))
+
+
+def server_phase(phase: str, output: str) -> None:
+    os.environ.setdefault("RATE_LIMIT_RATE", "0")
+    import mock_api_server as server
+
+    server.restore_state()
+    if phase == "write":
+        server_write(server)
+    state = server.collect_state()
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(state, f, default=repr)
+    server.state.close()
+
+
+def check_server() -> List[str]:
+    with tempfile.TemporaryDirectory() as directory:
+        env = {**os.environ, "STATE_DIR": os.path.join(directory, "state")}
+        dumps = {}
+        for phase in ("write", "restore"):
+            output = os.path.join(directory, f"{phase}.json")
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--server-phase", phase, output],
+                           env=env, check=True)
+            with open(output, encoding="utf-8") as f:
+                dumps[phase] = json.load(f)
+
+    written, restored = dumps["write"], dumps["restore"]
+    failures = []
+    for store, records in written.items():
+        if not records:
+            failures.append(f"server: nothing was written to {store}")
+        for key, value in records.items():
+            if not same(restored.get(store, {}).get(key), value):
+                failures.append(f"server: {store}/{key} differs after restart")
+        for key in restored.get(store, {}).keys() - records.keys():
+            failures.append(f"server: {store}/{key} restored but never written")
+    return failures
+
+
+def main() -> int:
+    if len(sys.argv) == 4 and sys.argv[1] == "--server-phase":
+        server_phase(sys.argv[2], sys.argv[3])
+        return 0
+
+    failures = []
+    for name, check in (("codec", check_codec), ("log", check_log), ("server", check_server)):
+        found = check()
+        print(f"{name}: {'ok' if not found else f'{len(found)} differences'}")
+        failures += found
+    for failure in failures[:20]:
+        print(f"  {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: EUPL-1.2
+"""
+In-Memory Store Consistency Check
+
+Stress test for threaded serving: writer threads publish records through
+InMemoryStore.put/update and time series through put_time_series while
+reader threads read the same keys without locks. Every record carries
+redundant fields that only agree if the record was published whole, so a
+torn or half-written read shows up as a broken invariant:
+
+    store    n, twice == 2 * n and len(items) == n % 64; n never goes
+             backwards for one reader and one key
+    series   len(intervals) == checkCount == version; version never goes
+             backwards for one reader and one series
+
+Exits 1 if any invariant was violated.
+
+Usage:
+    python checks/check_store_consistency.py
+    python checks/check_store_consistency.py --writers 8 --readers 8 --iterations 200000
+"""
+
+import argparse
+import os
+import sys
+import threading
+from typing import Any, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Check the stores themselves, without journaling or rate limits
+os.environ.pop("STATE_DIR", None)
+os.environ.setdefault("RATE_LIMIT_RATE", "0")
+
+import mock_api_server as server  # noqa: E402
+import timeseries_codec  # noqa: E402
+
+KEYS = 8
+BASE_EPOCH = 1704067200  # 2024-01-01T00:00:00Z
+
+
+def store_record(n: int) -> Dict[str, Any]:
+    return {"n": n, "twice": 2 * n, "items": tuple(range(n % 64))}
+
+
+def store_violation(record: Dict[str, Any]) -> bool:
+    n = record["n"]
+    return record["twice"] != 2 * n or len(record["items"]) != n % 64
+
+
+def series_record(ts_id: str, count: int) -> Dict[str, Any]:
+    intervals = []
+    for i in range(count):
+        begin = BASE_EPOCH + 900 * i
+        intervals.append({
+            "position": i + 1,
+            "start": timeseries_codec.format_timestamp(begin),
+            "end": timeseries_codec.format_timestamp(begin + 900),
+            "quantity": "1.000",
+            "quality": "VALIDATED",
+        })
+    return {
+        "timeSeriesId": ts_id, "marketLocationId": "12345678901",
+        "measurementType": "CONSUMPTION", "unit": "KWH", "resolution": "PT15M",
+        "intervals": intervals, "checkCount": count,
+    }
+
+
+def check_store(writers: int, readers: int, iterations: int) -> Dict[str, int]:
+    """Copy-on-write put/update against lock-free get and snapshot readers"""
+    store = server.InMemoryStore()
+    for key in range(KEYS):
+        store.put(f"K{key}", store_record(0))
+
+    done = threading.Event()
+    violations: List[str] = []
+    reads = [0] * readers
+
+    def write(worker: int) -> None:
+        for i in range(iterations):
+            key = f"K{(worker + i) % KEYS}"
+            with store.lock(key):
+                n = store[key]["n"] + 1
+                if i % 2:
+                    store.put(key, store_record(n))
+                else:
+                    store.update(key, store_record(n))
+
+    def read(worker: int) -> None:
+        last = {f"K{key}": 0 for key in range(KEYS)}
+        while not done.is_set():
+            for key in last:
+                record = store.get(key)
+                if store_violation(record):
+                    violations.append(f"torn record {key}: {record['n']}/{record['twice']}")
+                elif record["n"] < last[key]:
+                    violations.append(f"{key} went back from {last[key]} to {record['n']}")
+                last[key] = record["n"]
+                reads[worker] += 1
+            for record in store.values():
+                if store_violation(record):
+                    violations.append(f"torn record in snapshot: {record['n']}/{record['twice']}")
+
+    run(write, read, writers, readers, done)
+    expected = writers * iterations
+    written = sum(store[f"K{key}"]["n"] for key in range(KEYS))
+    if written != expected:
+        violations.append(f"lost updates: {written} of {expected} increments stored")
+    report(violations)
+    return {"violations": len(violations), "reads": sum(reads), "writes": expected}
+
+
+def check_time_series(writers: int, readers: int, iterations: int) -> Dict[str, int]:
+    """put_time_series (with its listeners) against read_time_series readers"""
+    ts_ids = [f"TS-CHECK-STORE-{key}" for key in range(KEYS)]
+    for ts_id in ts_ids:
+        server.put_time_series(ts_id, series_record(ts_id, 1))
+
+    done = threading.Event()
+    violations: List[str] = []
+    reads = [0] * readers
+    # Series grow by one interval per write; keep them short
+    rounds = max(iterations // 100, 1)
+
+    def write(worker: int) -> None:
+        for i in range(rounds):
+            ts_id = ts_ids[(worker + i) % KEYS]
+            with server.time_series_store.lock(ts_id):
+                count = server.time_series_store[ts_id]["version"] + 1
+                server.put_time_series(ts_id, series_record(ts_id, count))
+
+    def read(worker: int) -> None:
+        last = dict.fromkeys(ts_ids, 0)
+        while not done.is_set():
+            for ts_id in ts_ids:
+                ts = server.read_time_series(ts_id)
+                version = ts["version"]
+                if not len(ts["intervals"]) == ts["checkCount"] == version:
+                    violations.append(f"torn series {ts_id}: {len(ts['intervals'])} intervals, "
+                                      f"checkCount {ts['checkCount']}, version {version}")
+                elif version < last[ts_id]:
+                    violations.append(f"{ts_id} went back from version {last[ts_id]} to {version}")
+                last[ts_id] = version
+                reads[worker] += 1
+
+    run(write, read, writers, readers, done)
+    expected = KEYS + writers * rounds
+    written = sum(server.time_series_store[ts_id]["version"] for ts_id in ts_ids)
+    if written != expected:
+        violations.append(f"lost versions: {written} of {expected} writes stored")
+    report(violations)
+    return {"violations": len(violations), "reads": sum(reads), "writes": writers * rounds}
+
+
+def run(write, read, writers: int, readers: int, done: threading.Event) -> None:
+    reader_threads = [threading.Thread(target=read, args=(i,)) for i in range(readers)]
+    writer_threads = [threading.Thread(target=write, args=(i,)) for i in range(writers)]
+    for thread in reader_threads + writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    done.set()
+    for thread in reader_threads:
+        thread.join()
+
+
+def report(violations: List[str]) -> None:
+    for violation in violations[:10]:
+        print(f"  {violation}", file=sys.stderr)
+    if len(violations) > 10:
+        print(f"  ... {len(violations) - 10} more", file=sys.stderr)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Stress the in-memory stores for torn reads")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=20000, help="Writes per writer thread")
+    args = parser.parse_args()
+
+    failed = False
+    for name, check in (("store", check_store), ("time series", check_time_series)):
+        outcome = check(args.writers, args.readers, args.iterations)
+        print(f"{name}: {outcome['writes']} writes, {outcome['reads']} reads, "
+              f"{outcome['violations']} violations")
+        failed = failed or outcome["violations"] > 0
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
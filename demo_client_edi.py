@@ -9,56 +9,32 @@ This demo client demonstrates:
 2. meloOperand structure with all loss factors
 3. calculationFormulaTimeSlice structure
 4. Operation-based formulas (add, sub, mul, div, pos)
+5. Packed binary time series transfer (application/vnd.energy-timeseries.packed)
+6. Concurrent submission and idempotent retries via FormulaApiClient
 
 Usage:
     python demo_client_edi.py
 """
 
-import requests
 import uuid
-import os
 from datetime import datetime, timezone, timedelta
-import json
 
-BASE_URL = os.environ.get("BASE_URL", "http://localhost:8000")
+import timeseries_codec
+from formula_api_client import BASE_URL, FormulaApiClient, generate_transaction_id, get_timestamp
 
 
-def get_timestamp() -> str:
-    """Get current UTC timestamp in ISO 8601 format"""
-    return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
-
-
-def generate_transaction_id() -> str:
-    """Generate UUID RFC4122 for transactionId"""
-    return str(uuid.uuid4())
-
-
-def get_oauth_token() -> str:
-    """Get OAuth2 access token"""
+def get_oauth_token(client: FormulaApiClient) -> str:
+    """Get OAuth2 access token (cached and refreshed by the client)"""
     print("\n" + "=" * 70)
     print("Step 1: Authenticate (OAuth2)")
     print("=" * 70)
 
-    response = requests.post(
-        f"{BASE_URL}/oauth/token",
-        data={
-            "grant_type": "client_credentials",
-            "client_id": "demo-client",
-            "client_secret": "demo-secret",
-            "scope": "formula.read formula.write timeseries.read timeseries.write"
-        }
-    )
-
-    if response.status_code == 200:
-        token = response.json()["access_token"]
-        print(f"[OK] Token obtained: {token[:20]}...")
-        return token
-    else:
-        print(f"[ERROR] Authentication failed: {response.text}")
-        raise Exception("Authentication failed")
+    token = client.token()
+    print(f"[OK] Token obtained: {token[:20]}...")
+    return token
 
 
-def submit_formula_edi_compliant(token: str) -> dict:
+def submit_formula_edi_compliant(client: FormulaApiClient) -> dict:
     """
     Submit an EDI@Energy compliant formula
 
@@ -72,20 +48,11 @@ def submit_formula_edi_compliant(token: str) -> dict:
     print("Step 2: Submit EDI@Energy Compliant Formula")
     print("=" * 70)
 
-    # Generate EDI@Energy compliant headers
+    # EDI@Energy compliant headers (creationDateTime is set by the client)
     transaction_id = generate_transaction_id()
-    creation_datetime = get_timestamp()
-
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}",
-        "transactionId": transaction_id,
-        "creationDateTime": creation_datetime,
-    }
 
     print(f"\nHeaders:")
     print(f"  transactionId: {transaction_id}")
-    print(f"  creationDateTime: {creation_datetime}")
 
     # EDI@Energy compliant FormulaLocation
     formula_location = {
@@ -179,11 +146,7 @@ def submit_formula_edi_compliant(token: str) -> dict:
         print(f"    - timeSliceId: {ts['timeSliceId']}, operation: {op_type}")
 
     # Submit to EDI@Energy endpoint
-    response = requests.post(
-        f"{BASE_URL}/formula/v0.0.1",
-        headers=headers,
-        json=formula_location
-    )
+    response = client.submit_formula(formula_location, transaction_id)
 
     print(f"\nResponse:")
     print(f"  Status: {response.status_code}")
@@ -200,17 +163,56 @@ def submit_formula_edi_compliant(token: str) -> dict:
         return response.json()
 
 
-def submit_time_series(token: str):
+def submit_formulas_concurrently(client: FormulaApiClient):
+    """Submit several FormulaLocations in parallel and retry one idempotently"""
+    print("\n" + "=" * 70)
+    print("Step 2b: Concurrent Submission and Idempotent Retry")
+    print("=" * 70)
+
+    formula_locations = [
+        {
+            "maloId": f"5000000000{i}",
+            "calculationFormulaTimeSlices": [
+                {
+                    "timeSliceId": 1,
+                    "timeSliceQuality": "Gültige Daten",
+                    "periodOfUseFrom": "2024-01-01T00:00:00Z",
+                    "periodOfUseTo": "2024-12-31T23:59:59Z",
+                    "calculationFormula": {"operand": {"const": f"{100 + i}"}}
+                }
+            ]
+        }
+        for i in range(8)
+    ]
+
+    responses = client.submit_formulas(formula_locations, workers=4)
+    accepted = sum(1 for response in responses if response.status_code == 202)
+    print(f"\n  Submitted {len(responses)} FormulaLocations over {client.pool_size} pooled connections")
+    print(f"  [OK] {accepted} accepted")
+
+    # A retry carries initialTransactionId; the server answers from its transaction store
+    first = responses[0].json()
+    retry = client.request(
+        "POST",
+        "/formula/v0.0.1",
+        headers={
+            "transactionId": generate_transaction_id(),
+            "creationDateTime": get_timestamp(),
+            "initialTransactionId": first["transactionId"],
+        },
+        json=formula_locations[0]
+    )
+    print(f"\n  Retry with initialTransactionId: {first['transactionId']}")
+    print(f"  Status: {retry.status_code}, transactionId: {retry.json().get('transactionId')} (original response)")
+    return responses
+
+
+def submit_time_series(client: FormulaApiClient):
     """Submit time series data for the meloIds used in formulas"""
     print("\n" + "=" * 70)
     print("Step 3: Submit Time Series Data")
     print("=" * 70)
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}",
-    }
-
     # Generate 96 intervals (24 hours * 4 per hour = 15-minute intervals)
     base_time = datetime(2024, 6, 1, 0, 0, 0, tzinfo=timezone.utc)
 
@@ -230,42 +232,36 @@ def submit_time_series(token: str):
             })
         return intervals
 
-    time_series = {
-        "timeSeries": [
-            {
-                "timeSeriesId": "TS-MELO-3054",
-                "marketLocationId": "12345678901",
-                "meterLocationId": "DE00014545768S0000000000000003054",
-                "measurementType": "CONSUMPTION",
-                "unit": "KWH",
-                "resolution": "PT15M",
-                "period": {
-                    "start": "2024-06-01T00:00:00Z",
-                    "end": "2024-06-02T00:00:00Z"
-                },
-                "intervals": generate_intervals(100.0)
+    time_series = [
+        {
+            "timeSeriesId": "TS-MELO-3054",
+            "marketLocationId": "12345678901",
+            "meterLocationId": "DE00014545768S0000000000000003054",
+            "measurementType": "CONSUMPTION",
+            "unit": "KWH",
+            "resolution": "PT15M",
+            "period": {
+                "start": "2024-06-01T00:00:00Z",
+                "end": "2024-06-02T00:00:00Z"
             },
-            {
-                "timeSeriesId": "TS-MELO-3055",
-                "marketLocationId": "12345678901",
-                "meterLocationId": "DE00014545768S0000000000000003055",
-                "measurementType": "CONSUMPTION",
-                "unit": "KWH",
-                "resolution": "PT15M",
-                "period": {
-                    "start": "2024-06-01T00:00:00Z",
-                    "end": "2024-06-02T00:00:00Z"
-                },
-                "intervals": generate_intervals(50.0, 5.0)
-            }
-        ]
-    }
+            "intervals": generate_intervals(100.0)
+        },
+        {
+            "timeSeriesId": "TS-MELO-3055",
+            "marketLocationId": "12345678901",
+            "meterLocationId": "DE00014545768S0000000000000003055",
+            "measurementType": "CONSUMPTION",
+            "unit": "KWH",
+            "resolution": "PT15M",
+            "period": {
+                "start": "2024-06-01T00:00:00Z",
+                "end": "2024-06-02T00:00:00Z"
+            },
+            "intervals": generate_intervals(50.0, 5.0)
+        }
+    ]
 
-    response = requests.post(
-        f"{BASE_URL}/v1/time-series",
-        headers=headers,
-        json=time_series
-    )
+    response = client.submit_time_series(time_series)
 
     print(f"\nResponse:")
     print(f"  Status: {response.status_code}")
@@ -280,17 +276,51 @@ def submit_time_series(token: str):
         return None
 
 
-def execute_calculation(token: str):
+def transfer_time_series_packed(client: FormulaApiClient):
+    """Download and re-upload a time series in the packed binary format"""
+    print("\n" + "=" * 70)
+    print("Step 3b: Packed Binary Time Series Transfer")
+    print("=" * 70)
+
+    json_response = client.get("/v1/time-series/TS-MELO-3054")
+    packed_response = client.get(
+        "/v1/time-series/TS-MELO-3054",
+        headers={"Accept": timeseries_codec.MEDIA_TYPE}
+    )
+
+    if packed_response.status_code != 200:
+        print(f"  [ERROR] {packed_response.text}")
+        return None
+
+    json_size = len(json_response.content)
+    packed_size = len(packed_response.content)
+    print(f"\n  JSON size:   {json_size} bytes")
+    print(f"  Packed size: {packed_size} bytes ({json_size / packed_size:.1f}x smaller)")
+
+    time_series = timeseries_codec.decode_time_series(packed_response.content)
+    print(f"  Decoded: {time_series[0]['timeSeriesId']} with {len(time_series[0]['intervals'])} intervals")
+
+    # Re-submit the decoded series in packed form (replaces the stored series)
+    response = client.submit_time_series(time_series, packed=True)
+
+    print(f"\nResponse:")
+    print(f"  Status: {response.status_code}")
+
+    if response.status_code == 201:
+        print(f"  [OK] Packed time series accepted!")
+        print(f"  timeSeriesIds: {response.json().get('timeSeriesIds')}")
+        return response.json()
+    else:
+        print(f"  [ERROR] {response.text}")
+        return None
+
+
+def execute_calculation(client: FormulaApiClient):
     """Execute calculation using stored formula and time series"""
     print("\n" + "=" * 70)
     print("Step 4: Execute Calculation")
     print("=" * 70)
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}",
-    }
-
     calculation_request = {
         "calculationId": f"CALC-{uuid.uuid4().hex[:8]}",
         "maloId": "12345678901",
@@ -311,56 +341,52 @@ def execute_calculation(token: str):
     print(f"  timeSliceId: {calculation_request['timeSliceId']}")
     print(f"  inputTimeSeries: {len(calculation_request['inputTimeSeries'])} mappings")
 
-    response = requests.post(
-        f"{BASE_URL}/v1/calculations",
-        headers=headers,
-        json=calculation_request
-    )
+    # Listen for the completion event instead of polling GET /v1/calculations/{id}
+    calc_result = None
+    events = client.events(["calculation.completed", "calculation.failed"])
+    try:
+        response = client.run_calculation(calculation_request)
 
-    print(f"\nResponse:")
-    print(f"  Status: {response.status_code}")
+        print(f"\nResponse:")
+        print(f"  Status: {response.status_code}")
 
-    if response.status_code == 202:
-        result = response.json()
-        print(f"  [OK] Calculation submitted!")
-        print(f"  calculationId: {result.get('calculationId')}")
-        print(f"  status: {result.get('status')}")
-
-        # Get calculation result
-        calc_id = result.get('calculationId')
-        calc_response = requests.get(
-            f"{BASE_URL}/v1/calculations/{calc_id}",
-            headers=headers
-        )
-
-        if calc_response.status_code == 200:
-            calc_result = calc_response.json()
-            print(f"\n  Calculation Result:")
-            print(f"    status: {calc_result.get('status')}")
-            print(f"    outputTimeSeriesId: {calc_result.get('outputTimeSeriesId')}")
-            print(f"    intervalsCalculated: {calc_result.get('intervalsCalculated')}")
-
-            # Get output time series
-            output_ts_id = calc_result.get('outputTimeSeriesId')
-            if output_ts_id:
-                ts_response = requests.get(
-                    f"{BASE_URL}/v1/time-series/{output_ts_id}",
-                    headers=headers
-                )
-                if ts_response.status_code == 200:
-                    ts_data = ts_response.json()
-                    intervals = ts_data.get('intervals', [])
-                    print(f"\n  Output Time Series (first 5 intervals):")
-                    for interval in intervals[:5]:
-                        print(f"    {interval['start']}: {interval['quantity']} kWh ({interval['quality']})")
+        if response.status_code == 202:
+            result = response.json()
+            calc_id = result.get('calculationId')
+            print(f"  [OK] Calculation submitted!")
+            print(f"  calculationId: {calc_id}")
+            print(f"  status: {result.get('status')}")
 
-        return result
-    else:
+            event = next(event for event in events if event["data"]["calculationId"] == calc_id)
+            calc_result = event["data"]
+            print(f"\n  Event {event['id']}: {event['type']}")
+    finally:
+        events.close()
+
+    if calc_result is None:
         print(f"  [ERROR] {response.text}")
         return None
 
+    print(f"\n  Calculation Result:")
+    print(f"    status: {calc_result.get('status')}")
+    print(f"    outputTimeSeriesId: {calc_result.get('outputTimeSeriesId')}")
+    print(f"    intervalsCalculated: {calc_result.get('intervalsCalculated')}")
+
+    # Get output time series
+    output_ts_id = calc_result.get('outputTimeSeriesId')
+    if output_ts_id:
+        ts_response = client.get(f"/v1/time-series/{output_ts_id}")
+        if ts_response.status_code == 200:
+            ts_data = ts_response.json()
+            intervals = ts_data.get('intervals', [])
+            print(f"\n  Output Time Series (first 5 intervals):")
+            for interval in intervals[:5]:
+                print(f"    {interval['start']}: {interval['quantity']} kWh ({interval['quality']})")
+
+    return result
+
 
-def test_validation_errors(token: str):
+def test_validation_errors(client: FormulaApiClient):
     """Test validation error responses"""
     print("\n" + "=" * 70)
     print("Step 5: Test Validation Errors")
@@ -368,10 +394,11 @@ def test_validation_errors(token: str):
 
     # Test 1: Missing transactionId header
     print("\nTest 1: Missing transactionId header")
-    response = requests.post(
-        f"{BASE_URL}/formula/v0.0.1",
+    response = client.request(
+        "POST",
+        "/formula/v0.0.1",
+        authenticate=False,
         headers={
-            "Content-Type": "application/json",
             "creationDateTime": get_timestamp(),
         },
         json={"maloId": "12345678901", "calculationFormulaTimeSlices": []}
@@ -381,10 +408,10 @@ def test_validation_errors(token: str):
 
     # Test 2: Invalid maloId format
     print("\nTest 2: Invalid maloId format")
-    response = requests.post(
-        f"{BASE_URL}/formula/v0.0.1",
+    response = client.request(
+        "POST",
+        "/formula/v0.0.1",
         headers={
-            "Content-Type": "application/json",
             "transactionId": generate_transaction_id(),
             "creationDateTime": get_timestamp(),
         },
@@ -408,10 +435,10 @@ def test_validation_errors(token: str):
 
     # Test 3: Invalid meloId format
     print("\nTest 3: Invalid meloId format in meloOperand")
-    response = requests.post(
-        f"{BASE_URL}/formula/v0.0.1",
+    response = client.request(
+        "POST",
+        "/formula/v0.0.1",
         headers={
-            "Content-Type": "application/json",
             "transactionId": generate_transaction_id(),
             "creationDateTime": get_timestamp(),
         },
@@ -445,22 +472,18 @@ def test_validation_errors(token: str):
 
     # Test 4: Method not allowed
     print("\nTest 4: GET on /formula/v0.0.1 (should be 405)")
-    response = requests.get(f"{BASE_URL}/formula/v0.0.1")
+    response = client.request("GET", "/formula/v0.0.1", authenticate=False)
     print(f"  Status: {response.status_code}")
     print(f"  Message: {response.json().get('message')}")
 
 
-def list_formulas(token: str):
+def list_formulas(client: FormulaApiClient):
     """List all stored formulas"""
     print("\n" + "=" * 70)
     print("Step 6: List All Formulas")
     print("=" * 70)
 
-    headers = {
-        "Authorization": f"Bearer {token}",
-    }
-
-    response = requests.get(f"{BASE_URL}/formulas", headers=headers)
+    response = client.list_formulas()
 
     if response.status_code == 200:
         result = response.json()
@@ -480,24 +503,32 @@ def main():
     print("Specification: formel_v0.0.1")
     print("=" * 70)
 
+    client = FormulaApiClient(BASE_URL, "demo-client", "demo-secret")
+
     try:
         # Step 1: Authenticate
-        token = get_oauth_token()
+        get_oauth_token(client)
 
         # Step 2: Submit EDI@Energy compliant formula
-        submit_formula_edi_compliant(token)
+        submit_formula_edi_compliant(client)
+
+        # Step 2b: Submit several formulas concurrently
+        submit_formulas_concurrently(client)
 
         # Step 3: Submit time series data
-        submit_time_series(token)
+        submit_time_series(client)
+
+        # Step 3b: Round-trip a series in the packed binary format
+        transfer_time_series_packed(client)
 
         # Step 4: Execute calculation
-        execute_calculation(token)
+        execute_calculation(client)
 
         # Step 5: Test validation errors
-        test_validation_errors(token)
+        test_validation_errors(client)
 
         # Step 6: List all formulas
-        list_formulas(token)
+        list_formulas(client)
 
         print("\n" + "=" * 70)
         print("Demo completed successfully!")
@@ -506,6 +537,8 @@ def main():
     except Exception as e:
         print(f"\n[ERROR] Demo failed: {e}")
         raise
+    finally:
+        client.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,463 @@
+# SPDX-License-Identifier: EUPL-1.2
+# SPDX-FileCopyrightText: 2024 Energy Formula API Contributors
+#
+# Licensed under the EUPL
+"""
+Python Client for the Formula API
+
+Reusable client for integration jobs and scripts:
+- One pooled HTTP session (keep-alive), so repeated calls skip TCP/TLS setup
+- OAuth2 token cached until shortly before expiry, refreshed on expiry or 401
+- Requests throttled by the server (429) resent after Retry-After
+- Formula submissions retried with the initialTransactionId header, so a
+  retry of an already accepted submission returns the original response
+- FormulaLocations validated locally (formula_validation) before upload
+- Concurrent formula submission over the shared connection pool
+- Streaming download of large time series to a file
+- Calculation and ingest events from the Server-Sent Events stream
+  (resumed with Last-Event-ID after connection loss) and webhook
+  registration, so jobs need not poll for results
+
+Usage:
+    from formula_api_client import FormulaApiClient
+
+    with FormulaApiClient("http://localhost:8000") as client:
+        responses = client.submit_formulas(formula_locations, workers=8)
+        client.download_time_series("TS-MELO-3054", "TS-MELO-3054.etsp")
+
+        events = client.events(["calculation.completed", "calculation.failed"])
+        client.run_calculation(calculation_request)
+        result = next(event for event in events if event["data"]["calculationId"] == calculation_id)
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import timeseries_codec
+from formula_validation import validate_formula_location
+
+BASE_URL = os.environ.get("BASE_URL", "http://localhost:8000")
+
+DEFAULT_SCOPE = "formula.read formula.write timeseries.read timeseries.write calculations.execute"
+
+# Responses worth retrying: the request may not have been processed
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+# Refresh tokens this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 60
+
+# Longest Retry-After (seconds) honoured before resending a throttled request
+MAX_RETRY_AFTER = 30
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Read timeout of the event stream; the server sends a keep-alive comment every 15s
+EVENTS_READ_TIMEOUT = 60
+
+# Wait before reconnecting a dropped event stream
+EVENTS_RECONNECT_DELAY = 3.0
+
+
+class ApiError(Exception):
+    """Raised when the API cannot be used at all (e.g. authentication failed)"""
+
+    def __init__(self, message: str, response: Optional[requests.Response] = None) -> None:
+        super().__init__(message)
+        self.response = response
+
+
+def get_timestamp() -> str:
+    """Get current UTC timestamp in ISO 8601 format"""
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def generate_transaction_id() -> str:
+    """Generate UUID RFC4122 for transactionId"""
+    return str(uuid.uuid4())
+
+
+def verify_webhook_signature(secret: str, body: bytes, signature: Optional[str]) -> bool:
+    """Check the X-Webhook-Signature header of a webhook delivery against its raw body"""
+    expected = "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return signature is not None and hmac.compare_digest(expected, signature)
+
+
+def _rejected_locally(transaction_id: str, validation_errors: List[str]) -> requests.Response:
+    """Build the 400 response POST /formula/v0.0.1 returns for an invalid FormulaLocation"""
+    response = requests.Response()
+    response.status_code = 400
+    response.reason = "Bad Request"
+    response.headers["Content-Type"] = "application/json"
+    response._content = json.dumps({
+        "error": "Bad Request",
+        "message": "Validation failed",
+        "transactionId": transaction_id,
+        "validationErrors": validation_errors,
+    }).encode("utf-8")
+    return response
+
+
+class FormulaApiClient:
+    """
+    Thread-safe client sharing one connection pool and one access token
+
+    Methods return the requests.Response, so callers decide how to handle
+    4xx results; only connection failures and authentication errors raise.
+    FormulaLocations that fail local validation are answered with the 400
+    response the server would send, without a request (response.request is
+    None).
+    """
+
+    def __init__(self, base_url: str = BASE_URL, client_id: str = "demo-client",
+                 client_secret: str = "demo-secret", scope: str = DEFAULT_SCOPE,
+                 pool_size: int = 10, max_retries: int = 3, backoff: float = 0.2,
+                 timeout: float = 30.0, validate: bool = True) -> None:
+        """
+        Args:
+            base_url: API root, e.g. http://localhost:8000
+            client_id, client_secret, scope: OAuth2 client_credentials grant
+            pool_size: Keep-alive connections kept open (match the worker count)
+            max_retries: Retries for connection errors and RETRY_STATUS_CODES
+            backoff: Base delay in seconds, doubled per retry
+            timeout: Per-request timeout in seconds
+            validate: Validate FormulaLocations locally before submitting
+        """
+        self.base_url = base_url.rstrip("/")
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.scope = scope
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.validate = validate
+
+        # Reads are retried by urllib3; POSTs only on connection errors (nothing
+        # was sent), formula submissions additionally via submit_formula
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+
+    def __enter__(self) -> "FormulaApiClient":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close all pooled connections"""
+        self.session.close()
+
+    # -------------------------------------------------------------------------
+    # Authentication
+    # -------------------------------------------------------------------------
+
+    def token(self) -> str:
+        """Return a valid access token, requesting a new one when needed"""
+        with self._token_lock:
+            if self._token is None or time.monotonic() >= self._token_expires_at:
+                self._token, expires_in = self._request_token()
+                self._token_expires_at = time.monotonic() + max(expires_in - TOKEN_REFRESH_MARGIN, 0)
+            return self._token
+
+    def invalidate_token(self, token: str) -> None:
+        """Drop a rejected token so the next call requests a new one"""
+        with self._token_lock:
+            if self._token == token:
+                self._token = None
+
+    def _request_token(self) -> Tuple[str, int]:
+        response = self.session.post(
+            f"{self.base_url}/oauth/token",
+            data={
+                "grant_type": "client_credentials",
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "scope": self.scope,
+            },
+            timeout=self.timeout
+        )
+        if response.status_code != 200:
+            raise ApiError(f"Authentication failed: {response.status_code} {response.text}", response)
+        body = response.json()
+        return body["access_token"], int(body.get("expires_in", 3600))
+
+    # -------------------------------------------------------------------------
+    # Requests
+    # -------------------------------------------------------------------------
+
+    def request(self, method: str, path: str, authenticate: bool = True, **kwargs: Any) -> requests.Response:
+        """
+        Send a request over the pooled session
+
+        Adds the bearer token (retrying once with a fresh token on 401) and
+        the default timeout. Requests rejected by the server's rate limit
+        (429, nothing was processed) are resent after Retry-After, up to
+        max_retries times. Remaining kwargs are passed to requests.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        url = f"{self.base_url}{path}"
+        if not authenticate:
+            return self.session.request(method, url, **kwargs)
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        refreshed = False
+        throttled = 0
+        while True:
+            token = self.token()
+            headers["Authorization"] = f"Bearer {token}"
+            response = self.session.request(method, url, headers=headers, **kwargs)
+            if response.status_code == 401 and not refreshed:
+                refreshed = True
+                self.invalidate_token(token)
+            elif response.status_code == 429 and throttled < self.max_retries:
+                throttled += 1
+                time.sleep(self._retry_after(response))
+            else:
+                return response
+            response.close()
+
+    def _retry_after(self, response: requests.Response) -> float:
+        """Delay requested by a 429 response (Retry-After in seconds), capped at MAX_RETRY_AFTER"""
+        try:
+            return min(float(response.headers["Retry-After"]), MAX_RETRY_AFTER)
+        except (KeyError, ValueError):
+            return self.backoff
+
+    def get(self, path: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def health(self) -> requests.Response:
+        return self.request("GET", "/health", authenticate=False)
+
+    # -------------------------------------------------------------------------
+    # Formulas
+    # -------------------------------------------------------------------------
+
+    def submit_formula(self, formula_location: Dict[str, Any],
+                       transaction_id: Optional[str] = None) -> requests.Response:
+        """
+        Submit a FormulaLocation to POST /formula/v0.0.1
+
+        On connection errors and RETRY_STATUS_CODES the submission is resent
+        with a new transactionId and initialTransactionId set to the first
+        one, so the server answers an already processed submission from its
+        transaction store instead of storing it twice.
+        """
+        transaction_id = transaction_id or generate_transaction_id()
+        if self.validate:
+            validation_errors = validate_formula_location(formula_location)
+            if validation_errors:
+                return _rejected_locally(transaction_id, validation_errors)
+
+        headers = {
+            "transactionId": transaction_id,
+            "creationDateTime": get_timestamp(),
+        }
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.post("/formula/v0.0.1", headers=headers, json=formula_location)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    return response
+
+            time.sleep(self.backoff * 2 ** attempt)
+            headers = {
+                "transactionId": generate_transaction_id(),
+                "creationDateTime": get_timestamp(),
+                "initialTransactionId": transaction_id,
+            }
+
+    def submit_formulas(self, formula_locations: Iterable[Dict[str, Any]],
+                        workers: Optional[int] = None) -> List[requests.Response]:
+        """
+        Submit FormulaLocations concurrently over the shared connection pool
+
+        Returns:
+            Responses in input order
+        """
+        with ThreadPoolExecutor(max_workers=workers or self.pool_size) as executor:
+            return list(executor.map(self.submit_formula, formula_locations))
+
+    def list_formulas(self) -> requests.Response:
+        return self.get("/formulas")
+
+    def get_formula(self, location_id: str) -> requests.Response:
+        return self.get(f"/formulas/{location_id}")
+
+    # -------------------------------------------------------------------------
+    # Time Series
+    # -------------------------------------------------------------------------
+
+    def submit_time_series(self, time_series: List[Dict[str, Any]], packed: bool = False) -> requests.Response:
+        """Submit time series as JSON or in the packed binary format"""
+        if packed:
+            return self.post(
+                "/v1/time-series",
+                headers={"Content-Type": timeseries_codec.MEDIA_TYPE},
+                data=timeseries_codec.encode_time_series(time_series)
+            )
+        return self.post("/v1/time-series", json={"timeSeries": time_series})
+
+    def get_time_series(self, time_series_id: str, packed: bool = True, **params: Any) -> Dict[str, Any]:
+        """
+        Fetch one time series (query params such as resolution or downsample
+        are passed through), transferred packed unless packed=False
+
+        Raises:
+            requests.HTTPError: For non-200 responses
+        """
+        headers = {"Accept": timeseries_codec.MEDIA_TYPE if packed else "application/json"}
+        response = self.get(f"/v1/time-series/{time_series_id}", headers=headers, params=params)
+        response.raise_for_status()
+        if response.headers.get("Content-Type", "").startswith(timeseries_codec.MEDIA_TYPE):
+            return timeseries_codec.decode_time_series(response.content)[0]
+        return response.json()
+
+    def iter_time_series_content(self, time_series_id: str, packed: bool = True,
+                                 chunk_size: int = DOWNLOAD_CHUNK_SIZE, **params: Any) -> Iterator[bytes]:
+        """
+        Stream the raw response body of a time series in chunks without
+        holding the whole payload in memory
+
+        Raises:
+            requests.HTTPError: For non-200 responses
+        """
+        headers = {"Accept": timeseries_codec.MEDIA_TYPE if packed else "application/json"}
+        with self.get(f"/v1/time-series/{time_series_id}", headers=headers, params=params, stream=True) as response:
+            response.raise_for_status()
+            yield from response.iter_content(chunk_size=chunk_size)
+
+    def download_time_series(self, time_series_id: str, path: str, packed: bool = True,
+                             chunk_size: int = DOWNLOAD_CHUNK_SIZE, **params: Any) -> int:
+        """
+        Stream a time series to a file
+
+        Returns:
+            Number of bytes written
+        """
+        written = 0
+        with open(path, "wb") as f:
+            for chunk in self.iter_time_series_content(time_series_id, packed, chunk_size, **params):
+                f.write(chunk)
+                written += len(chunk)
+        return written
+
+    # -------------------------------------------------------------------------
+    # Calculations
+    # -------------------------------------------------------------------------
+
+    def run_calculation(self, calculation_request: Dict[str, Any]) -> requests.Response:
+        return self.post("/v1/calculations", json=calculation_request)
+
+    def get_calculation(self, calculation_id: str) -> requests.Response:
+        return self.get(f"/v1/calculations/{calculation_id}")
+
+    def run_calculation_batch(self, calculation_requests: List[Dict[str, Any]]) -> requests.Response:
+        return self.post("/v1/calculations/batch", json={"calculations": calculation_requests})
+
+    # -------------------------------------------------------------------------
+    # Events and Webhooks
+    # -------------------------------------------------------------------------
+
+    def events(self, types: Iterable[str] = (), last_event_id: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Follow GET /v1/events, yielding events as {"id", "type", "createdAt", "data"}
+
+        The stream is connected before this returns, so events published
+        after the call are not missed. A dropped connection is reopened
+        with Last-Event-ID; events the server no longer buffers are skipped.
+        Close the iterator to end the stream.
+
+        Args:
+            types: Event types to receive (default: all the token's scopes allow)
+            last_event_id: Start after this event instead of with new events
+        """
+        types = ",".join(types)
+        return self._iter_events(self._open_events(types, last_event_id), types, last_event_id)
+
+    def _open_events(self, types: str, last_event_id: Optional[int]) -> requests.Response:
+        headers = {"Accept": "text/event-stream"}
+        if last_event_id is not None:
+            headers["Last-Event-ID"] = str(last_event_id)
+        response = self.get("/v1/events", params={"types": types} if types else None, headers=headers,
+                            stream=True, timeout=(self.timeout, EVENTS_READ_TIMEOUT))
+        if response.status_code != 200:
+            response.close()
+            raise ApiError(f"Event stream refused: {response.status_code} {response.text}", response)
+        return response
+
+    def _iter_events(self, response: requests.Response, types: str,
+                     last_event_id: Optional[int]) -> Iterator[Dict[str, Any]]:
+        while True:
+            try:
+                data: List[str] = []
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("data:"):
+                        data.append(line[5:].lstrip(" "))
+                    elif not line and data:
+                        event = json.loads("\n".join(data))
+                        data = []
+                        last_event_id = event["id"]
+                        yield event
+            except (requests.ConnectionError, requests.Timeout):
+                pass
+            finally:
+                response.close()
+            # The server ended the stream (shutdown, slow reader) or the connection dropped
+            while True:
+                time.sleep(EVENTS_RECONNECT_DELAY)
+                try:
+                    response = self._open_events(types, last_event_id)
+                    break
+                except (requests.ConnectionError, requests.Timeout):
+                    continue
+
+    def register_webhook(self, url: str, types: Iterable[str] = (), secret: Optional[str] = None) -> requests.Response:
+        """
+        Register a webhook for events (default: all the token's scopes allow)
+
+        The response carries the signing secret (generated unless given);
+        check deliveries with verify_webhook_signature.
+        """
+        body: Dict[str, Any] = {"url": url, "events": list(types)}
+        if secret is not None:
+            body["secret"] = secret
+        return self.post("/v1/webhooks", json=body)
+
+    def list_webhooks(self) -> requests.Response:
+        return self.get("/v1/webhooks")
+
+    def delete_webhook(self, webhook_id: str) -> requests.Response:
+        return self.request("DELETE", f"/v1/webhooks/{webhook_id}")
@@ -0,0 +1,651 @@
+# SPDX-License-Identifier: EUPL-1.2
+# SPDX-FileCopyrightText: 2024 Energy Formula API Contributors
+#
+# Licensed under the EUPL
+"""
+EDI@Energy Formula Validation
+
+Validation of FormulaLocations and EDI@Energy headers per formel_v0.0.1,
+shared by the API servers, the Python client and the bulk loader so that
+invalid records can be rejected before they are uploaded.
+
+validate_formula_location() returns the full list of error messages.
+Valid input, the common case, is accepted by a fast path: an iterative
+check driven by precompiled tables (operation arity, operand types, bound
+matchers, cached ID checks) that stops at the first problem and never
+builds messages. Only input the fast path rejects is walked again by the
+detailed validators to collect errors, so both always agree.
+
+Location IDs (maloId, meloId, neloId) are checked through the registry
+location_ids: each distinct ID is pattern- and check-digit-checked once,
+and stored IDs are interned and mapped to integer keys for indexes.
+
+Environment:
+    ID_CHECK_DIGITS           enforce = reject maloIds with a wrong check digit,
+                              off = check the format only (default: off)
+    ID_VALIDATION_CACHE_SIZE  Distinct IDs whose validation result is cached (default: 65536)
+"""
+
+from __future__ import annotations
+
+import functools
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# =============================================================================
+# EDI@Energy ID Patterns (from TEST_API_EDI_NEW schemas)
+# =============================================================================
+
+ID_PATTERNS = {
+    'maloId': re.compile(r'^\d{11}$'),                          # 11 digits
+    'meloId': re.compile(r'^DE\d{11}[A-Z\d]{20}$'),            # DE + 11 digits + 20 alphanumeric
+    'neloId': re.compile(r'^E[A-Z\d]{9}\d$'),                  # E + 9 alphanumeric + 1 digit
+    'transactionId': re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.IGNORECASE),
+    'percentValue': re.compile(r'^(0(\.\d+)?|1(\.0+)?)$'),     # 0.0 to 1.0
+    'constValue': re.compile(r'^-?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?$'),  # Real number
+    'formulaVar': re.compile(r'^[a-zA-Z]'),                    # Starts with letter
+}
+
+VALID_ENERGY_DIRECTIONS = {'consumption', 'production'}
+VALID_TIME_SLICE_QUALITIES = {'Gültige Daten', 'Keine Daten'}
+
+# =============================================================================
+# Location ID Registry
+# =============================================================================
+
+ID_CHECK_DIGITS = os.environ.get('ID_CHECK_DIGITS', 'off')
+ID_VALIDATION_CACHE_SIZE = int(os.environ.get('ID_VALIDATION_CACHE_SIZE', '65536'))
+
+LOCATION_ID_KINDS = ('maloId', 'meloId', 'neloId')
+
+
+def malo_id_check_digit(malo_id: str) -> int:
+    """
+    Check digit of a Market Location ID (BDEW): of the first ten digits, the
+    ones at odd positions are summed and the ones at even positions summed and
+    doubled; the check digit is the distance of the total to the next multiple of 10
+    """
+    odd = sum(int(digit) for digit in malo_id[0:10:2])
+    even = sum(int(digit) for digit in malo_id[1:10:2])
+    return (10 - (odd + 2 * even) % 10) % 10
+
+
+@functools.lru_cache(maxsize=ID_VALIDATION_CACHE_SIZE)
+def check_location_id(kind: str, value: str) -> Tuple[bool, bool]:
+    """
+    Check a location ID once per distinct (kind, value)
+
+    Returns:
+        (format valid, check digit valid); IDs without a check digit
+        (meloId, neloId) report True for a valid format
+    """
+    if not ID_PATTERNS[kind].match(value):
+        return False, False
+    if kind == 'maloId':
+        return True, int(value[10]) == malo_id_check_digit(value)
+    return True, True
+
+
+class LocationIdRegistry:
+    """
+    Interned location IDs with compact integer keys
+
+    key() registers an ID under the next integer; intern() returns the
+    registered string, so formulas and series referring to the same location
+    share one instance instead of a copy per occurrence. Registered IDs are
+    validated by a dict lookup, others through the bounded check_location_id
+    cache. Any string can be registered (e.g. free-form series location
+    fields); its kind is then None.
+
+    Lookups are lock-free; registration takes a lock. The registry only grows,
+    by one entry per distinct ID ever stored.
+    """
+
+    def __init__(self) -> None:
+        self._keys: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._kinds: List[Optional[str]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def is_valid(self, kind: str, value: str) -> bool:
+        """Whether value is a valid ID of this kind (maloId, meloId, neloId)"""
+        key = self._keys.get(value)
+        if key is not None:
+            return self._kinds[key] == kind
+        format_valid, check_digit_valid = check_location_id(kind, value)
+        return format_valid and (check_digit_valid or ID_CHECK_DIGITS != 'enforce')
+
+    def classify(self, value: str) -> Optional[str]:
+        """Kind of a location ID, None if it is none of LOCATION_ID_KINDS"""
+        for kind in LOCATION_ID_KINDS:
+            if self.is_valid(kind, value):
+                return kind
+        return None
+
+    def key(self, value: str) -> int:
+        """Integer key of an ID, registering it on first use"""
+        key = self._keys.get(value)
+        if key is not None:
+            return key
+
+        kind = self.classify(value)
+        with self._lock:
+            key = self._keys.get(value)
+            if key is None:
+                key = len(self._ids)
+                # Publish the key last: readers that find it also find the entry
+                self._ids.append(value)
+                self._kinds.append(kind)
+                self._keys[value] = key
+            return key
+
+    def lookup(self, value: str) -> Optional[int]:
+        """Integer key of an already registered ID, without registering it"""
+        return self._keys.get(value)
+
+    def intern(self, value: str) -> str:
+        """The registered instance of an ID (registering it if needed)"""
+        return self._ids[self.key(value)]
+
+    def location_id(self, key: int) -> str:
+        return self._ids[key]
+
+
+location_ids = LocationIdRegistry()
+
+
+def intern_location_ids(data: Any) -> None:
+    """Replace the maloId, neloId and meloId strings of a FormulaLocation in place by their interned instances"""
+    pending = [data]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, dict):
+            for field, value in node.items():
+                if isinstance(value, str):
+                    if field in ('maloId', 'meloId', 'neloId'):
+                        node[field] = location_ids.intern(value)
+                elif isinstance(value, (dict, list)):
+                    pending.append(value)
+        elif isinstance(node, list):
+            pending.extend(value for value in node if isinstance(value, (dict, list)))
+
+# =============================================================================
+# Fast Path (accept/reject without error messages)
+# =============================================================================
+
+# Operation -> operand layout: a list of operands, {minuend, subtrahend} or one operand
+_OPERAND_LIST, _SUB, _SINGLE = range(3)
+_OPERATION_LAYOUT = {
+    'add': _OPERAND_LIST,
+    'sub': _SUB,
+    'mul': _OPERAND_LIST,
+    'div': _OPERAND_LIST,
+    'pos': _SINGLE,
+    'operand': _SINGLE,
+}
+_OPERAND_TYPES = ('meloOperand', 'const', 'formulaVar', 'calculationFormula')
+_FACTOR_FIELDS = ('lossFactorTransformer', 'lossFactorConduction', 'distributionFactorEnergyQuantity')
+_TIME_SLICE_FIELDS = ('timeSliceId', 'timeSliceQuality', 'periodOfUseFrom', 'periodOfUseTo', 'calculationFormula')
+
+_is_valid_location_id = location_ids.is_valid
+_match_const = ID_PATTERNS['constValue'].match
+_match_formula_var = ID_PATTERNS['formulaVar'].match
+
+
+@functools.lru_cache(maxsize=4096)
+def _is_iso_timestamp(value: str) -> bool:
+    # Time slices of one location mostly share a handful of period bounds
+    try:
+        datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return False
+    return True
+
+
+def _is_valid_melo_operand(melo_operand: Any) -> bool:
+    if not isinstance(melo_operand, dict):
+        return False
+    melo_id = melo_operand.get('meloId')
+    if not isinstance(melo_id, str) or not _is_valid_location_id('meloId', melo_id):
+        return False
+    energy_direction = melo_operand.get('energyDirection')
+    if not isinstance(energy_direction, str) or energy_direction not in VALID_ENERGY_DIRECTIONS:
+        return False
+    for field in _FACTOR_FIELDS:
+        factor = melo_operand.get(field)
+        if not isinstance(factor, dict):
+            return False
+        value = factor.get('percentvalue')
+        if not isinstance(value, (int, float)) or not 0.0 <= value <= 1.0:
+            return False
+    return True
+
+
+def is_valid_calculation_formula(formula: Any) -> bool:
+    """
+    Fast check that validate_calculation_formula would report no errors
+
+    Iterative, so deeply nested formulas do not recurse.
+    """
+    pending = [formula]
+    while pending:
+        formula = pending.pop()
+        if not isinstance(formula, dict):
+            return False
+
+        operation = None
+        for name in _OPERATION_LAYOUT:
+            if formula.get(name) is not None:
+                if operation is not None:
+                    return False
+                operation = name
+        if operation is None:
+            return False
+
+        value = formula[operation]
+        layout = _OPERATION_LAYOUT[operation]
+        if layout == _OPERAND_LIST:
+            if not isinstance(value, list):
+                return False
+            operands = value
+        elif layout == _SUB:
+            if not isinstance(value, dict) or 'minuend' not in value or 'subtrahend' not in value:
+                return False
+            operands = (value['minuend'], value['subtrahend'])
+        else:
+            operands = (value,)
+
+        for operand in operands:
+            if not isinstance(operand, dict):
+                return False
+            operand_type = None
+            for name in _OPERAND_TYPES:
+                if operand.get(name) is not None:
+                    if operand_type is not None:
+                        return False
+                    operand_type = name
+            if operand_type is None:
+                return False
+
+            operand_value = operand[operand_type]
+            if operand_type == 'meloOperand':
+                if not _is_valid_melo_operand(operand_value):
+                    return False
+            elif operand_type == 'const':
+                if not _match_const(str(operand_value)):
+                    return False
+            elif operand_type == 'formulaVar':
+                if not isinstance(operand_value, str) or not _match_formula_var(operand_value):
+                    return False
+            else:
+                pending.append(operand_value)
+
+    return True
+
+
+def is_valid_time_slice(time_slice: Any) -> bool:
+    """Fast check that validate_time_slice would report no errors"""
+    if not isinstance(time_slice, dict):
+        return False
+    for field in _TIME_SLICE_FIELDS:
+        if field not in time_slice:
+            return False
+    if not isinstance(time_slice['timeSliceId'], int):
+        return False
+    quality = time_slice['timeSliceQuality']
+    if not isinstance(quality, str) or quality not in VALID_TIME_SLICE_QUALITIES:
+        return False
+    for field in ('periodOfUseFrom', 'periodOfUseTo'):
+        value = time_slice[field]
+        if not isinstance(value, str) or not _is_iso_timestamp(value):
+            return False
+    return is_valid_calculation_formula(time_slice['calculationFormula'])
+
+
+def is_valid_formula_location(data: Any) -> bool:
+    """Fast check that validate_formula_location would report no errors"""
+    if not isinstance(data, dict):
+        return False
+
+    malo_id = data.get('maloId')
+    nelo_id = data.get('neloId')
+    if malo_id and nelo_id:
+        return False
+    if malo_id:
+        if not isinstance(malo_id, str) or not _is_valid_location_id('maloId', malo_id):
+            return False
+    elif nelo_id:
+        if not isinstance(nelo_id, str) or not _is_valid_location_id('neloId', nelo_id):
+            return False
+    else:
+        return False
+
+    time_slices = data.get('calculationFormulaTimeSlices')
+    if not isinstance(time_slices, list) or not time_slices:
+        return False
+    for time_slice in time_slices:
+        if not is_valid_time_slice(time_slice):
+            return False
+    return True
+
+
+# =============================================================================
+# Validation Functions
+# =============================================================================
+
+def validate_malo_id(malo_id: str) -> bool:
+    """Validate Market Location ID (11 digits, check digit with ID_CHECK_DIGITS=enforce)"""
+    return location_ids.is_valid('maloId', malo_id)
+
+
+def validate_melo_id(melo_id: str) -> bool:
+    """Validate Meter Location ID (DE + 11 digits + 20 alphanumeric)"""
+    return location_ids.is_valid('meloId', melo_id)
+
+
+def validate_nelo_id(nelo_id: str) -> bool:
+    """Validate Network Location ID (E + 9 alphanumeric + 1 digit)"""
+    return location_ids.is_valid('neloId', nelo_id)
+
+
+def validate_transaction_id(transaction_id: str) -> bool:
+    """Validate Transaction ID (UUID RFC4122)"""
+    return bool(ID_PATTERNS['transactionId'].match(transaction_id))
+
+
+def validate_percent_value(value: float) -> bool:
+    """Validate percent value (0.0 to 1.0)"""
+    return 0.0 <= value <= 1.0
+
+
+def validate_edi_headers(values: Any) -> Tuple[bool, Optional[str], Dict[str, str]]:
+    """
+    Validate EDI@Energy header values from any mapping (request headers, bulk record envelope)
+    Returns: (is_valid, error_message, headers_dict)
+    """
+    transaction_id = values.get('transactionId')
+    creation_datetime = values.get('creationDateTime')
+    initial_transaction_id = values.get('initialTransactionId')
+
+    if not transaction_id:
+        return False, 'Header transactionId is required', {}
+
+    if not isinstance(transaction_id, str) or not validate_transaction_id(transaction_id):
+        return False, 'transactionId must be UUID RFC4122 format', {}
+
+    if not creation_datetime:
+        return False, 'Header creationDateTime is required', {}
+
+    # Validate ISO 8601 format
+    try:
+        datetime.fromisoformat(creation_datetime.replace('Z', '+00:00'))
+    except (ValueError, AttributeError):
+        return False, 'creationDateTime must be ISO 8601 format', {}
+
+    # Optional: validate initialTransactionId if provided
+    if initial_transaction_id and (not isinstance(initial_transaction_id, str)
+                                   or not validate_transaction_id(initial_transaction_id)):
+        return False, 'initialTransactionId must be UUID RFC4122 format', {}
+
+    return True, None, {
+        'transactionId': transaction_id,
+        'creationDateTime': creation_datetime,
+        'initialTransactionId': initial_transaction_id
+    }
+
+
+def validate_melo_operand(melo_operand: Dict[str, Any]) -> List[str]:
+    """Validate meloOperand structure per EDI@Energy specification"""
+    errors = []
+
+    # Required fields
+    required_fields = ['meloId', 'energyDirection', 'lossFactorTransformer',
+                       'lossFactorConduction', 'distributionFactorEnergyQuantity']
+
+    for field in required_fields:
+        if field not in melo_operand:
+            errors.append(f'meloOperand missing required field: {field}')
+
+    # Validate meloId format
+    if 'meloId' in melo_operand:
+        if not validate_melo_id(melo_operand['meloId']):
+            errors.append(f'Invalid meloId format: {melo_operand["meloId"]}. Expected: DE + 11 digits + 20 alphanumeric')
+
+    # Validate energyDirection
+    if 'energyDirection' in melo_operand:
+        if melo_operand['energyDirection'] not in VALID_ENERGY_DIRECTIONS:
+            errors.append(f'Invalid energyDirection: {melo_operand["energyDirection"]}. Must be: consumption or production')
+
+    # Validate loss factors and distribution factor
+    for factor_name in ['lossFactorTransformer', 'lossFactorConduction', 'distributionFactorEnergyQuantity']:
+        if factor_name in melo_operand:
+            factor = melo_operand[factor_name]
+            if isinstance(factor, dict) and 'percentvalue' in factor:
+                if not validate_percent_value(factor['percentvalue']):
+                    errors.append(f'{factor_name}.percentvalue must be between 0.0 and 1.0')
+            else:
+                errors.append(f'{factor_name} must have percentvalue field')
+
+    return errors
+
+
+def validate_operand(operand: Dict[str, Any]) -> List[str]:
+    """Validate operand structure (oneOf: meloOperand, const, formulaVar, calculationFormula)"""
+    errors = []
+
+    operand_types = ['meloOperand', 'const', 'formulaVar', 'calculationFormula']
+    present_types = [t for t in operand_types if t in operand and operand[t] is not None]
+
+    if len(present_types) == 0:
+        errors.append('Operand must have one of: meloOperand, const, formulaVar, calculationFormula')
+    elif len(present_types) > 1:
+        errors.append(f'Operand must have exactly one type, found: {present_types}')
+    else:
+        operand_type = present_types[0]
+
+        if operand_type == 'meloOperand':
+            errors.extend(validate_melo_operand(operand['meloOperand']))
+        elif operand_type == 'const':
+            const_val = str(operand['const'])
+            if not ID_PATTERNS['constValue'].match(const_val):
+                errors.append(f'Invalid const value: {const_val}')
+        elif operand_type == 'formulaVar':
+            if not ID_PATTERNS['formulaVar'].match(operand['formulaVar']):
+                errors.append(f'formulaVar must start with a letter: {operand["formulaVar"]}')
+        elif operand_type == 'calculationFormula':
+            errors.extend(validate_calculation_formula(operand['calculationFormula']))
+
+    return errors
+
+
+def validate_calculation_formula(formula: Dict[str, Any]) -> List[str]:
+    """Validate calculationFormula structure (oneOf: add, sub, mul, div, pos, operand)"""
+    errors = []
+
+    operation_types = ['add', 'sub', 'mul', 'div', 'pos', 'operand']
+    present_ops = [op for op in operation_types if op in formula and formula[op] is not None]
+
+    if len(present_ops) == 0:
+        errors.append('calculationFormula must have one of: add, sub, mul, div, pos, operand')
+    elif len(present_ops) > 1:
+        errors.append(f'calculationFormula must have exactly one operation, found: {present_ops}')
+    else:
+        op_type = present_ops[0]
+
+        if op_type == 'add':
+            # add: array of operands
+            if not isinstance(formula['add'], list):
+                errors.append('add operation must be an array of operands')
+            else:
+                for i, operand in enumerate(formula['add']):
+                    op_errors = validate_operand(operand)
+                    errors.extend([f'add[{i}]: {e}' for e in op_errors])
+
+        elif op_type == 'sub':
+            # sub: {minuend, subtrahend}
+            if not isinstance(formula['sub'], dict):
+                errors.append('sub operation must have minuend and subtrahend')
+            else:
+                if 'minuend' not in formula['sub']:
+                    errors.append('sub operation missing minuend')
+                else:
+                    errors.extend([f'sub.minuend: {e}' for e in validate_operand(formula['sub']['minuend'])])
+
+                if 'subtrahend' not in formula['sub']:
+                    errors.append('sub operation missing subtrahend')
+                else:
+                    errors.extend([f'sub.subtrahend: {e}' for e in validate_operand(formula['sub']['subtrahend'])])
+
+        elif op_type == 'mul':
+            # mul: array of operands
+            if not isinstance(formula['mul'], list):
+                errors.append('mul operation must be an array of operands')
+            else:
+                for i, operand in enumerate(formula['mul']):
+                    op_errors = validate_operand(operand)
+                    errors.extend([f'mul[{i}]: {e}' for e in op_errors])
+
+        elif op_type == 'div':
+            # div: array of operands
+            if not isinstance(formula['div'], list):
+                errors.append('div operation must be an array of operands')
+            else:
+                for i, operand in enumerate(formula['div']):
+                    op_errors = validate_operand(operand)
+                    errors.extend([f'div[{i}]: {e}' for e in op_errors])
+
+        elif op_type == 'pos':
+            # pos: single operand
+            errors.extend([f'pos: {e}' for e in validate_operand(formula['pos'])])
+
+        elif op_type == 'operand':
+            # operand: single operand
+            errors.extend(validate_operand(formula['operand']))
+
+    return errors
+
+
+def validate_time_slice(time_slice: Dict[str, Any]) -> List[str]:
+    """Validate calculationFormulaTimeSlice structure"""
+    errors = []
+
+    # Required fields
+    required_fields = ['timeSliceId', 'timeSliceQuality', 'periodOfUseFrom',
+                       'periodOfUseTo', 'calculationFormula']
+
+    for field in required_fields:
+        if field not in time_slice:
+            errors.append(f'Time slice missing required field: {field}')
+
+    # Validate timeSliceId (integer)
+    if 'timeSliceId' in time_slice:
+        if not isinstance(time_slice['timeSliceId'], int):
+            errors.append('timeSliceId must be an integer')
+
+    # Validate timeSliceQuality
+    if 'timeSliceQuality' in time_slice:
+        if time_slice['timeSliceQuality'] not in VALID_TIME_SLICE_QUALITIES:
+            errors.append(f'Invalid timeSliceQuality: {time_slice["timeSliceQuality"]}. Must be: Gültige Daten or Keine Daten')
+
+    # Validate period timestamps
+    for field in ['periodOfUseFrom', 'periodOfUseTo']:
+        if field in time_slice:
+            try:
+                datetime.fromisoformat(time_slice[field].replace('Z', '+00:00'))
+            except (ValueError, AttributeError):
+                errors.append(f'{field} must be ISO 8601 format')
+
+    # Validate calculationFormula
+    if 'calculationFormula' in time_slice:
+        errors.extend(validate_calculation_formula(time_slice['calculationFormula']))
+
+    return errors
+
+
+def validate_formula_location(data: Dict[str, Any]) -> List[str]:
+    """
+    Validate FormulaLocation (main request body)
+
+    Valid FormulaLocations are accepted by the fast path
+    (is_valid_formula_location); the checks below only run to collect the
+    error messages of invalid ones.
+    """
+    if is_valid_formula_location(data):
+        return []
+
+    errors = []
+
+    # Must have either maloId OR neloId
+    has_malo = 'maloId' in data and data['maloId']
+    has_nelo = 'neloId' in data and data['neloId']
+
+    if not has_malo and not has_nelo:
+        errors.append('FormulaLocation must have either maloId or neloId')
+
+    if has_malo and has_nelo:
+        errors.append('FormulaLocation must have either maloId OR neloId, not both')
+
+    # Validate maloId format
+    if has_malo and not validate_malo_id(data['maloId']):
+        if check_location_id('maloId', data['maloId'])[0]:
+            errors.append(f'Invalid maloId check digit: {data["maloId"]}. Expected: {malo_id_check_digit(data["maloId"])}')
+        else:
+            errors.append(f'Invalid maloId format: {data["maloId"]}. Expected: 11 digits')
+
+    # Validate neloId format
+    if has_nelo and not validate_nelo_id(data['neloId']):
+        errors.append(f'Invalid neloId format: {data["neloId"]}. Expected: E + 9 alphanumeric + 1 digit')
+
+    # Must have calculationFormulaTimeSlices
+    if 'calculationFormulaTimeSlices' not in data:
+        errors.append('FormulaLocation must have calculationFormulaTimeSlices')
+    elif not isinstance(data['calculationFormulaTimeSlices'], list):
+        errors.append('calculationFormulaTimeSlices must be an array')
+    elif len(data['calculationFormulaTimeSlices']) == 0:
+        errors.append('calculationFormulaTimeSlices cannot be empty')
+    else:
+        for i, time_slice in enumerate(data['calculationFormulaTimeSlices']):
+            ts_errors = validate_time_slice(time_slice)
+            errors.extend([f'timeSlice[{i}]: {e}' for e in ts_errors])
+
+    return errors
+
+
+def check_formula_record(record: Any) -> Tuple[Optional[Dict[str, Any]], Dict[str, str]]:
+    """
+    Check the envelope of a bulk import record (see POST /formulas/bulk)
+
+    Only the record itself and its EDI@Energy headers are checked; the
+    formulaLocation is validated separately with validate_formula_location.
+
+    Returns:
+        (rejection result or None, validated headers)
+    """
+    if not isinstance(record, dict):
+        return {'status': 'rejected', 'statusCode': 400, 'message': 'Record must be a JSON object'}, {}
+
+    is_valid, error_msg, headers = validate_edi_headers(record)
+    if not is_valid:
+        return {
+            'status': 'rejected',
+            'statusCode': 400,
+            'transactionId': record.get('transactionId'),
+            'message': error_msg
+        }, {}
+
+    data = record.get('formulaLocation')
+    if not isinstance(data, dict) or not data:
+        return {
+            'status': 'rejected',
+            'statusCode': 400,
+            'transactionId': headers['transactionId'],
+            'message': 'Record must contain a formulaLocation object'
+        }, {}
+
+    return None, headers
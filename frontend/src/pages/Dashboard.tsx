@@ -1,6 +1,11 @@
 import { useEffect, useState } from 'react';
 import { FileText, Calculator, TrendingUp, Activity } from 'lucide-react';
+import { LineChart, Line, XAxis, YAxis, Tooltip, ResponsiveContainer } from 'recharts';
 import { formulaApi, timeSeriesApi, healthCheck } from '../services/api';
+import type { TimeSeries } from '../types/formula';
+
+// Points requested for the dashboard chart (server-side LTTB downsampling)
+const CHART_POINTS = 500;
 
 export default function Dashboard() {
   const [stats, setStats] = useState({
@@ -9,6 +14,7 @@ export default function Dashboard() {
     calculations: 0,
   });
   const [health, setHealth] = useState<any>(null);
+  const [chartSeries, setChartSeries] = useState<TimeSeries | null>(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
@@ -19,16 +25,24 @@ export default function Dashboard() {
     try {
       const [formulasData, timeSeriesData, healthData] = await Promise.all([
         formulaApi.list(),
-        timeSeriesApi.list(),
+        timeSeriesApi.listSummaries(),
         healthCheck(),
       ]);
 
       setStats({
         formulas: formulasData.totalCount || 0,
-        timeSeries: timeSeriesData.timeSeries?.length || 0,
+        timeSeries: timeSeriesData.totalCount || 0,
         calculations: healthData.stats?.calculations || 0,
       });
       setHealth(healthData);
+
+      // Chart the largest series, downsampled instead of transferring every interval
+      const largest = [...(timeSeriesData.timeSeries || [])].sort(
+        (a, b) => b.intervalCount - a.intervalCount
+      )[0];
+      if (largest && largest.intervalCount > 0) {
+        setChartSeries(await timeSeriesApi.get(largest.timeSeriesId, { downsample: CHART_POINTS }));
+      }
     } catch (error) {
       console.error('Failed to load dashboard data:', error);
     } finally {
@@ -76,6 +90,35 @@ export default function Dashboard() {
         />
       </div>
 
+      {/* Time Series Chart */}
+      {chartSeries && (
+        <div className="bg-white rounded-lg shadow-sm border border-gray-200 p-6">
+          <h2 className="text-lg font-semibold text-gray-900">{chartSeries.timeSeriesId}</h2>
+          <p className="mt-1 mb-4 text-sm text-gray-600">
+            {chartSeries.measurementType} in {chartSeries.unit}, {chartSeries.intervals.length} points
+          </p>
+          <ResponsiveContainer width="100%" height={240}>
+            <LineChart
+              data={chartSeries.intervals.map((interval) => ({
+                time: new Date(interval.start).getTime(),
+                quantity: parseFloat(interval.quantity),
+              }))}
+            >
+              <XAxis
+                dataKey="time"
+                type="number"
+                scale="time"
+                domain={['dataMin', 'dataMax']}
+                tickFormatter={(time) => new Date(time).toLocaleDateString('en-US')}
+              />
+              <YAxis />
+              <Tooltip labelFormatter={(time) => new Date(time).toLocaleString('en-US')} />
+              <Line type="monotone" dataKey="quantity" stroke="#2563eb" dot={false} isAnimationActive={false} />
+            </LineChart>
+          </ResponsiveContainer>
+        </div>
+      )}
+
       {/* Server Status */}
       {health && (
         <div className="bg-white rounded-lg shadow-sm border border-gray-200 p-6">
@@ -1,14 +1,34 @@
 import { useEffect, useState } from 'react';
 import { CheckCircle, XCircle, AlertTriangle, Eye } from 'lucide-react';
-import { formulaApi, FormulaListItem } from '../services/api';
+import { eventsApi, formulaApi, FormulaListItem } from '../services/api';
+
+// Reload at most once per interval while formulas arrive (bulk imports)
+const RELOAD_DELAY_MS = 1000;
 
 export default function FormulaReceiver() {
   const [formulas, setFormulas] = useState<FormulaListItem[]>([]);
   const [loading, setLoading] = useState(true);
   const [selectedFormula, setSelectedFormula] = useState<FormulaListItem | null>(null);
+  const [live, setLive] = useState(false);
 
   useEffect(() => {
     loadReceivedFormulas();
+
+    // Reload when the hub accepts a formula instead of waiting for Refresh
+    let reloadTimer: ReturnType<typeof setTimeout> | undefined;
+    const unsubscribe = eventsApi.subscribe(['formula.accepted'], () => {
+      if (reloadTimer === undefined) {
+        reloadTimer = setTimeout(() => {
+          reloadTimer = undefined;
+          loadReceivedFormulas();
+        }, RELOAD_DELAY_MS);
+      }
+    }, setLive);
+
+    return () => {
+      unsubscribe();
+      clearTimeout(reloadTimer);
+    };
   }, []);
 
   const loadReceivedFormulas = async () => {
@@ -40,6 +60,13 @@ export default function FormulaReceiver() {
           </p>
           <p className="mt-1 text-sm text-gray-500">
             {formulas.length} submitted formula{formulas.length !== 1 ? 's' : ''} in hub
+            <span
+              className={`ml-3 inline-flex items-center ${live ? 'text-green-600' : 'text-gray-400'}`}
+              title={live ? 'New formulas appear automatically' : 'Not connected to the event stream'}
+            >
+              <span className={`mr-1 h-2 w-2 rounded-full ${live ? 'bg-green-500' : 'bg-gray-300'}`} />
+              {live ? 'Live' : 'Offline'}
+            </span>
           </p>
         </div>
         <button
@@ -8,8 +8,12 @@ import type {
   FormulaLocation,
   FormulaSubmissionResponse,
   TimeSeries,
+  TimeSeriesSummary,
+  TimeSeriesViewParams,
   CalculationRequest,
   CalculationResult,
+  ApiEvent,
+  ApiEventType,
   EdiEnergyHeaders,
   MaloId,
   TransactionId,
@@ -233,12 +237,33 @@ export const timeSeriesApi = {
     return response.data;
   },
 
+  /**
+   * Query time series metadata without intervals
+   * GET /v1/time-series?view=summary
+   */
+  listSummaries: async (params?: {
+    marketLocationId?: MaloId;
+    meterLocationId?: string;
+  }): Promise<{ timeSeries: TimeSeriesSummary[]; totalCount: number }> => {
+    const response = await api.get<{ timeSeries: TimeSeriesSummary[]; totalCount: number }>(
+      '/v1/time-series',
+      { params: { ...params, view: 'summary' } }
+    );
+    return response.data;
+  },
+
   /**
    * Get specific time series
    * GET /v1/time-series/{id}
+   *
+   * Pass resolution/aggregate for hourly, daily or monthly rollups, or
+   * downsample for an LTTB-reduced series suitable for charts.
    */
-  get: async (timeSeriesId: string): Promise<TimeSeries> => {
-    const response = await api.get<TimeSeries>(`/v1/time-series/${timeSeriesId}`);
+  get: async (timeSeriesId: string, params?: TimeSeriesViewParams): Promise<TimeSeries> => {
+    const response = await api.get<TimeSeries>(
+      `/v1/time-series/${encodeURIComponent(timeSeriesId)}`,
+      { params }
+    );
     return response.data;
   },
 };
@@ -256,6 +281,8 @@ export const calculationApi = {
     calculationId: string;
     status: string;
     acceptedAt: string;
+    outputTimeSeriesId?: string;
+    cacheStatus: 'HIT' | 'MISS';
   }> => {
     const response = await api.post('/v1/calculations', request);
     return response.data;
@@ -271,6 +298,74 @@ export const calculationApi = {
   },
 };
 
+// =============================================================================
+// Event Stream (Server-Sent Events)
+// =============================================================================
+
+export const API_EVENT_TYPES: ApiEventType[] = [
+  'calculation.completed',
+  'calculation.failed',
+  'formula.accepted',
+  'timeseries.ingested',
+];
+
+// Wait before reopening a stream the server refused (e.g. expired token)
+const EVENTS_RECONNECT_DELAY_MS = 3000;
+
+export const eventsApi = {
+  /**
+   * Subscribe to GET /v1/events instead of polling for results
+   *
+   * EventSource cannot send headers, so the token is passed as access_token
+   * query parameter. The browser reconnects dropped streams itself (with
+   * Last-Event-ID); a stream the server refuses is reopened with a new
+   * token, resuming after the last received event.
+   *
+   * Returns a function that closes the stream.
+   */
+  subscribe: (
+    types: ApiEventType[],
+    onEvent: (event: ApiEvent) => void,
+    onConnectionChange?: (connected: boolean) => void
+  ): (() => void) => {
+    let source: EventSource | null = null;
+    let closed = false;
+    let lastEventId = '';
+
+    const handleMessage = (message: MessageEvent<string>) => {
+      lastEventId = message.lastEventId;
+      onEvent(JSON.parse(message.data) as ApiEvent);
+    };
+
+    const open = async (refreshToken: boolean) => {
+      const token = refreshToken || !accessToken ? await authenticate() : accessToken;
+      if (closed) return;
+
+      const params = new URLSearchParams({ access_token: token });
+      if (types.length > 0) params.set('types', types.join(','));
+      if (lastEventId) params.set('lastEventId', lastEventId);
+
+      source = new EventSource(`${API_BASE_URL}/v1/events?${params}`);
+      source.onopen = () => onConnectionChange?.(true);
+      source.onerror = () => {
+        onConnectionChange?.(false);
+        if (source?.readyState === EventSource.CLOSED && !closed) {
+          setTimeout(() => open(true).catch(console.error), EVENTS_RECONNECT_DELAY_MS);
+        }
+      };
+      for (const type of types.length > 0 ? types : API_EVENT_TYPES) {
+        source.addEventListener(type, handleMessage);
+      }
+    };
+
+    open(false).catch(console.error);
+    return () => {
+      closed = true;
+      source?.close();
+    };
+  },
+};
+
 // =============================================================================
 // Health Check
 // =============================================================================
@@ -285,6 +380,13 @@ export interface HealthStatus {
     timeSeries: number;
     calculations: number;
     transactions: number;
+    calculationCache?: {
+      size: number;
+      maxSize: number;
+      hits: number;
+      misses: number;
+      evictions: number;
+    };
   };
 }
 
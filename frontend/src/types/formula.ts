@@ -231,12 +231,28 @@ export interface FormulaSubmissionResponse {
   transactionId: TransactionId;
   acceptanceTime: string;
   validationResults?: ValidationResult[];
+  /** Complexity limits exceeded while FORMULA_LIMIT_MODE=flag */
+  warnings?: string[];
 }
 
 export interface ValidationResult {
   timeSliceId: TimeSliceId;
   valid: boolean;
   errors?: string[];
+  complexity?: FormulaComplexity;
+}
+
+/**
+ * Submission-time analysis of a calculationFormula
+ */
+export interface FormulaComplexity {
+  nodeCount: number;
+  depth: number;
+  meloOperandCount: number;
+  evaluation: 'vectorized' | 'interpreter';
+  /** Units of one column-wise node evaluation per interval */
+  estimatedCostPerInterval: number;
+  flagged: boolean;
 }
 
 // -----------------------------------------------------------------------------
@@ -264,8 +280,33 @@ export interface Interval {
   end: string;
   quantity: string;
   quality: 'VALIDATED' | 'ESTIMATED' | 'MISSING' | 'Gültige Daten' | 'Keine Daten';
+  /** Number of source intervals (rollup views only) */
+  count?: number;
+}
+
+/** Rollup resolutions maintained by the server */
+export type RollupResolution = 'PT1H' | 'P1D' | 'P1M';
+
+export type RollupAggregate = 'sum' | 'min' | 'max' | 'avg';
+
+/**
+ * Read options for GET /v1/time-series/{id}
+ * Use a rollup or downsample for charts instead of fetching all PT15M intervals.
+ */
+export interface TimeSeriesViewParams {
+  resolution?: RollupResolution;
+  aggregate?: RollupAggregate;
+  periodStart?: string;
+  periodEnd?: string;
+  /** Maximum number of points (LTTB downsampling) */
+  downsample?: number;
 }
 
+/** Series metadata returned by GET /v1/time-series?view=summary */
+export type TimeSeriesSummary = Omit<TimeSeries, 'intervals'> & {
+  intervalCount: number;
+};
+
 // -----------------------------------------------------------------------------
 // Calculation Types
 // -----------------------------------------------------------------------------
@@ -297,6 +338,23 @@ export interface CalculationResult {
   }>;
 }
 
+// -----------------------------------------------------------------------------
+// Notification Events (GET /v1/events)
+// -----------------------------------------------------------------------------
+
+export type ApiEventType =
+  | 'calculation.completed'
+  | 'calculation.failed'
+  | 'formula.accepted'
+  | 'timeseries.ingested';
+
+export interface ApiEvent {
+  id: number;
+  type: ApiEventType;
+  createdAt: string;
+  data: Record<string, unknown>;
+}
+
 // -----------------------------------------------------------------------------
 // Formula Categories (kept for UI purposes)
 // -----------------------------------------------------------------------------
@@ -0,0 +1,66 @@
+# SPDX-License-Identifier: EUPL-1.2
+"""
+Gunicorn configuration for production serving
+
+Usage:
+    gunicorn --config gunicorn.conf.py mock_api_server:app
+
+All settings can be overridden via environment variables:
+    PORT                       Listen port (default: 8000)
+    GUNICORN_WORKERS           Worker processes (default: 1, see note below)
+    GUNICORN_THREADS           Threads per worker (default: 16)
+    GUNICORN_KEEPALIVE         Keep-alive seconds (default: 5)
+    GUNICORN_TIMEOUT           Worker timeout seconds (default: 60)
+    GUNICORN_GRACEFUL_TIMEOUT  Seconds to finish in-flight requests on shutdown (default: 30)
+    GUNICORN_MAX_REQUESTS      Recycle workers after N requests, 0 = never (default: 0)
+    EVENTS_MAX_STREAMS         Open event streams (default here: half the threads)
+
+Note: formulas, time series and calculations live in process memory.
+Each worker process has its own stores, so keep GUNICORN_WORKERS=1 and
+scale with threads unless requests are pinned to a worker. Set STATE_DIR
+to keep them across restarts (see snapshots.py); the worker restores them
+before serving and writes a final snapshot when it exits. Only one process
+can persist to a STATE_DIR, so gunicorn refuses to start with STATE_DIR
+and more than one worker.
+
+Each open GET /v1/events stream holds one thread for as long as its client
+is connected, so streams are capped at half the threads unless
+EVENTS_MAX_STREAMS is set. Serve many listeners from async_api_server.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+worker_class = "gthread"
+workers = int(os.environ.get("GUNICORN_WORKERS", "1"))
+threads = int(os.environ.get("GUNICORN_THREADS", "16"))
+
+if os.environ.get("STATE_DIR") and workers > 1:
+    # Every worker would snapshot the directory and delete the WAL segments the others write
+    raise SystemExit(f"STATE_DIR needs GUNICORN_WORKERS=1 (got {workers}); scale with GUNICORN_THREADS instead")
+
+# Read by notifications.py when gunicorn imports the app after this file
+os.environ.setdefault("EVENTS_MAX_STREAMS", str(max(threads // 2, 1)))
+
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+# Import the app once in the master so workers fork with code already loaded
+preload_app = True
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+def post_worker_init(worker):
+    """Restore persisted state and precompile stored formulas before the worker accepts requests"""
+    import mock_api_server
+
+    stats = mock_api_server.warmup()
+    worker.log.info("Worker %s warmed up: %s", worker.pid, stats)
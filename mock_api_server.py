@@ -16,20 +16,62 @@ Headers:
   - initialTransactionId (optional): For retry/idempotency
 
 Usage:
-    python mock_api_server.py
+    python mock_api_server.py                                   # development server
+    gunicorn --config gunicorn.conf.py mock_api_server:app      # production
 
     Server runs on: http://localhost:8000
 """
 
 from __future__ import annotations
 
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS
 from datetime import datetime, timezone
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, Callable
+from array import array
+from collections import OrderedDict
+import atexit
+import bisect
+import contextlib
+import functools
+import hashlib
+import itertools
+import operator
+import os
 import uuid
-import re
 import json
+import threading
+import time
+
+import access_tokens
+import metrics
+import notifications
+import profiling
+import scheduling
+import snapshots
+import timeseries_codec
+from formula_validation import (
+    check_formula_record,
+    intern_location_ids,
+    location_ids,
+    validate_calculation_formula,
+    validate_edi_headers,
+    validate_formula_location,
+    validate_malo_id,
+    validate_nelo_id,
+)
+# Validators defined in this module before formula_validation.py, still importable from here
+from formula_validation import (  # noqa: F401
+    ID_PATTERNS,
+    VALID_ENERGY_DIRECTIONS,
+    VALID_TIME_SLICE_QUALITIES,
+    validate_melo_id,
+    validate_melo_operand,
+    validate_operand,
+    validate_percent_value,
+    validate_time_slice,
+    validate_transaction_id,
+)
 
 app = Flask(__name__)
 CORS(app)
@@ -38,298 +80,142 @@ CORS(app)
 # In-Memory Storage
 # =============================================================================
 
-formula_location_store: Dict[str, Dict[str, Any]] = {}  # maloId/neloId -> FormulaLocation
-time_series_store: Dict[str, Dict[str, Any]] = {}       # timeSeriesId -> TimeSeries
-calculation_store: Dict[str, Dict[str, Any]] = {}       # calculationId -> Calculation
-transaction_store: Dict[str, Dict[str, Any]] = {}       # transactionId -> Transaction record
-
-# Mock OAuth2 Tokens
-valid_tokens = set()
+class InMemoryStore:
+    """
+    Thread-safe key -> record store for threaded WSGI servers
 
-# =============================================================================
-# EDI@Energy ID Patterns (from TEST_API_EDI_NEW schemas)
-# =============================================================================
+    Records are immutable once published: writers build a new record and swap
+    it in, readers get the current record without taking a lock and can never
+    observe a half-written one. Writers serialize per key on striped locks, so
+    read-modify-write (update, put_if_absent) is atomic for that key only.
+    Iteration works on a point-in-time snapshot.
 
-ID_PATTERNS = {
-    'maloId': re.compile(r'^\d{11}$'),                          # 11 digits
-    'meloId': re.compile(r'^DE\d{11}[A-Z\d]{20}$'),            # DE + 11 digits + 20 alphanumeric
-    'neloId': re.compile(r'^E[A-Z\d]{9}\d$'),                  # E + 9 alphanumeric + 1 digit
-    'transactionId': re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.IGNORECASE),
-    'percentValue': re.compile(r'^(0(\.\d+)?|1(\.0+)?)$'),     # 0.0 to 1.0
-    'constValue': re.compile(r'^-?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?$'),  # Real number
-    'formulaVar': re.compile(r'^[a-zA-Z]'),                    # Starts with letter
-}
+    If journal is set, it is called as journal(key, record) for every
+    published record, under the key's lock, so calls for one key arrive in
+    write order (see State Persistence).
+    """
 
-VALID_ENERGY_DIRECTIONS = {'consumption', 'production'}
-VALID_TIME_SLICE_QUALITIES = {'Gültige Daten', 'Keine Daten'}
+    LOCK_STRIPES = 32
+
+    def __init__(self) -> None:
+        self._data: Dict[str, Any] = {}
+        self._locks = [threading.RLock() for _ in range(self.LOCK_STRIPES)]
+        self.journal: Optional[Callable[[str, Any], None]] = None
+
+    def lock(self, key: str) -> threading.RLock:
+        """Stripe lock guarding writes to key (reentrant, for multi-step writes)"""
+        return self._locks[hash(key) % self.LOCK_STRIPES]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._data.get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        return self._data[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Shallow point-in-time copy (dict.copy is atomic under the GIL)"""
+        return self._data.copy()
+
+    def items(self):
+        return self.snapshot().items()
+
+    def values(self):
+        return self.snapshot().values()
+
+    def put(self, key: str, record: Any) -> None:
+        """Publish a complete record, replacing any previous one"""
+        with self.lock(key):
+            self._data[key] = record
+            if self.journal is not None:
+                self.journal(key, record)
+
+    __setitem__ = put
+
+    def put_if_absent(self, key: str, record: Any) -> Any:
+        """Publish record unless key exists; returns the record now stored"""
+        with self.lock(key):
+            existing = self._data.get(key)
+            if existing is not None:
+                return existing
+            self._data[key] = record
+            if self.journal is not None:
+                self.journal(key, record)
+            return record
+
+    def update(self, key: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy-on-write update of a dict record; returns the new record"""
+        with self.lock(key):
+            record = {**self._data[key], **fields}
+            self._data[key] = record
+            if self.journal is not None:
+                self.journal(key, record)
+            return record
+
+
+class LRUCache:
+    """Thread-safe size-bounded cache with least-recently-used eviction"""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return self._data[key]
+
+    def put(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key: Any) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': len(self._data), 'maxSize': self.max_size,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+formula_location_store = InMemoryStore()  # maloId/neloId -> FormulaLocation (current version)
+formula_version_store = InMemoryStore()   # maloId/neloId -> version history (see record_formula_version)
+formula_time_slice_store = InMemoryStore()  # time slice content hash -> time slice shared by all versions
+time_series_store = InMemoryStore()       # timeSeriesId -> TimeSeries
+calculation_store = InMemoryStore()       # calculationId -> Calculation
+transaction_store = InMemoryStore()       # transactionId -> Transaction record
 
 # =============================================================================
-# Validation Functions
+# Validation (see formula_validation.py)
 # =============================================================================
 
-def validate_malo_id(malo_id: str) -> bool:
-    """Validate Market Location ID (11 digits)"""
-    return bool(ID_PATTERNS['maloId'].match(malo_id))
-
-
-def validate_melo_id(melo_id: str) -> bool:
-    """Validate Meter Location ID (DE + 11 digits + 20 alphanumeric)"""
-    return bool(ID_PATTERNS['meloId'].match(melo_id))
-
-
-def validate_nelo_id(nelo_id: str) -> bool:
-    """Validate Network Location ID (E + 9 alphanumeric + 1 digit)"""
-    return bool(ID_PATTERNS['neloId'].match(nelo_id))
-
-
-def validate_transaction_id(transaction_id: str) -> bool:
-    """Validate Transaction ID (UUID RFC4122)"""
-    return bool(ID_PATTERNS['transactionId'].match(transaction_id))
-
-
-def validate_percent_value(value: float) -> bool:
-    """Validate percent value (0.0 to 1.0)"""
-    return 0.0 <= value <= 1.0
-
-
 def validate_headers() -> Tuple[bool, Optional[str], Dict[str, str]]:
     """
     Validate required EDI@Energy headers
     Returns: (is_valid, error_message, headers_dict)
     """
-    transaction_id = request.headers.get('transactionId')
-    creation_datetime = request.headers.get('creationDateTime')
-    initial_transaction_id = request.headers.get('initialTransactionId')
-
-    if not transaction_id:
-        return False, 'Header transactionId is required', {}
-
-    if not validate_transaction_id(transaction_id):
-        return False, 'transactionId must be UUID RFC4122 format', {}
-
-    if not creation_datetime:
-        return False, 'Header creationDateTime is required', {}
-
-    # Validate ISO 8601 format
-    try:
-        datetime.fromisoformat(creation_datetime.replace('Z', '+00:00'))
-    except ValueError:
-        return False, 'creationDateTime must be ISO 8601 format', {}
-
-    # Optional: validate initialTransactionId if provided
-    if initial_transaction_id and not validate_transaction_id(initial_transaction_id):
-        return False, 'initialTransactionId must be UUID RFC4122 format', {}
-
-    return True, None, {
-        'transactionId': transaction_id,
-        'creationDateTime': creation_datetime,
-        'initialTransactionId': initial_transaction_id
-    }
-
-
-def validate_melo_operand(melo_operand: Dict[str, Any]) -> List[str]:
-    """Validate meloOperand structure per EDI@Energy specification"""
-    errors = []
-
-    # Required fields
-    required_fields = ['meloId', 'energyDirection', 'lossFactorTransformer',
-                       'lossFactorConduction', 'distributionFactorEnergyQuantity']
-
-    for field in required_fields:
-        if field not in melo_operand:
-            errors.append(f'meloOperand missing required field: {field}')
-
-    # Validate meloId format
-    if 'meloId' in melo_operand:
-        if not validate_melo_id(melo_operand['meloId']):
-            errors.append(f'Invalid meloId format: {melo_operand["meloId"]}. Expected: DE + 11 digits + 20 alphanumeric')
-
-    # Validate energyDirection
-    if 'energyDirection' in melo_operand:
-        if melo_operand['energyDirection'] not in VALID_ENERGY_DIRECTIONS:
-            errors.append(f'Invalid energyDirection: {melo_operand["energyDirection"]}. Must be: consumption or production')
-
-    # Validate loss factors and distribution factor
-    for factor_name in ['lossFactorTransformer', 'lossFactorConduction', 'distributionFactorEnergyQuantity']:
-        if factor_name in melo_operand:
-            factor = melo_operand[factor_name]
-            if isinstance(factor, dict) and 'percentvalue' in factor:
-                if not validate_percent_value(factor['percentvalue']):
-                    errors.append(f'{factor_name}.percentvalue must be between 0.0 and 1.0')
-            else:
-                errors.append(f'{factor_name} must have percentvalue field')
-
-    return errors
-
-
-def validate_operand(operand: Dict[str, Any]) -> List[str]:
-    """Validate operand structure (oneOf: meloOperand, const, formulaVar, calculationFormula)"""
-    errors = []
-
-    operand_types = ['meloOperand', 'const', 'formulaVar', 'calculationFormula']
-    present_types = [t for t in operand_types if t in operand and operand[t] is not None]
-
-    if len(present_types) == 0:
-        errors.append('Operand must have one of: meloOperand, const, formulaVar, calculationFormula')
-    elif len(present_types) > 1:
-        errors.append(f'Operand must have exactly one type, found: {present_types}')
-    else:
-        operand_type = present_types[0]
-
-        if operand_type == 'meloOperand':
-            errors.extend(validate_melo_operand(operand['meloOperand']))
-        elif operand_type == 'const':
-            const_val = str(operand['const'])
-            if not ID_PATTERNS['constValue'].match(const_val):
-                errors.append(f'Invalid const value: {const_val}')
-        elif operand_type == 'formulaVar':
-            if not ID_PATTERNS['formulaVar'].match(operand['formulaVar']):
-                errors.append(f'formulaVar must start with a letter: {operand["formulaVar"]}')
-        elif operand_type == 'calculationFormula':
-            errors.extend(validate_calculation_formula(operand['calculationFormula']))
-
-    return errors
-
-
-def validate_calculation_formula(formula: Dict[str, Any]) -> List[str]:
-    """Validate calculationFormula structure (oneOf: add, sub, mul, div, pos, operand)"""
-    errors = []
-
-    operation_types = ['add', 'sub', 'mul', 'div', 'pos', 'operand']
-    present_ops = [op for op in operation_types if op in formula and formula[op] is not None]
-
-    if len(present_ops) == 0:
-        errors.append('calculationFormula must have one of: add, sub, mul, div, pos, operand')
-    elif len(present_ops) > 1:
-        errors.append(f'calculationFormula must have exactly one operation, found: {present_ops}')
-    else:
-        op_type = present_ops[0]
-
-        if op_type == 'add':
-            # add: array of operands
-            if not isinstance(formula['add'], list):
-                errors.append('add operation must be an array of operands')
-            else:
-                for i, operand in enumerate(formula['add']):
-                    op_errors = validate_operand(operand)
-                    errors.extend([f'add[{i}]: {e}' for e in op_errors])
-
-        elif op_type == 'sub':
-            # sub: {minuend, subtrahend}
-            if not isinstance(formula['sub'], dict):
-                errors.append('sub operation must have minuend and subtrahend')
-            else:
-                if 'minuend' not in formula['sub']:
-                    errors.append('sub operation missing minuend')
-                else:
-                    errors.extend([f'sub.minuend: {e}' for e in validate_operand(formula['sub']['minuend'])])
-
-                if 'subtrahend' not in formula['sub']:
-                    errors.append('sub operation missing subtrahend')
-                else:
-                    errors.extend([f'sub.subtrahend: {e}' for e in validate_operand(formula['sub']['subtrahend'])])
-
-        elif op_type == 'mul':
-            # mul: array of operands
-            if not isinstance(formula['mul'], list):
-                errors.append('mul operation must be an array of operands')
-            else:
-                for i, operand in enumerate(formula['mul']):
-                    op_errors = validate_operand(operand)
-                    errors.extend([f'mul[{i}]: {e}' for e in op_errors])
-
-        elif op_type == 'div':
-            # div: array of operands
-            if not isinstance(formula['div'], list):
-                errors.append('div operation must be an array of operands')
-            else:
-                for i, operand in enumerate(formula['div']):
-                    op_errors = validate_operand(operand)
-                    errors.extend([f'div[{i}]: {e}' for e in op_errors])
-
-        elif op_type == 'pos':
-            # pos: single operand
-            errors.extend([f'pos: {e}' for e in validate_operand(formula['pos'])])
-
-        elif op_type == 'operand':
-            # operand: single operand
-            errors.extend(validate_operand(formula['operand']))
-
-    return errors
-
-
-def validate_time_slice(time_slice: Dict[str, Any]) -> List[str]:
-    """Validate calculationFormulaTimeSlice structure"""
-    errors = []
-
-    # Required fields
-    required_fields = ['timeSliceId', 'timeSliceQuality', 'periodOfUseFrom',
-                       'periodOfUseTo', 'calculationFormula']
-
-    for field in required_fields:
-        if field not in time_slice:
-            errors.append(f'Time slice missing required field: {field}')
-
-    # Validate timeSliceId (integer)
-    if 'timeSliceId' in time_slice:
-        if not isinstance(time_slice['timeSliceId'], int):
-            errors.append('timeSliceId must be an integer')
-
-    # Validate timeSliceQuality
-    if 'timeSliceQuality' in time_slice:
-        if time_slice['timeSliceQuality'] not in VALID_TIME_SLICE_QUALITIES:
-            errors.append(f'Invalid timeSliceQuality: {time_slice["timeSliceQuality"]}. Must be: Gültige Daten or Keine Daten')
-
-    # Validate period timestamps
-    for field in ['periodOfUseFrom', 'periodOfUseTo']:
-        if field in time_slice:
-            try:
-                datetime.fromisoformat(time_slice[field].replace('Z', '+00:00'))
-            except (ValueError, AttributeError):
-                errors.append(f'{field} must be ISO 8601 format')
-
-    # Validate calculationFormula
-    if 'calculationFormula' in time_slice:
-        errors.extend(validate_calculation_formula(time_slice['calculationFormula']))
-
-    return errors
-
-
-def validate_formula_location(data: Dict[str, Any]) -> List[str]:
-    """Validate FormulaLocation (main request body)"""
-    errors = []
-
-    # Must have either maloId OR neloId
-    has_malo = 'maloId' in data and data['maloId']
-    has_nelo = 'neloId' in data and data['neloId']
-
-    if not has_malo and not has_nelo:
-        errors.append('FormulaLocation must have either maloId or neloId')
-
-    if has_malo and has_nelo:
-        errors.append('FormulaLocation must have either maloId OR neloId, not both')
-
-    # Validate maloId format
-    if has_malo and not validate_malo_id(data['maloId']):
-        errors.append(f'Invalid maloId format: {data["maloId"]}. Expected: 11 digits')
-
-    # Validate neloId format
-    if has_nelo and not validate_nelo_id(data['neloId']):
-        errors.append(f'Invalid neloId format: {data["neloId"]}. Expected: E + 9 alphanumeric + 1 digit')
-
-    # Must have calculationFormulaTimeSlices
-    if 'calculationFormulaTimeSlices' not in data:
-        errors.append('FormulaLocation must have calculationFormulaTimeSlices')
-    elif not isinstance(data['calculationFormulaTimeSlices'], list):
-        errors.append('calculationFormulaTimeSlices must be an array')
-    elif len(data['calculationFormulaTimeSlices']) == 0:
-        errors.append('calculationFormulaTimeSlices cannot be empty')
-    else:
-        for i, time_slice in enumerate(data['calculationFormulaTimeSlices']):
-            ts_errors = validate_time_slice(time_slice)
-            errors.extend([f'timeSlice[{i}]: {e}' for e in ts_errors])
-
-    return errors
+    return validate_edi_headers(request.headers)
 
 
 # =============================================================================
@@ -396,6 +282,9 @@ def execute_calculation_formula(formula: Dict[str, Any], input_data: Dict[str, L
     Supports operations: add, sub, mul, div, pos, operand
     Per EDI@Energy specification
 
+    Reference semantics for the compiled evaluators (CompiledFormula,
+    FormulaProgram); recurses once per nesting level.
+
     Args:
         formula: The calculation formula
         input_data: Dictionary mapping meloId -> list of intervals
@@ -452,19 +341,459 @@ def execute_calculation_formula(formula: Dict[str, Any], input_data: Dict[str, L
     return 0.0
 
 
-def calculate_time_slice(time_slice: Dict[str, Any], input_data: Dict[str, List[Dict]]) -> List[Dict]:
+# Column-wise evaluation builds one closure per formula node and recurses once
+# per nesting level; deeper formulas run as a postfix program (FormulaProgram)
+VECTORIZED_MAX_DEPTH = 128
+
+COMPILED_FORMULA_CACHE_SIZE = 10000
+
+# Column evaluator: (meloId -> float column, interval count) -> float column
+ColumnFn = Callable[[Dict[str, List[float]], int], List[float]]
+
+
+class CompiledFormula:
+    """
+    calculationFormula compiled once into an evaluation plan
+
+    Formulas up to VECTORIZED_MAX_DEPTH get a column-wise plan that evaluates
+    each formula node for all intervals at once instead of walking the
+    formula dict per interval; deeper ones a FormulaProgram evaluated per
+    interval without recursion. Results are identical to
+    execute_calculation_formula, including division-by-zero handling.
+    """
+
+    __slots__ = ('formula', 'formula_hash', 'melo_ids', 'node_count', 'depth', 'plan', 'program')
+
+    def __init__(self, formula: Dict[str, Any], formula_hash: str) -> None:
+        self.formula = formula
+        self.formula_hash = formula_hash
+        self.melo_ids, self.node_count, self.depth = analyze_formula(formula)
+        self.plan: Optional[ColumnFn] = None
+        self.program: Optional[FormulaProgram] = None
+        if self.depth <= VECTORIZED_MAX_DEPTH:
+            self.plan = _compile_formula_node(formula)
+        else:
+            self.program = FormulaProgram(formula)
+
+    @property
+    def vectorized(self) -> bool:
+        return self.plan is not None
+
+    def evaluate(self, columns: Dict[str, List[float]], length: int) -> List[float]:
+        """Evaluate all intervals; columns must hold `length` floats per meloId"""
+        if self.plan is not None:
+            return self.plan(columns, length)
+        return self.program.evaluate(columns, length)
+
+
+# FormulaProgram opcodes
+OP_MELO, OP_CONST, OP_ADD2, OP_MUL2, OP_SUB, OP_ADD, OP_MUL, OP_DIV, OP_ABS = range(9)
+
+
+class FormulaProgram:
+    """
+    calculationFormula flattened into a postfix program, compiled once
+
+    Instructions are tuples (opcode, args...) evaluated per interval on an
+    explicit value stack, so nesting depth is limited only by memory, not by
+    Python's recursion limit, and no formula dicts are inspected per interval:
+
+        (OP_MELO, slot, 1 - lossTransformer, 1 - lossConduction, distribution)
+        (OP_CONST, value)
+        (OP_ADD, n) / (OP_MUL, n) / (OP_DIV, n)   combine the top n values
+        (OP_ADD2,) / (OP_MUL2,)                    add/mul of exactly two values
+        (OP_SUB,) / (OP_ABS,)
+
+    Dispatch order, evaluation order and division-by-zero handling follow
+    execute_calculation_formula, so results are bit-identical.
+    """
+
+    __slots__ = ('code', 'melo_ids')
+
+    def __init__(self, formula: Dict[str, Any]) -> None:
+        self.code: List[Tuple] = []
+        slots: Dict[str, int] = {}
+
+        # Work items: ('formula', node) / ('operand', node) to compile, ('emit', instruction)
+        work: List[Tuple[str, Any]] = [('formula', formula)]
+        while work:
+            kind, node = work.pop()
+            if kind == 'emit':
+                self.code.append(node)
+
+            elif kind == 'formula':
+                if 'add' in node and node['add']:
+                    self._push_nary(work, OP_ADD, node['add'])
+                elif 'sub' in node and node['sub']:
+                    work.append(('emit', (OP_SUB,)))
+                    work.append(('operand', node['sub']['subtrahend']))
+                    work.append(('operand', node['sub']['minuend']))
+                elif 'mul' in node and node['mul']:
+                    self._push_nary(work, OP_MUL, node['mul'])
+                elif 'div' in node and node['div']:
+                    self._push_nary(work, OP_DIV, node['div'])
+                elif 'pos' in node and node['pos']:
+                    work.append(('emit', (OP_ABS,)))
+                    work.append(('operand', node['pos']))
+                elif 'operand' in node and node['operand']:
+                    work.append(('operand', node['operand']))
+                else:
+                    self.code.append((OP_CONST, 0.0))
+
+            elif 'meloOperand' in node and node['meloOperand']:
+                melo = node['meloOperand']
+                slot = slots.setdefault(melo['meloId'], len(slots))
+                self.code.append((
+                    OP_MELO, slot,
+                    1 - melo.get('lossFactorTransformer', {}).get('percentvalue', 0),
+                    1 - melo.get('lossFactorConduction', {}).get('percentvalue', 0),
+                    melo.get('distributionFactorEnergyQuantity', {}).get('percentvalue', 1)
+                ))
+            elif 'const' in node and node['const'] is not None:
+                self.code.append((OP_CONST, float(node['const'])))
+            elif 'formulaVar' in node and node['formulaVar']:
+                # No variable context yet, see execute_operand
+                self.code.append((OP_CONST, 0.0))
+            elif 'calculationFormula' in node and node['calculationFormula']:
+                work.append(('formula', node['calculationFormula']))
+            else:
+                self.code.append((OP_CONST, 0.0))
+
+        self.melo_ids = tuple(slots)
+
+    @staticmethod
+    def _push_nary(work: List[Tuple[str, Any]], opcode: int, operands: List[Dict[str, Any]]) -> None:
+        # Emitted after all operands; operands pushed in reverse so the first compiles first
+        if len(operands) == 2 and opcode in (OP_ADD, OP_MUL):
+            work.append(('emit', (OP_ADD2,) if opcode == OP_ADD else (OP_MUL2,)))
+        else:
+            work.append(('emit', (opcode, len(operands))))
+        work.extend(('operand', operand) for operand in reversed(operands))
+
+    def evaluate(self, columns: Dict[str, List[float]], length: int) -> List[float]:
+        """Evaluate all intervals; columns must hold `length` floats per meloId"""
+        zeros = [0.0] * length
+        slot_columns = [columns.get(melo_id, zeros) for melo_id in self.melo_ids]
+        code = self.code
+        values = []
+
+        for i in range(length):
+            stack: List[float] = []
+            push = stack.append
+            for instruction in code:
+                op = instruction[0]
+                if op == OP_MELO:
+                    push(slot_columns[instruction[1]][i] * instruction[2] * instruction[3] * instruction[4])
+                elif op == OP_CONST:
+                    push(instruction[1])
+                elif op == OP_ADD2:
+                    # 0.0 + a keeps the sign handling of the n-ary sum (-0.0 + 0.0 == 0.0)
+                    second = stack.pop()
+                    stack[-1] = 0.0 + stack[-1] + second
+                elif op == OP_MUL2:
+                    second = stack.pop()
+                    stack[-1] = stack[-1] * second
+                elif op == OP_ADD:
+                    n = instruction[1]
+                    total = 0.0
+                    for value in stack[-n:]:
+                        total += value
+                    del stack[-n:]
+                    push(total)
+                elif op == OP_SUB:
+                    subtrahend = stack.pop()
+                    stack[-1] = stack[-1] - subtrahend
+                elif op == OP_MUL:
+                    n = instruction[1]
+                    result = 1.0
+                    for value in stack[-n:]:
+                        result *= value
+                    del stack[-n:]
+                    push(result)
+                elif op == OP_DIV:
+                    n = instruction[1]
+                    operands = stack[-n:]
+                    del stack[-n:]
+                    result = operands[0]
+                    for divisor in operands[1:]:
+                        if divisor == 0:
+                            result = 0.0
+                            break
+                        result /= divisor
+                    push(result)
+                else:  # OP_ABS
+                    stack[-1] = abs(stack[-1])
+            values.append(stack[0])
+
+        return values
+
+
+def formula_hash(formula: Dict[str, Any]) -> str:
+    """Stable content hash of a calculationFormula"""
+    canonical = json.dumps(formula, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def analyze_formula(formula: Dict[str, Any]) -> Tuple[Tuple[str, ...], int, int]:
+    """
+    Walk a calculationFormula without recursion
+
+    Returns:
+        (referenced meloIds in first-use order, node count, nesting depth)
+    """
+    melo_ids: Dict[str, None] = {}
+    node_count = 0
+    max_depth = 0
+    stack = [(formula, 1, True)]
+
+    while stack:
+        node, depth, is_formula = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        node_count += 1
+        max_depth = max(max_depth, depth)
+
+        if is_formula:
+            for op in ('add', 'mul', 'div'):
+                if isinstance(node.get(op), list):
+                    stack.extend((child, depth + 1, False) for child in reversed(node[op]))
+            if isinstance(node.get('sub'), dict):
+                stack.append((node['sub'].get('subtrahend'), depth + 1, False))
+                stack.append((node['sub'].get('minuend'), depth + 1, False))
+            for op in ('pos', 'operand'):
+                if node.get(op):
+                    stack.append((node[op], depth + 1, False))
+        elif node.get('meloOperand'):
+            melo_id = node['meloOperand'].get('meloId')
+            if melo_id is not None:
+                melo_ids.setdefault(melo_id, None)
+        elif node.get('calculationFormula'):
+            stack.append((node['calculationFormula'], depth + 1, True))
+
+    return tuple(melo_ids), node_count, max_depth
+
+
+def _compile_operand_node(operand: Dict[str, Any]) -> ColumnFn:
+    """Compile an operand (dispatch order mirrors execute_operand)"""
+    if 'meloOperand' in operand and operand['meloOperand']:
+        melo = operand['meloOperand']
+        melo_id = melo['meloId']
+        loss_transformer = 1 - melo.get('lossFactorTransformer', {}).get('percentvalue', 0)
+        loss_conduction = 1 - melo.get('lossFactorConduction', {}).get('percentvalue', 0)
+        distribution = melo.get('distributionFactorEnergyQuantity', {}).get('percentvalue', 1)
+
+        def melo_column(columns, length):
+            column = columns.get(melo_id)
+            if column is None:
+                column = [0.0] * length
+            # Same evaluation order as execute_operand for bit-identical results
+            return [v * loss_transformer * loss_conduction * distribution for v in column]
+        return melo_column
+
+    elif 'const' in operand and operand['const'] is not None:
+        value = float(operand['const'])
+        return lambda columns, length: [value] * length
+
+    elif 'formulaVar' in operand and operand['formulaVar']:
+        return lambda columns, length: [0.0] * length
+
+    elif 'calculationFormula' in operand and operand['calculationFormula']:
+        return _compile_formula_node(operand['calculationFormula'])
+
+    return lambda columns, length: [0.0] * length
+
+
+def _compile_formula_node(formula: Dict[str, Any]) -> ColumnFn:
+    """Compile a calculationFormula (dispatch order mirrors execute_calculation_formula)"""
+    if 'add' in formula and formula['add']:
+        parts = [_compile_operand_node(op) for op in formula['add']]
+
+        def add_columns(columns, length):
+            total = [0.0] * length
+            for part in parts:
+                total = list(map(operator.add, total, part(columns, length)))
+            return total
+        return add_columns
+
+    elif 'sub' in formula and formula['sub']:
+        minuend = _compile_operand_node(formula['sub']['minuend'])
+        subtrahend = _compile_operand_node(formula['sub']['subtrahend'])
+        return lambda columns, length: list(
+            map(operator.sub, minuend(columns, length), subtrahend(columns, length)))
+
+    elif 'mul' in formula and formula['mul']:
+        parts = [_compile_operand_node(op) for op in formula['mul']]
+
+        def mul_columns(columns, length):
+            result = [1.0] * length
+            for part in parts:
+                result = list(map(operator.mul, result, part(columns, length)))
+            return result
+        return mul_columns
+
+    elif 'div' in formula and formula['div']:
+        first = _compile_operand_node(formula['div'][0])
+        divisors = [_compile_operand_node(op) for op in formula['div'][1:]]
+
+        def div_columns(columns, length):
+            result = first(columns, length)
+            zeroed = [False] * length
+            for divisor in divisors:
+                column = divisor(columns, length)
+                # Division by zero pins the interval to 0.0 (see execute_calculation_formula)
+                zeroed = [z or d == 0 for z, d in zip(zeroed, column)]
+                result = [0.0 if z else r / d for r, d, z in zip(result, column, zeroed)]
+            return result
+        return div_columns
+
+    elif 'pos' in formula and formula['pos']:
+        inner = _compile_operand_node(formula['pos'])
+        return lambda columns, length: list(map(abs, inner(columns, length)))
+
+    elif 'operand' in formula and formula['operand']:
+        return _compile_operand_node(formula['operand'])
+
+    return lambda columns, length: [0.0] * length
+
+
+_compiled_formula_cache = LRUCache(COMPILED_FORMULA_CACHE_SIZE)
+
+
+def get_compiled_formula(formula: Dict[str, Any], key: Optional[str] = None) -> CompiledFormula:
+    """
+    Return the cached compiled plan for a calculationFormula, compiling on first use
+
+    Plans are keyed by the formula's content hash, so versions sharing a
+    formula share its plan; pass the hash recorded with a stored version
+    as key to skip hashing the formula.
+    """
+    if key is None:
+        key = formula_hash(formula)
+    compiled = _compiled_formula_cache.get(key)
+    if compiled is None:
+        compiled = CompiledFormula(formula, key)
+        _compiled_formula_cache.put(key, compiled)
+    return compiled
+
+
+def calculation_window(period: Any) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Parse a calculation period into epoch bounds (start inclusive, end exclusive)
+
+    Either bound may be omitted. Raises ValueError (with a message for the
+    client) if period is not an object, a timestamp is malformed or the
+    period is empty.
+    """
+    if not isinstance(period, dict):
+        raise ValueError('period must be an object with start and/or end')
+    start, end = period.get('start'), period.get('end')
+    try:
+        window_start = timeseries_codec.parse_timestamp(start) if start else None
+        window_end = timeseries_codec.parse_timestamp(end) if end else None
+    except (TypeError, AttributeError, ValueError) as e:
+        raise ValueError('period.start and period.end must be ISO 8601 timestamps') from e
+    if window_start is not None and window_end is not None and window_start >= window_end:
+        raise ValueError('period.start must be before period.end')
+    return window_start, window_end
+
+
+def window_intervals(intervals: List[Dict], window_start: Optional[int], window_end: Optional[int]) -> List[Dict]:
+    """
+    Slice intervals to those starting within [window_start, window_end)
+
+    Intervals are in chronological order (the order their positions define),
+    so both bounds are found by binary search: only O(log n) timestamps are
+    parsed and only the window is copied. Raises ValueError/KeyError for
+    intervals without a valid start.
+    """
+    if window_start is None and window_end is None:
+        return intervals
+
+    def start_of(interval: Dict) -> int:
+        return timeseries_codec.parse_timestamp(interval['start'])
+
+    lo = bisect_by(intervals, window_start, start_of) if window_start is not None else 0
+    hi = bisect_by(intervals, window_end, start_of, lo=lo) if window_end is not None else len(intervals)
+    return intervals[lo:hi]
+
+
+# =============================================================================
+# Quality Propagation
+# =============================================================================
+
+# Input quality ranks, worst wins. Every operator (add, sub, mul, div, pos)
+# gives its result the worst quality of its operands; constants are exact.
+# As all operators follow the same rule, an output interval's quality is the
+# worst quality of that interval across the formula's meloOperands, so the
+# engine folds one rank column per input instead of walking the formula.
+# Missing intervals (short or absent input series, no quantity) enter the
+# calculation as 0.0 and rank MISSING.
+QUALITY_GOOD, QUALITY_ESTIMATED, QUALITY_SUBSTITUTE, QUALITY_FORECASTED, QUALITY_MISSING = range(5)
+QUALITY_RANKS = {
+    None: QUALITY_GOOD,
+    'METERED': QUALITY_GOOD,
+    'VALIDATED': QUALITY_GOOD,
+    'Gültige Daten': QUALITY_GOOD,
+    'ESTIMATED': QUALITY_ESTIMATED,
+    'SUBSTITUTE': QUALITY_SUBSTITUTE,
+    'FORECASTED': QUALITY_FORECASTED,
+    'MISSING': QUALITY_MISSING,
+    'Keine Daten': QUALITY_MISSING,
+}
+# Output quality per rank; intervals of the timeSliceQuality's own rank carry
+# the timeSliceQuality
+QUALITY_NAMES = (None, 'ESTIMATED', 'SUBSTITUTE', 'FORECASTED', 'MISSING')
+_GOOD_QUALITIES = frozenset(quality for quality, rank in QUALITY_RANKS.items() if rank == QUALITY_GOOD)
+
+
+def quality_ranks(intervals: List[Dict], length: int, quantities_complete: bool = True) -> Optional[bytearray]:
+    """
+    Quality rank per interval of an input (padded with MISSING to length)
+
+    Returns None if every interval is good, which is the common case and
+    costs one set comprehension over the intervals. Pass
+    quantities_complete=False if some interval may lack its quantity.
+    """
+    if (quantities_complete and len(intervals) >= length
+            and {interval.get('quality') for interval in intervals} <= _GOOD_QUALITIES):
+        return None
+    ranks = bytearray(QUALITY_MISSING if 'quantity' not in interval
+                      else QUALITY_RANKS.get(interval.get('quality'), QUALITY_GOOD)
+                      for interval in intervals[:length])
+    ranks.extend(bytes((QUALITY_MISSING,)) * (length - len(ranks)))
+    return ranks
+
+
+def worst_quality(columns: List[Optional[bytearray]]) -> Optional[bytes]:
+    """Element-wise worst rank of the rank columns (None columns are all good)"""
+    worst = None
+    for ranks in columns:
+        if ranks is not None:
+            worst = ranks if worst is None else bytes(map(max, worst, ranks))
+    return worst
+
+
+def calculate_time_slice(time_slice: Dict[str, Any], input_data: Dict[str, List[Dict]],
+                         timings: Optional[Dict[str, Any]] = None, formula_key: Optional[str] = None) -> List[Dict]:
     """
     Execute calculation for a time slice across all intervals
 
+    Uses the compiled column-wise plan; formulas nested deeper than
+    VECTORIZED_MAX_DEPTH run as a per-interval postfix program. Each output
+    interval carries the worst input quality of that interval (see Quality
+    Propagation), or the timeSliceQuality if all inputs are good.
+
     Args:
         time_slice: The calculationFormulaTimeSlice
-        input_data: Dictionary mapping meloId -> list of intervals
+        input_data: Dictionary mapping meloId -> list of intervals (already
+            restricted to the calculation period, see window_intervals)
+        timings: Optional dict that receives the seconds spent per stage
+            (compile, evaluate, materialize) and the compiled formula
+        formula_key: Content hash of the calculationFormula if known (see get_compiled_formula)
 
     Returns:
         List of calculated intervals
     """
-    formula = time_slice['calculationFormula']
-
     # Determine number of intervals from input data
     if not input_data:
         return []
@@ -472,10 +801,47 @@ def calculate_time_slice(time_slice: Dict[str, Any], input_data: Dict[str, List[
     first_melo_id = list(input_data.keys())[0]
     num_intervals = len(input_data[first_melo_id])
 
+    started = time.perf_counter()
+    compiled = get_compiled_formula(time_slice['calculationFormula'], formula_key)
+    compiled_at = time.perf_counter()
+
+    # Missing or short input series contribute 0.0, as in execute_operand, and rank MISSING
+    columns = {}
+    rank_columns = []
+    for melo_id in compiled.melo_ids:
+        if melo_id in input_data:
+            intervals = input_data[melo_id][:num_intervals]
+            try:
+                column = [float(interval['quantity']) for interval in intervals]
+                rank_columns.append(quality_ranks(intervals, num_intervals))
+            except KeyError:
+                column = [float(interval.get('quantity', 0)) for interval in intervals]
+                rank_columns.append(quality_ranks(intervals, num_intervals, quantities_complete=False))
+            column.extend([0.0] * (num_intervals - len(column)))
+            columns[melo_id] = column
+        else:
+            rank_columns.append(bytes((QUALITY_MISSING,)) * num_intervals)
+    values = compiled.evaluate(columns, num_intervals)
+    worst = worst_quality(rank_columns)
+    evaluated_at = time.perf_counter()
+
+    # The time slice's own quality ranks like an input: 'Keine Daten' makes
+    # every interval MISSING, whatever quality the inputs carry
+    slice_quality = time_slice.get('timeSliceQuality', 'Gültige Daten')
+    slice_rank = QUALITY_RANKS.get(slice_quality, QUALITY_GOOD)
+    if worst is None:
+        qualities = [slice_quality] * num_intervals
+    else:
+        if slice_rank != QUALITY_GOOD:
+            worst = worst.translate(bytes(max(rank, slice_rank) for rank in range(256)))
+        names = list(QUALITY_NAMES)
+        names[slice_rank] = slice_quality
+        qualities = [names[rank] for rank in worst]
+
     result_intervals = []
 
     for i in range(num_intervals):
-        calculated_value = execute_calculation_formula(formula, input_data, i)
+        calculated_value = values[i]
 
         # Get timestamp from first input series
         first_interval = input_data[first_melo_id][i]
@@ -485,12 +851,115 @@ def calculate_time_slice(time_slice: Dict[str, Any], input_data: Dict[str, List[
             'start': first_interval.get('start', ''),
             'end': first_interval.get('end', ''),
             'quantity': f'{calculated_value:.6f}',
-            'quality': time_slice.get('timeSliceQuality', 'Gültige Daten')
+            'quality': qualities[i]
         })
 
+    if timings is not None:
+        timings['compiled'] = compiled
+        timings['compile'] = compiled_at - started
+        timings['evaluate'] = evaluated_at - compiled_at
+        timings['materialize'] = time.perf_counter() - evaluated_at
+
     return result_intervals
 
 
+# =============================================================================
+# Formula Complexity & Admission Limits
+# =============================================================================
+
+# Cost model in units of one column-wise node evaluation per interval (~0.1 us).
+# Materializing an output interval costs about 40 units; the postfix program
+# (formulas deeper than VECTORIZED_MAX_DEPTH) about 2 units per node.
+INTERVAL_BASE_COST = 40
+INTERPRETER_COST_FACTOR = 2
+
+# Submission limits. The depth limit always rejects: structural validation
+# recurses per nesting level. Exceeding the node, meloOperand or
+# cost limit rejects the FormulaLocation, or with FORMULA_LIMIT_MODE=flag
+# accepts it with warnings.
+FORMULA_MAX_DEPTH = int(os.environ.get('FORMULA_MAX_DEPTH', '256'))
+FORMULA_MAX_NODES = int(os.environ.get('FORMULA_MAX_NODES', '5000'))
+FORMULA_MAX_MELO_OPERANDS = int(os.environ.get('FORMULA_MAX_MELO_OPERANDS', '500'))
+FORMULA_MAX_COST = int(os.environ.get('FORMULA_MAX_COST', '10000'))
+FORMULA_LIMIT_MODE = os.environ.get('FORMULA_LIMIT_MODE', 'reject')
+
+
+def formula_complexity(formula: Any) -> Dict[str, Any]:
+    """
+    Size and estimated evaluation cost of a calculationFormula
+
+    Walks the formula without recursion, so it is safe on arbitrarily deep input.
+
+    Returns:
+        nodeCount, depth, meloOperandCount (distinct meloIds), evaluation
+        path and estimatedCostPerInterval
+    """
+    melo_ids, node_count, depth = analyze_formula(formula) if isinstance(formula, dict) else ((), 0, 0)
+    vectorized = depth <= VECTORIZED_MAX_DEPTH
+    node_cost = 1 if vectorized else INTERPRETER_COST_FACTOR
+    return {
+        'nodeCount': node_count,
+        'depth': depth,
+        'meloOperandCount': len(melo_ids),
+        'evaluation': 'vectorized' if vectorized else 'interpreter',
+        'estimatedCostPerInterval': INTERVAL_BASE_COST + node_count * node_cost
+    }
+
+
+def check_formula_limits(complexity: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    """
+    Compare a formula's complexity with the submission limits
+
+    Returns:
+        (errors, warnings); limits other than depth go to warnings when
+        FORMULA_LIMIT_MODE is 'flag'
+    """
+    errors = []
+    if complexity['depth'] > FORMULA_MAX_DEPTH:
+        errors.append(f'calculationFormula nesting depth {complexity["depth"]} exceeds limit {FORMULA_MAX_DEPTH}')
+
+    exceeded = []
+    if complexity['nodeCount'] > FORMULA_MAX_NODES:
+        exceeded.append(f'calculationFormula has {complexity["nodeCount"]} nodes, limit is {FORMULA_MAX_NODES}')
+    if complexity['meloOperandCount'] > FORMULA_MAX_MELO_OPERANDS:
+        exceeded.append(f'calculationFormula references {complexity["meloOperandCount"]} meloIds, '
+                        f'limit is {FORMULA_MAX_MELO_OPERANDS}')
+    if complexity['estimatedCostPerInterval'] > FORMULA_MAX_COST:
+        exceeded.append(f'calculationFormula estimated cost {complexity["estimatedCostPerInterval"]} per interval '
+                        f'exceeds limit {FORMULA_MAX_COST}')
+
+    if FORMULA_LIMIT_MODE == 'flag':
+        return errors, exceeded
+    return errors + exceeded, []
+
+
+def assess_formula_location(data: Any) -> Tuple[List[Dict[str, Any]], List[str], List[str]]:
+    """
+    Complexity and limit check for every time slice of a FormulaLocation
+
+    Runs before structural validation, which recurses per nesting level.
+    Malformed bodies are left to validate_formula_location.
+
+    Returns:
+        (complexity per time slice incl. timeSliceId, errors, warnings)
+    """
+    time_slices = data.get('calculationFormulaTimeSlices') if isinstance(data, dict) else None
+    if not isinstance(time_slices, list):
+        return [], [], []
+
+    assessed, errors, warnings = [], [], []
+    for i, time_slice in enumerate(time_slices):
+        if not isinstance(time_slice, dict):
+            continue
+        complexity = formula_complexity(time_slice.get('calculationFormula'))
+        slice_errors, slice_warnings = check_formula_limits(complexity)
+        errors.extend(f'timeSlice[{i}]: {e}' for e in slice_errors)
+        warnings.extend(f'timeSlice[{i}]: {w}' for w in slice_warnings)
+        assessed.append({'timeSliceId': time_slice.get('timeSliceId'), **complexity,
+                         'flagged': bool(slice_warnings)})
+    return assessed, errors, warnings
+
+
 # =============================================================================
 # Helper Functions
 # =============================================================================
@@ -500,12 +969,42 @@ def generate_id(prefix: str) -> str:
     return f'{prefix}-{uuid.uuid4().hex[:8]}'
 
 
-def validate_token(auth_header: Optional[str]) -> bool:
-    """Validate Bearer token"""
+def authorize(auth_header: Optional[str], scope: Optional[str] = None
+              ) -> Tuple[Optional[access_tokens.TokenClaims], Optional[Tuple[Dict[str, Any], int]]]:
+    """
+    Check the Bearer token (signature, expiry) and the scope an endpoint requires
+
+    Returns:
+        (claims, None) if the request may proceed, otherwise
+        (None, (response_body, 401 | 403)); pass the claims on instead of
+        verifying the token again, it may expire in between
+    """
     if not auth_header or not auth_header.startswith('Bearer '):
-        return False
-    token = auth_header.replace('Bearer ', '')
-    return len(token) > 10
+        return None, ({'error': 'Unauthorized'}, 401)
+    claims = access_tokens.verify(auth_header[7:])
+    if claims is None:
+        return None, ({'error': 'Unauthorized', 'message': 'Invalid or expired access token'}, 401)
+    if scope is not None and scope not in claims.scopes:
+        return None, ({'error': 'Forbidden', 'message': f'Access token lacks scope {scope}', 'requiredScope': scope}, 403)
+    return claims, None
+
+
+def bisect_by(items: List[Any], value: Any, key: Callable[[Any], Any], lo: int = 0, right: bool = False) -> int:
+    """
+    Insertion point of value in items sorted by key(item)
+
+    bisect_left (or bisect_right if right is set) with a key function, which
+    the bisect module only accepts from Python 3.10. Only O(log n) keys are computed.
+    """
+    hi = len(items)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        mid_key = key(items[mid])
+        if mid_key < value or (right and mid_key == value):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
 
 
 def get_current_timestamp() -> str:
@@ -513,47 +1012,355 @@ def get_current_timestamp() -> str:
     return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
 
 
+def parse_instant(value: str) -> datetime:
+    """Parse an ISO 8601 timestamp keeping fractional seconds (naive = UTC)"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+
 # =============================================================================
-# OAuth2 Endpoints
+# Metrics (Prometheus text format, GET /metrics)
 # =============================================================================
 
-@app.route('/oauth/token', methods=['POST'])
-def oauth_token():
-    """Mock OAuth2 token endpoint"""
-    grant_type = request.form.get('grant_type')
-    client_id = request.form.get('client_id')
-    client_secret = request.form.get('client_secret')
+CALCULATION_STAGES = ('load_inputs', 'compile', 'evaluate', 'materialize', 'store')
+
+http_request_duration = metrics.REGISTRY.histogram(
+    'formula_api_http_request_duration_seconds', 'HTTP request latency by endpoint',
+    ('method', 'endpoint', 'status'))
+http_request_size = metrics.REGISTRY.histogram(
+    'formula_api_http_request_size_bytes', 'HTTP request body size by endpoint',
+    ('method', 'endpoint'), metrics.SIZE_BUCKETS)
+http_response_size = metrics.REGISTRY.histogram(
+    'formula_api_http_response_size_bytes', 'HTTP response body size by endpoint',
+    ('method', 'endpoint'), metrics.SIZE_BUCKETS)
+http_requests_in_flight = metrics.REGISTRY.gauge(
+    'formula_api_http_requests_in_flight', 'Requests currently being served')
+
+calculation_stage_duration = metrics.REGISTRY.histogram(
+    'formula_api_calculation_stage_seconds', 'Calculation time per stage', ('stage',))
+calculations_total = metrics.REGISTRY.counter(
+    'formula_api_calculations_total', 'Calculations by evaluation path and final status', ('path', 'status'))
+calculation_formula_nodes = metrics.REGISTRY.histogram(
+    'formula_api_calculation_formula_nodes', 'Formula node count per calculation', (), metrics.COUNT_BUCKETS)
+calculation_missing_intervals_total = metrics.REGISTRY.counter(
+    'formula_api_calculation_missing_intervals_total', 'Missing input intervals found before calculation, by gap strategy',
+    ('strategy',))
+formula_admissions_total = metrics.REGISTRY.counter(
+    'formula_api_formula_admissions_total', 'FormulaLocation complexity checks by result (accepted, flagged, rejected)',
+    ('result',))
+
+
+def _store_sizes() -> Dict[Tuple[str, ...], float]:
+    return {
+        ('formulas',): len(formula_location_store),
+        ('formula_time_slices',): len(formula_time_slice_store),
+        ('time_series',): len(time_series_store),
+        ('calculations',): len(calculation_store),
+        ('transactions',): len(transaction_store),
+    }
 
-    if grant_type != 'client_credentials':
-        return jsonify({'error': 'unsupported_grant_type'}), 400
 
-    if not client_id or not client_secret:
-        return jsonify({'error': 'invalid_client'}), 401
+def _stored_intervals() -> Dict[Tuple[str, ...], float]:
+    return {(): sum(len(ts.get('intervals', [])) for ts in time_series_store.values())}
 
-    token = f'mock_token_{uuid.uuid4().hex}'
-    valid_tokens.add(token)
 
-    return jsonify({
-        'access_token': token,
-        'token_type': 'Bearer',
-        'expires_in': 3600,
-        'scope': 'formula.read formula.write timeseries.read timeseries.write calculations.execute'
-    })
+def _functools_cache_stats(info) -> Tuple[int, int, int, int]:
+    # Every miss inserts an entry, so entries beyond the current size were evicted
+    return info.currsize, info.hits, info.misses, info.misses - info.currsize
+
+
+def _cache_stats() -> Dict[str, Tuple[int, int, int, int]]:
+    """(entries, hits, misses, evictions) per cache"""
+    stats = {name: (len(cache), cache.hits, cache.misses, cache.evictions)
+             for name, cache in (('compiled_formula', _compiled_formula_cache),
+                                 ('calculation_result', calculation_result_cache))}
+    stats['access_token'] = _functools_cache_stats(access_tokens.cache_info())
+    return stats
+
+
+def _meter_buffers() -> Dict[Tuple[str, ...], float]:
+    return {(): sum(len(writer.pending) for writer in list(meter_writers.values()))}
+
+
+metrics.REGISTRY.gauge('formula_api_store_records', 'Records per in-memory store', ('store',), _store_sizes)
+metrics.REGISTRY.gauge('formula_api_time_series_intervals', 'Intervals held by stored time series', (), _stored_intervals)
+metrics.REGISTRY.gauge('formula_api_cache_entries', 'Entries per cache', ('cache',),
+                       lambda: {(name,): stats[0] for name, stats in _cache_stats().items()})
+metrics.REGISTRY.counter('formula_api_cache_requests_total', 'Cache lookups by result', ('cache', 'result'),
+                         lambda: {key: value for name, stats in _cache_stats().items()
+                                  for key, value in (((name, 'hit'), stats[1]), ((name, 'miss'), stats[2]))})
+metrics.REGISTRY.counter('formula_api_cache_evictions_total', 'Entries evicted per cache', ('cache',),
+                         lambda: {(name,): stats[3] for name, stats in _cache_stats().items()})
+metrics.REGISTRY.gauge('formula_api_meter_buffer_pending_values', 'Metering values buffered but not yet published',
+                       (), _meter_buffers)
+metrics.REGISTRY.gauge('formula_api_location_ids', 'Distinct location IDs interned by the ID registry', (),
+                       lambda: {(): len(location_ids)})
+
+
+def observe_calculation(status: str, timings: Dict[str, Any]) -> None:
+    """Record a finished calculation: stage timings, evaluation path and formula size"""
+    for stage in CALCULATION_STAGES:
+        if stage in timings:
+            calculation_stage_duration.observe(timings[stage], stage)
+
+    compiled = timings.get('compiled')
+    if compiled is None:
+        path = 'none'
+    else:
+        path = 'vectorized' if compiled.vectorized else 'interpreter'
+        calculation_formula_nodes.observe(compiled.node_count)
+    calculations_total.inc(path, status)
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    http_requests_in_flight.inc()
+
+
+@app.after_request
+def record_request_metrics(response: Response) -> Response:
+    # Label by route pattern, not path, to keep the number of series bounded
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    http_request_duration.observe(time.perf_counter() - g.request_started,
+                                  request.method, endpoint, str(response.status_code))
+    http_request_size.observe(request.content_length or 0, request.method, endpoint)
+    if response.content_length is not None:
+        http_response_size.observe(response.content_length, request.method, endpoint)
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(exc: Optional[BaseException]) -> None:
+    if 'request_started' in g:
+        http_requests_in_flight.dec()
 
 
 # =============================================================================
-# EDI@Energy Formula API - POST /formula/v0.0.1
+# Request Profiling (opt-in, PROFILING=1)
 # =============================================================================
 
-@app.route('/formula/v0.0.1', methods=['POST'])
-def submit_formula_edi():
+def profiled(name: str) -> Callable:
     """
-    EDI@Energy compliant formula submission endpoint
+    Profile a view with cProfile when profiling.should_profile selects the request
 
-    Headers (required):
-        - transactionId: UUID RFC4122
-        - creationDateTime: ISO 8601 timestamp
-        - initialTransactionId: (optional) for retry/idempotency
+    Profiled responses carry the X-Profile-Id header. Without PROFILING=1 the
+    view is returned undecorated, so disabled profiling costs nothing.
+    """
+    def decorator(view: Callable) -> Callable:
+        if not profiling.ENABLED:
+            return view
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            trigger = profiling.should_profile(request.headers.get(profiling.HEADER))
+            if trigger is None:
+                return view(*args, **kwargs)
+
+            body = request.get_json(silent=True)
+            location_id = (body.get('maloId') or body.get('neloId')) if isinstance(body, dict) else None
+            result, profile_id = profiling.run_profiled(
+                name, view, *args, metadata={'trigger': trigger, 'locationId': location_id}, **kwargs
+            )
+            response = app.make_response(result)
+            if profile_id is not None:
+                response.headers[profiling.ID_HEADER] = profile_id
+            return response
+
+        return wrapper
+    return decorator
+
+
+def profile_listing() -> Dict[str, Any]:
+    """Body for GET /admin/profiles"""
+    return {
+        'enabled': profiling.ENABLED,
+        'sampleRate': profiling.SAMPLE_RATE,
+        'profiles': profiling.profile_store.summaries()
+    }
+
+
+def render_profile(profile_id: str, output_format: str) -> Tuple[Optional[str], int]:
+    """
+    Stored profile as collapsed stacks (flamegraph input) or pstats text
+
+    Returns:
+        (text or error message, status_code)
+    """
+    stored = profiling.profile_store.get(profile_id)
+    if stored is None:
+        return f'Profile {profile_id} not found', 404
+    if output_format == 'collapsed':
+        return profiling.render_collapsed(stored[1]), 200
+    if output_format == 'text':
+        return profiling.render_text(stored[1]), 200
+    return 'format must be collapsed or text', 400
+
+
+@app.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    """List captured request profiles (newest first)"""
+    _, denied = authorize(request.headers.get('Authorization'), 'admin')
+    if denied is not None:
+        return jsonify(denied[0]), denied[1]
+
+    return jsonify(profile_listing())
+
+
+@app.route('/admin/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """
+    Get a captured profile
+
+    format=collapsed (default) returns collapsed stacks in microseconds for
+    flamegraph.pl, speedscope or inferno; format=text a pstats report.
+    """
+    _, denied = authorize(request.headers.get('Authorization'), 'admin')
+    if denied is not None:
+        return jsonify(denied[0]), denied[1]
+
+    text, status_code = render_profile(profile_id, request.args.get('format', 'collapsed'))
+    if status_code != 200:
+        return jsonify({'error': 'Not Found' if status_code == 404 else 'Bad Request', 'message': text}), status_code
+    return Response(text, mimetype='text/plain')
+
+
+# =============================================================================
+# Rate Limits and Fair Calculation Scheduling (see scheduling.py)
+# =============================================================================
+
+calculation_queue_wait = metrics.REGISTRY.histogram(
+    'formula_api_calculation_queue_wait_seconds', 'Time calculations waited for an execution slot')
+
+metrics.REGISTRY.counter('formula_api_rate_limited_requests_total', 'Submissions rejected by the rate limit per client',
+                         ('client',), lambda: {(client,): count for client, count
+                                               in list(scheduling.submission_limits.throttled.items())})
+metrics.REGISTRY.counter('formula_api_calculation_queue_rejections_total',
+                         'Calculations rejected by the fair queue (queue_full, timeout, disconnected)', ('reason',),
+                         lambda: {(reason,): count for reason, count in list(scheduling.calculation_queue.rejected.items())})
+metrics.REGISTRY.gauge('formula_api_calculation_queue_depth', 'Calculations waiting for an execution slot', (),
+                       lambda: {(): scheduling.calculation_queue.depth()})
+metrics.REGISTRY.gauge('formula_api_calculation_queue_clients', 'Clients with calculations waiting', (),
+                       lambda: {(): scheduling.calculation_queue.queued_clients()})
+metrics.REGISTRY.gauge('formula_api_calculation_slots_busy', 'Execution slots in use (of CALCULATION_CONCURRENCY)', (),
+                       lambda: {(): scheduling.calculation_queue.busy})
+
+
+def throttled_body(e: scheduling.Throttled) -> Dict[str, Any]:
+    """Body of 429 responses"""
+    return {'error': 'Too Many Requests', 'message': str(e), 'reason': e.reason,
+            'retryAfter': int(e.retry_after_header)}
+
+
+@app.errorhandler(scheduling.Throttled)
+def too_many_requests(e: scheduling.Throttled):
+    return jsonify(throttled_body(e)), 429, {'Retry-After': e.retry_after_header}
+
+
+def admit_submission(claims: access_tokens.TokenClaims) -> str:
+    """
+    Charge a submission request to its client's rate limit
+
+    Args:
+        claims: The request's token claims as returned by authorize
+
+    Returns:
+        The token's client ID
+
+    Raises:
+        scheduling.Throttled: The client exceeded RATE_LIMIT_RATE
+    """
+    client_id = claims.client_id
+    retry_after = scheduling.submission_limits.acquire(client_id)
+    if retry_after:
+        raise scheduling.Throttled(f'Rate limit of {scheduling.RATE_LIMIT_RATE:g} requests/s exceeded',
+                                   retry_after, 'rate_limit')
+    return client_id
+
+
+@contextlib.contextmanager
+def calculation_slot(client_id: Optional[str], cost: Callable[[], Optional[float]],
+                     timeout: Optional[float] = scheduling.CALCULATION_QUEUE_TIMEOUT, bounded: bool = True):
+    """
+    Hold one of the CALCULATION_CONCURRENCY execution slots, waiting in fair
+    queuing order while all are busy (client_id None: run unscheduled)
+
+    Raises:
+        scheduling.Throttled: The client's queue is full or no slot was granted within timeout
+    """
+    if client_id is None:
+        yield
+        return
+
+    granted = threading.Event()
+    ticket = scheduling.calculation_queue.submit(client_id, cost, granted.set, bounded)
+    if not ticket.granted and not granted.wait(timeout) and not scheduling.calculation_queue.cancel(ticket):
+        raise scheduling.Throttled(f'No calculation slot available within {timeout:g}s', 1.0, 'timeout')
+    calculation_queue_wait.observe(time.monotonic() - ticket.queued_at)
+    try:
+        yield
+    finally:
+        scheduling.calculation_queue.release(ticket)
+
+
+# =============================================================================
+# OAuth2 Endpoints
+# =============================================================================
+
+def issue_token(grant_type: Optional[str], client_id: Optional[str],
+                client_secret: Optional[str], scope: Optional[str] = None) -> Tuple[Dict[str, Any], int]:
+    """
+    Issue a signed OAuth2 token (client_credentials grant), returns (response_body, status_code)
+
+    Without a scope parameter the token carries access_tokens.DEFAULT_SCOPES
+    (all but admin).
+    """
+    if grant_type != 'client_credentials':
+        return {'error': 'unsupported_grant_type'}, 400
+
+    if not client_id or not client_secret:
+        return {'error': 'invalid_client'}, 401
+
+    scopes = scope.split() if scope else list(access_tokens.DEFAULT_SCOPES)
+    unknown = [s for s in scopes if s not in access_tokens.SCOPES]
+    if unknown or not scopes:
+        return {'error': 'invalid_scope', 'error_description': f'Unknown scope: {" ".join(unknown)}'}, 400
+
+    granted = [s for s in access_tokens.SCOPES if s in scopes]
+    return {
+        'access_token': access_tokens.issue(client_id, granted),
+        'token_type': 'Bearer',
+        'expires_in': access_tokens.TTL,
+        'scope': ' '.join(granted)
+    }, 200
+
+
+@app.route('/oauth/token', methods=['POST'])
+def oauth_token():
+    """Mock OAuth2 token endpoint"""
+    response, status_code = issue_token(
+        request.form.get('grant_type'),
+        request.form.get('client_id'),
+        request.form.get('client_secret'),
+        request.form.get('scope')
+    )
+    return jsonify(response), status_code
+
+
+# =============================================================================
+# EDI@Energy Formula API - POST /formula/v0.0.1
+# =============================================================================
+
+@app.route('/formula/v0.0.1', methods=['POST'])
+@profiled('submit_formula_edi')
+def submit_formula_edi():
+    """
+    EDI@Energy compliant formula submission endpoint
+
+    Headers (required):
+        - transactionId: UUID RFC4122
+        - creationDateTime: ISO 8601 timestamp
+        - initialTransactionId: (optional) for retry/idempotency
 
     Request Body: FormulaLocation
         - maloId OR neloId (required, oneOf)
@@ -566,37 +1373,78 @@ def submit_formula_edi():
         - 405: Method Not Allowed
         - 500: Internal Server Error
     """
+    response, status_code = handle_formula_submission(request.headers, lambda: request.json)
+    return jsonify(response), status_code
+
+
+def handle_formula_submission(header_values: Any, load_body: Callable[[], Any]) -> Tuple[Dict[str, Any], int]:
+    """
+    Process a POST /formula/v0.0.1 submission independent of the web framework
+
+    Args:
+        header_values: Mapping with the EDI@Energy headers
+        load_body: Returns the parsed JSON body; only called once headers are
+            valid and the request is not an idempotent retry
+
+    Returns:
+        (response_body, status_code)
+    """
     # Validate headers
-    is_valid, error_msg, headers = validate_headers()
+    is_valid, error_msg, headers = validate_edi_headers(header_values)
     if not is_valid:
-        return jsonify({
+        return {
             'error': 'Bad Request',
             'message': error_msg,
-            'transactionId': request.headers.get('transactionId', 'unknown')
-        }), 400
+            'transactionId': header_values.get('transactionId', 'unknown')
+        }, 400
 
     # Check for idempotency (initialTransactionId)
     initial_tx_id = headers.get('initialTransactionId')
-    if initial_tx_id and initial_tx_id in transaction_store:
+    cached = transaction_store.get(initial_tx_id) if initial_tx_id else None
+    if cached:
         # Return cached response for retry
-        cached = transaction_store[initial_tx_id]
-        return jsonify(cached['response']), cached['status_code']
+        return cached['response'], cached['status_code']
 
     # Parse request body
     try:
-        data = request.json
+        data = load_body()
         if not data:
-            return jsonify({
+            return {
                 'error': 'Bad Request',
                 'message': 'Request body is required',
                 'transactionId': headers['transactionId']
-            }), 400
+            }, 400
     except Exception as e:
-        return jsonify({
+        return {
             'error': 'Bad Request',
             'message': f'Invalid JSON: {str(e)}',
             'transactionId': headers['transactionId']
-        }), 400
+        }, 400
+
+    return store_formula_location(data, headers)
+
+
+def store_formula_location(data: Dict[str, Any], headers: Dict[str, str]) -> Tuple[Dict[str, Any], int]:
+    """
+    Validate and store a FormulaLocation (shared by single and bulk submission)
+
+    Args:
+        data: FormulaLocation request body
+        headers: Validated EDI@Energy headers (see validate_edi_headers)
+
+    Returns:
+        (response_body, status_code)
+    """
+    # Complexity limits first: structural validation recurses per nesting level
+    complexity, limit_errors, limit_warnings = assess_formula_location(data)
+    if limit_errors:
+        formula_admissions_total.inc('rejected')
+        return {
+            'error': 'Bad Request',
+            'message': 'Formula exceeds complexity limits',
+            'transactionId': headers['transactionId'],
+            'validationErrors': limit_errors
+        }, 400
 
     # Validate FormulaLocation structure
     validation_errors = validate_formula_location(data)
@@ -607,16 +1455,33 @@ def submit_formula_edi():
             'transactionId': headers['transactionId'],
             'validationErrors': validation_errors
         }
-        return jsonify(response), 400
+        return response, 400
 
-    # Store the formula
+    # Store the formula as the location's next version, sharing one string per location ID
+    # and one instance per time slice with the earlier versions
+    intern_location_ids(data)
     location_id = data.get('maloId') or data.get('neloId')
-    formula_location_store[location_id] = {
-        'data': data,
+    time_slice_keys = intern_time_slices(data, complexity)
+    with formula_location_store.lock(location_id):
+        previous = formula_location_store.get(location_id)
+        stored = {
+            'data': data,
+            'version': previous['version'] + 1 if previous else 1,
+            'complexity': complexity,
+            'timeSlices': time_slice_keys,
+            'transactionId': headers['transactionId'],
+            'creationDateTime': headers['creationDateTime'],
+            'acceptedAt': get_current_timestamp()
+        }
+        record_formula_version(location_id, previous, stored)
+        formula_location_store[location_id] = stored
+    formula_admissions_total.inc('flagged' if limit_warnings else 'accepted')
+    notifications.broker.publish('formula.accepted', {
+        'locationId': location_id,
+        'version': stored['version'],
         'transactionId': headers['transactionId'],
-        'creationDateTime': headers['creationDateTime'],
-        'acceptedAt': get_current_timestamp()
-    }
+        'timeSlicesAccepted': len(time_slice_keys)
+    })
 
     # Build success response
     response = {
@@ -629,11 +1494,14 @@ def submit_formula_edi():
         'validationResults': [
             {
                 'timeSliceId': ts['timeSliceId'],
-                'valid': True
+                'valid': True,
+                'complexity': {key: value for key, value in assessed.items() if key != 'timeSliceId'}
             }
-            for ts in data['calculationFormulaTimeSlices']
+            for ts, assessed in zip(data['calculationFormulaTimeSlices'], complexity)
         ]
     }
+    if limit_warnings:
+        response['warnings'] = limit_warnings
 
     # Store transaction for idempotency
     transaction_store[headers['transactionId']] = {
@@ -641,7 +1509,7 @@ def submit_formula_edi():
         'status_code': 202
     }
 
-    return jsonify(response), 202
+    return response, 202
 
 
 @app.route('/formula/v0.0.1', methods=['GET', 'PUT', 'DELETE', 'PATCH'])
@@ -655,111 +1523,1574 @@ def formula_method_not_allowed():
 
 
 # =============================================================================
-# Formula Query Endpoints (Additional, not in EDI@Energy spec)
+# Formula Version History
+# =============================================================================
+
+# Every accepted FormulaLocation becomes the next version of its location.
+# Versions list their time slices by content hash and the slices are stored
+# once in formula_time_slice_store: resubmitting a location with one changed
+# time slice adds that slice only, and all versions (and the current record)
+# share the instances of the unchanged ones. Calculations select a version
+# with asOf, so recalculations use the formula as it stood then.
+
+
+def intern_time_slices(data: Dict[str, Any], complexity: List[Dict[str, Any]]) -> List[str]:
+    """
+    Replace the time slices of a validated FormulaLocation in place by their shared instances
+
+    Returns:
+        Content hashes of the time slices in submission order
+    """
+    time_slices = data['calculationFormulaTimeSlices']
+    keys = []
+    for index, (time_slice, assessed) in enumerate(zip(time_slices, complexity)):
+        key = formula_hash(time_slice)
+        shared = formula_time_slice_store.get(key)
+        if shared is None:
+            shared = formula_time_slice_store.put_if_absent(key, {
+                'timeSlice': time_slice,
+                'formulaHash': formula_hash(time_slice['calculationFormula']),
+                'complexity': assessed
+            })
+        time_slices[index] = shared['timeSlice']
+        keys.append(key)
+    return keys
+
+
+def formula_version_entry(stored: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """History entry of a stored formula: its time slices by hash, the other FormulaLocation fields shared with the previous entry if unchanged"""
+    location = {field: value for field, value in stored['data'].items() if field != 'calculationFormulaTimeSlices'}
+    if previous is not None and previous['location'] == location:
+        location = previous['location']
+    return {
+        'version': stored['version'],
+        'location': location,
+        'timeSlices': stored['timeSlices'],
+        'transactionId': stored['transactionId'],
+        'creationDateTime': stored['creationDateTime'],
+        'acceptedAt': stored['acceptedAt']
+    }
+
+
+def record_formula_version(location_id: str, previous: Optional[Dict[str, Any]], stored: Dict[str, Any]) -> None:
+    """Append a newly stored formula to the location's history (location lock held)"""
+    versions = formula_version_store.get(location_id)
+    if versions is None:
+        versions = []
+        if previous is not None:
+            # Stored before version history was kept: it becomes the first entry
+            data = {**previous['data'],
+                    'calculationFormulaTimeSlices': list(previous['data']['calculationFormulaTimeSlices'])}
+            complexity = previous.get('complexity')
+            if not complexity or len(complexity) != len(data['calculationFormulaTimeSlices']):
+                complexity = assess_formula_location(data)[0]
+            previous = {**previous, 'data': data, 'timeSlices': intern_time_slices(data, complexity)}
+            versions.append(formula_version_entry(previous))
+    formula_version_store[location_id] = [*versions, formula_version_entry(stored, versions[-1] if versions else None)]
+
+
+def formula_version_record(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Rebuild the stored formula record of a history entry from the shared time slices"""
+    shared = [formula_time_slice_store.get(key) for key in entry['timeSlices']]
+    return {
+        'data': {**entry['location'], 'calculationFormulaTimeSlices': [item['timeSlice'] for item in shared]},
+        'version': entry['version'],
+        'complexity': [item['complexity'] for item in shared],
+        'timeSlices': entry['timeSlices'],
+        'transactionId': entry['transactionId'],
+        'creationDateTime': entry['creationDateTime'],
+        'acceptedAt': entry['acceptedAt']
+    }
+
+
+def formula_as_of(location_id: Optional[str], as_of: Any = None) -> Optional[Dict[str, Any]]:
+    """
+    Stored formula of a location as of a version
+
+    Args:
+        as_of: Version number, ISO 8601 timestamp (the version accepted last
+            at or before it) or None for the current version
+
+    Returns:
+        The stored formula record, None if the location or version is unknown
+
+    Raises:
+        ValueError: as_of is neither a positive integer nor a timestamp
+    """
+    current = formula_location_store.get(location_id)
+    if as_of is None or current is None:
+        return current
+
+    # Records restored from before version history was kept have no entries
+    versions = formula_version_store.get(location_id) or [current]
+    if isinstance(as_of, int) and not isinstance(as_of, bool) and as_of > 0:
+        index = as_of - versions[0]['version']
+        if not 0 <= index < len(versions):
+            return None
+    elif isinstance(as_of, str):
+        try:
+            moment = parse_instant(as_of)
+        except (TypeError, AttributeError) as e:
+            raise ValueError(str(e)) from e
+        index = bisect_by(versions, moment, lambda entry: parse_instant(entry['acceptedAt']), right=True) - 1
+        if index < 0:
+            return None
+    else:
+        raise ValueError('asOf must be a version number or an ISO 8601 timestamp')
+
+    entry = versions[index]
+    return current if entry['version'] == current['version'] else formula_version_record(entry)
+
+
+def time_slice_formula_key(stored_formula: Dict[str, Any], index: int) -> str:
+    """Content hash of a stored time slice's calculationFormula (recorded at submission, computed for older records)"""
+    keys = stored_formula.get('timeSlices')
+    shared = formula_time_slice_store.get(keys[index]) if keys else None
+    if shared is not None:
+        return shared['formulaHash']
+    return formula_hash(stored_formula['data']['calculationFormulaTimeSlices'][index]['calculationFormula'])
+
+
+# =============================================================================
+# Formula Query Endpoints (Additional, not in EDI@Energy spec)
+# =============================================================================
+
+@app.route('/formulas', methods=['GET'])
+def list_formulas():
+    """List all stored formulas (convenience endpoint)"""
+    _, denied = authorize(request.headers.get('Authorization'), 'formula.read')
+    if denied is not None:
+        return jsonify(denied[0]), denied[1]
+
+    formulas = []
+    for location_id, stored in formula_location_store.items():
+        formulas.append({
+            'locationId': location_id,
+            'locationType': 'maloId' if stored['data'].get('maloId') else 'neloId',
+            'timeSliceCount': len(stored['data']['calculationFormulaTimeSlices']),
+            'version': stored['version'],
+            'transactionId': stored['transactionId'],
+            'acceptedAt': stored['acceptedAt']
+        })
+
+    return jsonify({
+        'formulas': formulas,
+        'totalCount': len(formulas)
+    })
+
+
+@app.route('/formulas/<location_id>', methods=['GET'])
+def get_formula(location_id):
+    """Get specific formula by location ID"""
+    _, denied = authorize(request.headers.get('Authorization'), 'formula.read')
+    if denied is not None:
+        return jsonify(denied[0]), denied[1]
+
+    as_of = request.args.get('asOf')
+    try:
+        stored = formula_as_of(location_id, int(as_of) if as_of and as_of.isdigit() else as_of)
+    except ValueError:
+        return jsonify({
+            'error': 'Bad Request',
+            'message': 'asOf must be a version number or an ISO 8601 timestamp'
+        }), 400
+    if stored is None:
+        return jsonify({'error': 'Not found'}), 404
+
+    return jsonify({
+        'locationId': location_id,
+        'formulaLocation': stored['data'],
+        'version': stored['version'],
+        'complexity': stored.get('complexity', []),
+        'transactionId': stored['transactionId'],
+        'acceptedAt': stored['acceptedAt']
+    })
+
+
+@app.route('/formulas/<location_id>/versions', methods=['GET'])
+def list_formula_versions(location_id):
+    """List the stored versions of a formula, oldest first"""
+    _, denied = authorize(request.headers.get('Authorization'), 'formula.read')
+    if denied is not None:
+        return jsonify(denied[0]), denied[1]
+
+    current = formula_location_store.get(location_id)
+    if current is None:
+        return jsonify({'error': 'Not found'}), 404
+
+    versions = []
+    previous_keys: set = set()
+    for entry in formula_version_store.get(location_id) or [current]:
+        # Records stored before version history was kept list no time slice hashes
+        keys = entry.get('timeSlices') or list(range(len(current['data']['calculationFormulaTimeSlices'])))
+        versions.append({
+            'version': entry['version'],
+            'timeSliceCount': len(keys),
+            'changedTimeSlices': sum(1 for key in keys if key not in previous_keys),
+            'transactionId': entry['transactionId'],
+            'acceptedAt': entry['acceptedAt']
+        })
+        previous_keys = set(keys)
+
+    return jsonify({
+        'locationId': location_id,
+        'currentVersion': current['version'],
+        'versions': versions,
+        'totalCount': len(versions)
+    })
+
+
+# =============================================================================
+# Bulk Formula Import (Additional, not in EDI@Energy spec)
+# =============================================================================
+
+BULK_IMPORT_MAX_RECORDS = 10000
+
+
+def import_formula_record(record: Any) -> Dict[str, Any]:
+    """
+    Import a single bulk record
+
+    A record is an envelope carrying the EDI@Energy headers of one submission:
+        {"transactionId": ..., "creationDateTime": ..., "initialTransactionId": ...,
+         "formulaLocation": {...}}
+
+    Records whose transactionId (or initialTransactionId) was already processed
+    return the stored response and are reported as duplicates.
+
+    Returns:
+        Per-record result (status: accepted | rejected | duplicate)
+    """
+    rejection, headers = check_formula_record(record)
+    if rejection:
+        return rejection
+    data = record['formulaLocation']
+
+    # Hold the transaction's stripe lock so concurrent imports of the same
+    # record cannot both pass the duplicate check
+    with transaction_store.lock(headers['transactionId']):
+        for tx_id in (headers['transactionId'], headers.get('initialTransactionId')):
+            cached = transaction_store.get(tx_id) if tx_id else None
+            if cached:
+                return {
+                    'status': 'duplicate',
+                    'statusCode': cached['status_code'],
+                    'transactionId': headers['transactionId'],
+                    'locationId': cached['response'].get('locationId')
+                }
+
+        response, status_code = store_formula_location(data, headers)
+    if status_code != 202:
+        return {
+            'status': 'rejected',
+            'statusCode': status_code,
+            'transactionId': headers['transactionId'],
+            'message': response['message'],
+            'validationErrors': response['validationErrors']
+        }
+
+    return {
+        'status': 'accepted',
+        'statusCode': status_code,
+        'transactionId': headers['transactionId'],
+        'locationId': response['locationId']
+    }
+
+
+@app.route('/formulas/bulk', methods=['POST'])
+def bulk_import_formulas():
+    """
+    Bulk FormulaLocation import
+
+    Request Body: NDJSON (application/x-ndjson), one record envelope per line
+    (see import_formula_record). Each record is validated and stored
+    independently, so one invalid record does not reject the batch.
+
+    Response Codes:
+        - 200: Batch processed, see per-record results
+        - 400: Body missing or too many records
+        - 401: Unauthorized
+    """
+    claims, denied = authorize(request.headers.get('Authorization'), 'formula.write')
+    if denied is not None:
+        return jsonify(denied[0]), denied[1]
+    admit_submission(claims)
+
+    lines = [line for line in request.get_data().splitlines() if line.strip()]
+    if not lines:
+        return jsonify({'error': 'Bad Request', 'message': 'Request body is required'}), 400
+
+    if len(lines) > BULK_IMPORT_MAX_RECORDS:
+        return jsonify({
+            'error': 'Bad Request',
+            'message': f'At most {BULK_IMPORT_MAX_RECORDS} records per request'
+        }), 400
+
+    results = []
+    counts = {'accepted': 0, 'rejected': 0, 'duplicate': 0}
+
+    for line_no, line in enumerate(lines, start=1):
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            result = {'status': 'rejected', 'statusCode': 400, 'message': f'Invalid JSON: {e}'}
+        else:
+            result = import_formula_record(record)
+
+        result['line'] = line_no
+        counts[result['status']] += 1
+        results.append(result)
+
+    return jsonify({
+        'acceptanceTime': get_current_timestamp(),
+        'recordCount': len(lines),
+        'acceptedCount': counts['accepted'],
+        'rejectedCount': counts['rejected'],
+        'duplicateCount': counts['duplicate'],
+        'results': results
+    })
+
+
+# =============================================================================
+# Time Series Storage
+# =============================================================================
+
+# Called as listener(time_series_id, old_series, new_series, changed_intervals)
+# after every write; changed_intervals is None when the whole series was replaced
+TimeSeriesListener = Callable[[str, Optional[Dict[str, Any]], Dict[str, Any], Optional[List[Dict[str, Any]]]], None]
+
+time_series_listeners: List[TimeSeriesListener] = []
+
+# Series fields holding location IDs (interned, indexed by TimeSeriesLocationIndex)
+LOCATION_FIELDS = ('marketLocationId', 'meterLocationId')
+
+
+def put_time_series(ts_id: str, ts: Dict[str, Any], changed: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Publish a time series as its next version and notify listeners
+
+    Holds the series' stripe lock so listeners see writes to the same series
+    in order and always receive the series that was actually replaced.
+    Every write stamps a per-series version (1, 2, ...) that derived data
+    such as cached calculation results is keyed on.
+
+    Args:
+        ts_id: Time series ID
+        ts: Complete new series
+        changed: Intervals added or replaced by an append (None = full replacement)
+
+    Returns:
+        The published series (ts with its version)
+    """
+    with time_series_store.lock(ts_id):
+        old = time_series_store.get(ts_id)
+        ts = {**ts, 'version': old.get('version', 0) + 1 if old else 1}
+        for field in LOCATION_FIELDS:
+            if isinstance(ts.get(field), str):
+                ts[field] = location_ids.intern(ts[field])
+        time_series_store.put(ts_id, ts)
+        for listener in time_series_listeners:
+            listener(ts_id, old, ts, changed)
+        return ts
+
+
+class TimeSeriesLocationIndex:
+    """
+    Series IDs per (location field, location key) for location queries
+
+    Location keys are the integer keys of location_ids. Members are kept in
+    insertion-ordered dicts, so query results keep the order series were stored in.
+    """
+
+    def __init__(self) -> None:
+        self._members: Dict[Tuple[int, int], Dict[str, None]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entries(ts: Optional[Dict[str, Any]]) -> List[Tuple[int, int]]:
+        if not ts:
+            return []
+        return [(position, location_ids.key(ts[field]))
+                for position, field in enumerate(LOCATION_FIELDS) if isinstance(ts.get(field), str)]
+
+    def update_series(self, ts_id: str, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]],
+                      changed: Optional[List[Dict[str, Any]]] = None) -> None:
+        """Time series listener: move the series to the entries of its new locations"""
+        old_entries = self._entries(old)
+        new_entries = self._entries(new)
+        if old_entries == new_entries:
+            return
+
+        with self._lock:
+            for entry in old_entries:
+                members = self._members.get(entry)
+                if members is not None:
+                    members.pop(ts_id, None)
+                    if not members:
+                        del self._members[entry]
+            for entry in new_entries:
+                self._members.setdefault(entry, {})[ts_id] = None
+
+    def series_ids(self, field: str, location_id: str) -> List[str]:
+        """IDs of the series whose field equals location_id, in storage order"""
+        key = location_ids.lookup(location_id)
+        if key is None:
+            return []
+        with self._lock:
+            return list(self._members.get((LOCATION_FIELDS.index(field), key), ()))
+
+
+time_series_locations = TimeSeriesLocationIndex()
+time_series_listeners.append(time_series_locations.update_series)
+
+
+# =============================================================================
+# Balancing Group Aggregation
+# =============================================================================
+
+AGGREGATION_TYPES = ('CONSUMPTION', 'GENERATION', 'FEED_IN', 'WITHDRAWAL')
+AGGREGATION_SLOT_SECONDS = 900                                # PT15M grid
+AGGREGATION_SLOTS_PER_DAY = 86400 // AGGREGATION_SLOT_SECONDS
+
+DayColumns = Dict[int, Tuple[array, array]]   # UTC day epoch -> (96 slot values, present flags)
+
+
+def day_columns(intervals: List[Dict[str, Any]]) -> DayColumns:
+    """Split PT15M intervals into per-day slot columns (values, present flags)"""
+    days: DayColumns = {}
+    # Contiguous intervals start where the previous one ended: parse that timestamp once
+    previous_end_text, previous_end = None, 0
+    for interval in intervals:
+        try:
+            start_text = interval['start']
+            if previous_end_text is not None and start_text == previous_end_text:
+                start = previous_end
+            else:
+                start = timeseries_codec.parse_timestamp(start_text)
+            end = timeseries_codec.parse_timestamp(interval['end'])
+            value = float(interval.get('quantity', 0))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+        previous_end_text, previous_end = interval['end'], end
+        if end - start != AGGREGATION_SLOT_SECONDS or start % AGGREGATION_SLOT_SECONDS:
+            continue
+        day = start - start % 86400
+        column = days.get(day)
+        if column is None:
+            column = days[day] = (array('d', bytes(8 * AGGREGATION_SLOTS_PER_DAY)),
+                                  array('l', bytes(array('l').itemsize * AGGREGATION_SLOTS_PER_DAY)))
+        slot = (start - day) // AGGREGATION_SLOT_SECONDS
+        column[0][slot] = value
+        column[1][slot] = 1
+    return days
+
+
+def overlay_day_columns(days: DayColumns, changed: List[Dict[str, Any]]) -> Tuple[DayColumns, List[int]]:
+    """
+    Copy-on-write overlay of changed intervals onto existing day columns
+
+    Returns:
+        (new day columns sharing untouched days, touched days)
+    """
+    updated = dict(days)
+    touched = day_columns(changed)
+    for day, (values, present) in touched.items():
+        old_column = days.get(day)
+        if old_column is None:
+            continue
+        new_values, new_present = array('d', old_column[0]), array('l', old_column[1])
+        for slot in range(AGGREGATION_SLOTS_PER_DAY):
+            if present[slot]:
+                new_values[slot] = values[slot]
+                new_present[slot] = 1
+        touched[day] = (new_values, new_present)
+    updated.update(touched)
+    return updated, sorted(touched)
+
+
+class DayPartial:
+    """Per-slot sums and component counts of one balancing group for one UTC day"""
+
+    __slots__ = ('sums', 'counts')
+
+    def __init__(self, sums: array, counts: array) -> None:
+        self.sums = sums
+        self.counts = counts
+
+
+class BalancingGroupAggregator:
+    """
+    Incrementally maintained balancing group aggregates
+
+    Members are time series carrying a balancingGroupId; the aggregationType
+    is the member's measurementType. Each member contributes a 96-slot column
+    per UTC day, and the aggregator keeps per-day partial sums per
+    (group, aggregationType). When a member changes only the days it touches
+    are updated (subtract old column, add new one), so queries over a month
+    read 30 precomputed partials instead of rescanning member intervals.
+
+    Partials are replaced, never modified in place: readers take no lock.
+    Only PT15M members aligned to the 15-minute grid are aggregated.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # (groupId, aggregationType) -> {day epoch -> DayPartial}
+        self._partials: Dict[Tuple[str, str], Dict[int, DayPartial]] = {}
+        # timeSeriesId -> ((groupId, aggregationType), {day epoch -> (values, present)})
+        self._contributions: Dict[str, Tuple[Tuple[str, str], DayColumns]] = {}
+        self._members: Dict[str, set] = {}
+
+    @staticmethod
+    def series_key(ts: Optional[Dict[str, Any]]) -> Optional[Tuple[str, str]]:
+        if not ts or not ts.get('balancingGroupId') or ts.get('measurementType') not in AGGREGATION_TYPES:
+            return None
+        if ts.get('resolution', 'PT15M') != 'PT15M':
+            return None
+        return ts['balancingGroupId'], ts['measurementType']
+
+    def _apply(self, key: Tuple[str, str], days: Dict[int, Tuple[array, array]], sign: int) -> None:
+        partials = self._partials.setdefault(key, {})
+        combine = operator.add if sign > 0 else operator.sub
+        for day, (values, present) in days.items():
+            partial = partials.get(day)
+            if partial is None:
+                partial = DayPartial(array('d', bytes(8 * AGGREGATION_SLOTS_PER_DAY)),
+                                     array('l', bytes(array('l').itemsize * AGGREGATION_SLOTS_PER_DAY)))
+            sums = array('d', map(combine, partial.sums, values))
+            counts = array('l', map(combine, partial.counts, present))
+            if any(counts):
+                partials[day] = DayPartial(sums, counts)
+            else:
+                partials.pop(day, None)
+
+    def update_series(self, ts_id: str, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]],
+                      changed: Optional[List[Dict[str, Any]]] = None) -> None:
+        """
+        Time series listener: move the series' contribution to its new state
+
+        For appends (changed intervals given) to a series that stays in the
+        same group only the days touched by the changed intervals are redone.
+        """
+        new_key = self.series_key(new)
+        if new_key is None and ts_id not in self._contributions:
+            return
+
+        previous = self._contributions.get(ts_id)
+        if changed is not None and previous and previous[0] == new_key:
+            self._update_days(ts_id, new_key, previous[1], changed)
+            return
+
+        new_days = day_columns(new.get('intervals', [])) if new_key else {}
+
+        with self._lock:
+            previous = self._contributions.pop(ts_id, None)
+            if previous:
+                old_key, old_days = previous
+                self._apply(old_key, old_days, -1)
+                self._members.get(old_key[0], set()).discard(ts_id)
+            if new_key:
+                self._apply(new_key, new_days, +1)
+                self._contributions[ts_id] = (new_key, new_days)
+                self._members.setdefault(new_key[0], set()).add(ts_id)
+
+    def _update_days(self, ts_id: str, key: Tuple[str, str], days: DayColumns,
+                     changed: List[Dict[str, Any]]) -> None:
+        """Overlay changed intervals on the member's day columns, re-apply those days only"""
+        updated, touched = overlay_day_columns(days, changed)
+
+        with self._lock:
+            self._apply(key, {day: days[day] for day in touched if day in days}, -1)
+            self._apply(key, {day: updated[day] for day in touched}, +1)
+            self._contributions[ts_id] = (key, updated)
+
+    def has_group(self, group_id: str) -> bool:
+        return bool(self._members.get(group_id))
+
+    def aggregate(self, group_id: str, aggregation_type: str, period_start: int, period_end: int) -> List[Dict[str, Any]]:
+        """Aggregated intervals in [period_start, period_end) from the day partials"""
+        partials = self._partials.get((group_id, aggregation_type), {})
+        intervals = []
+        day = period_start - period_start % 86400
+
+        while day < period_end:
+            partial = partials.get(day)
+            if partial is not None:
+                sums, counts = partial.sums, partial.counts
+                first = max(0, (period_start - day + AGGREGATION_SLOT_SECONDS - 1) // AGGREGATION_SLOT_SECONDS)
+                last = min(AGGREGATION_SLOTS_PER_DAY, (period_end - day + AGGREGATION_SLOT_SECONDS - 1) // AGGREGATION_SLOT_SECONDS)
+                for slot in range(first, last):
+                    if counts[slot]:
+                        start = day + slot * AGGREGATION_SLOT_SECONDS
+                        intervals.append({
+                            'position': len(intervals) + 1,
+                            'start': timeseries_codec.format_timestamp(start),
+                            'end': timeseries_codec.format_timestamp(start + AGGREGATION_SLOT_SECONDS),
+                            'totalQuantity': f'{sums[slot]:.6f}',
+                            'componentCount': counts[slot]
+                        })
+            day += 86400
+
+        return intervals
+
+
+balancing_group_aggregator = BalancingGroupAggregator()
+time_series_listeners.append(balancing_group_aggregator.update_series)
+
+
+# =============================================================================
+# Time Series Rollups & Downsampling
+# =============================================================================
+
+ROLLUP_RESOLUTIONS = ('PT1H', 'P1D', 'P1M')
+ROLLUP_AGGREGATES = ('sum', 'min', 'max', 'avg')
+DOWNSAMPLE_MIN_POINTS = 3
+
+Stats = Tuple[float, float, float, int]   # (sum, min, max, count)
+
+
+def month_start(epoch: int) -> int:
+    """Epoch of the first instant of the UTC month containing epoch"""
+    moment = datetime.fromtimestamp(epoch, timezone.utc)
+    return int(moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0).timestamp())
+
+
+def bucket_start(epoch: int, resolution: str) -> int:
+    if resolution == 'PT1H':
+        return epoch - epoch % 3600
+    if resolution == 'P1D':
+        return epoch - epoch % 86400
+    return month_start(epoch)
+
+
+def bucket_end(start: int, resolution: str) -> int:
+    if resolution == 'PT1H':
+        return start + 3600
+    if resolution == 'P1D':
+        return start + 86400
+    return month_start(start + 32 * 86400)
+
+
+def merge_stats(stats: List[Stats]) -> Stats:
+    return (sum(s[0] for s in stats), min(s[1] for s in stats),
+            max(s[2] for s in stats), sum(s[3] for s in stats))
+
+
+class SeriesRollups:
+    """Hourly, daily and monthly (sum, min, max, count) buckets of one PT15M series"""
+
+    __slots__ = ('series', 'days', 'buckets')
+
+    def __init__(self, series: Dict[str, Any], days: DayColumns, buckets: Dict[str, Dict[int, Stats]]) -> None:
+        self.series = series      # version of the series these rollups describe
+        self.days = days
+        self.buckets = buckets
+
+
+class TimeSeriesRollups:
+    """
+    Multi-resolution rollups maintained at write time
+
+    Every PT15M series written through put_time_series (submissions, metering
+    appends, calculation outputs) keeps PT1H/P1D/P1M bucket statistics so
+    chart-sized reads do not walk the full interval list. The per-day slot
+    columns are kept as the source of truth: an append only recomputes the
+    hours and days it touches and the months containing them.
+
+    Rollups are replaced, never modified in place: readers take no lock.
+    Series with other resolutions are rolled up on read (rollup_intervals).
+    """
+
+    def __init__(self) -> None:
+        self._rollups: Dict[str, SeriesRollups] = {}
+
+    @staticmethod
+    def _day_stats(day: int, column: Tuple[array, array], hours: Dict[int, Stats], daily: Dict[int, Stats]) -> None:
+        values, present = column
+        day_stats = []
+        for hour in range(24):
+            slots = [values[slot] for slot in range(hour * 4, hour * 4 + 4) if present[slot]]
+            if slots:
+                stats = (sum(slots), min(slots), max(slots), len(slots))
+                hours[day + hour * 3600] = stats
+                day_stats.append(stats)
+            else:
+                hours.pop(day + hour * 3600, None)
+        if day_stats:
+            daily[day] = merge_stats(day_stats)
+        else:
+            daily.pop(day, None)
+
+    def _build(self, series: Dict[str, Any], days: DayColumns, touched: List[int],
+               previous: Optional[SeriesRollups]) -> SeriesRollups:
+        if previous is None:
+            hours: Dict[int, Stats] = {}
+            daily: Dict[int, Stats] = {}
+            monthly: Dict[int, Stats] = {}
+        else:
+            hours = dict(previous.buckets['PT1H'])
+            daily = dict(previous.buckets['P1D'])
+            monthly = dict(previous.buckets['P1M'])
+
+        months = set()
+        for day in touched:
+            self._day_stats(day, days[day], hours, daily)
+            months.add(month_start(day))
+
+        for month in months:
+            end = bucket_end(month, 'P1M')
+            stats = [stats for day, stats in daily.items() if month <= day < end]
+            if stats:
+                monthly[month] = merge_stats(stats)
+            else:
+                monthly.pop(month, None)
+
+        return SeriesRollups(series, days, {'PT1H': hours, 'P1D': daily, 'P1M': monthly})
+
+    def update_series(self, ts_id: str, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]],
+                      changed: Optional[List[Dict[str, Any]]] = None) -> None:
+        """Time series listener: rebuild (replacement) or patch (append) the series' rollups"""
+        if not new or new.get('resolution', 'PT15M') != 'PT15M':
+            self._rollups.pop(ts_id, None)
+            return
+
+        previous = self._rollups.get(ts_id)
+        if changed is not None and previous is not None:
+            days, touched = overlay_day_columns(previous.days, changed)
+            self._rollups[ts_id] = self._build(new, days, touched, previous)
+        else:
+            days = day_columns(new.get('intervals', []))
+            self._rollups[ts_id] = self._build(new, days, sorted(days), None)
+
+    def get(self, ts_id: str, ts: Dict[str, Any]) -> Optional[SeriesRollups]:
+        """Rollups of this version of the series, None if not maintained (yet)"""
+        rollups = self._rollups.get(ts_id)
+        if rollups is None or rollups.series is not ts:
+            return None
+        return rollups
+
+
+time_series_rollups = TimeSeriesRollups()
+time_series_listeners.append(time_series_rollups.update_series)
+
+
+def rollup_intervals(intervals: List[Dict[str, Any]], resolution: str) -> Dict[int, Stats]:
+    """Compute bucket statistics directly from intervals (series without maintained rollups)"""
+    grouped: Dict[int, List[float]] = {}
+    for interval in intervals:
+        try:
+            start = timeseries_codec.parse_timestamp(interval['start'])
+            value = float(interval.get('quantity', 0))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+        grouped.setdefault(bucket_start(start, resolution), []).append(value)
+    return {start: (sum(values), min(values), max(values), len(values)) for start, values in grouped.items()}
+
+
+def downsample_lttb(intervals: List[Dict[str, Any]], points: int) -> List[Dict[str, Any]]:
+    """
+    Largest-Triangle-Three-Buckets downsampling for plotting
+
+    Keeps the first and last interval and, per bucket, the interval forming
+    the largest triangle with the previously kept one and the next bucket's
+    average, which preserves peaks and the visual shape of the series.
+    """
+    n = len(intervals)
+    if points >= n or points < DOWNSAMPLE_MIN_POINTS:
+        return intervals
+
+    xs, ys = [], []
+    for interval in intervals:
+        try:
+            xs.append(timeseries_codec.parse_timestamp(interval['start']))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            xs.append(xs[-1] if xs else 0)
+        try:
+            ys.append(float(interval.get('quantity', 0)))
+        except (TypeError, ValueError):
+            ys.append(0.0)
+
+    every = (n - 2) / (points - 2)
+    sampled = [0]
+    a = 0
+    for i in range(points - 2):
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        span = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / span
+        avg_y = sum(ys[next_start:next_end]) / span
+
+        best, best_area = next_start - 1, -1.0
+        ax, ay = xs[a], ys[a]
+        for j in range(int(i * every) + 1, next_start):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(best)
+        a = best
+    sampled.append(n - 1)
+
+    return [intervals[i] for i in sampled]
+
+
+def time_series_view(ts_id: str, ts: Dict[str, Any], params: Any) -> Tuple[Dict[str, Any], int]:
+    """
+    Apply the read options of GET /v1/time-series/{id} to a stored series
+
+    Query Parameters:
+        - resolution: PT1H, P1D or P1M rollup of the series
+        - aggregate: sum (default), min, max or avg per rollup bucket
+        - periodStart / periodEnd: restrict rollup buckets (ISO 8601, end exclusive)
+        - downsample: maximum number of points, LTTB-downsampled for plotting
+
+    Returns:
+        (response_body, status_code)
+    """
+    resolution = params.get('resolution')
+    downsample = params.get('downsample')
+    if resolution is None and downsample is None:
+        return ts, 200
+
+    view = ts
+    if resolution is not None:
+        aggregate = params.get('aggregate', 'sum')
+        if resolution not in ROLLUP_RESOLUTIONS or aggregate not in ROLLUP_AGGREGATES:
+            return {
+                'error': 'Bad Request',
+                'message': f'resolution must be one of {", ".join(ROLLUP_RESOLUTIONS)}, '
+                           f'aggregate one of {", ".join(ROLLUP_AGGREGATES)}'
+            }, 400
+
+        try:
+            window_start = timeseries_codec.parse_timestamp(params['periodStart']) if params.get('periodStart') else None
+            window_end = timeseries_codec.parse_timestamp(params['periodEnd']) if params.get('periodEnd') else None
+        except ValueError:
+            return {'error': 'Bad Request', 'message': 'periodStart and periodEnd must be ISO 8601'}, 400
+
+        rollups = time_series_rollups.get(ts_id, ts)
+        if rollups is not None:
+            buckets = rollups.buckets[resolution]
+        else:
+            buckets = rollup_intervals(ts.get('intervals', []), resolution)
+
+        intervals = []
+        for start in sorted(buckets):
+            if window_start is not None and start < window_start:
+                continue
+            if window_end is not None and start >= window_end:
+                break
+            total, low, high, count = buckets[start]
+            value = {'sum': total, 'min': low, 'max': high, 'avg': total / count}[aggregate]
+            intervals.append({
+                'position': len(intervals) + 1,
+                'start': timeseries_codec.format_timestamp(start),
+                'end': timeseries_codec.format_timestamp(bucket_end(start, resolution)),
+                'quantity': timeseries_codec.format_quantity(value),
+                'count': count
+            })
+
+        view = {**ts, 'resolution': resolution, 'aggregate': aggregate,
+                'sourceResolution': ts.get('resolution', 'PT15M'), 'intervals': intervals}
+        if intervals:
+            view['period'] = {'start': intervals[0]['start'], 'end': intervals[-1]['end']}
+
+    if downsample is not None:
+        try:
+            points = int(downsample)
+        except ValueError:
+            points = 0
+        if points < DOWNSAMPLE_MIN_POINTS:
+            return {
+                'error': 'Bad Request',
+                'message': f'downsample must be an integer >= {DOWNSAMPLE_MIN_POINTS}'
+            }, 400
+        source = view.get('intervals', [])
+        view = {**view, 'intervals': downsample_lttb(source, points),
+                'downsampled': {'method': 'LTTB', 'points': min(points, len(source)), 'sourceIntervals': len(source)}}
+
+    return view, 200
+
+
+# =============================================================================
+# Metering Point Ingest
+# =============================================================================
+
+METERING_INTERVAL_SECONDS = 900                               # PT15M readings
+METERING_UNIT_FACTORS = {'KWH': 1.0, 'MWH': 1000.0}           # to series unit KWH
+METERING_QUALITIES = ('METERED', 'ESTIMATED', 'SUBSTITUTE', 'FORECASTED', 'VALIDATED', 'MISSING')
+METERING_SERIES_FIELDS = ('measurementType', 'marketLocationId', 'balancingGroupId')
+
+# A meter's buffer is flushed once it holds this many values or its oldest
+# value is this old; reads of the series flush it as well
+METER_BUFFER_MAX_VALUES = int(os.environ.get('METER_BUFFER_MAX_VALUES', '96'))
+METER_BUFFER_MAX_AGE_SECONDS = float(os.environ.get('METER_BUFFER_MAX_AGE_SECONDS', '2.0'))
+
+
+def metering_series_id(metering_point_id: str) -> str:
+    """Time series ID under which a metering point's values are stored"""
+    return f'TS-MP-{metering_point_id}'
+
+
+class MeterSeriesWriter:
+    """
+    Append-optimized write path for one metering point series
+
+    Values are buffered per meter (interval start -> interval) and merged into
+    the published series in batches. The writer keeps a sorted index of the
+    series' interval starts: in-order batches only extend it, late or
+    corrected values are placed by binary search and only the tail from the
+    first affected interval is rebuilt. Unchanged interval dicts are shared
+    with the previous version, so publishing a new version copies references
+    instead of re-creating the series.
+
+    All methods must be called with time_series_store.lock(ts_id) held.
+    """
+
+    __slots__ = ('ts_id', 'metering_point_id', 'pending', 'buffered_since', 'fields', 'starts', 'published')
+
+    def __init__(self, metering_point_id: str) -> None:
+        self.ts_id = metering_series_id(metering_point_id)
+        self.metering_point_id = metering_point_id
+        self.pending: Dict[int, Dict[str, Any]] = {}
+        self.buffered_since = 0.0
+        self.fields: Dict[str, Any] = {}
+        self.starts = array('q')
+        self.published: Optional[Dict[str, Any]] = None
+
+    def append(self, values: List[Tuple[int, Dict[str, Any]]], fields: Dict[str, Any]) -> None:
+        """Buffer (start, interval) pairs; a later value for the same start wins"""
+        if not self.pending:
+            self.buffered_since = time.monotonic()
+        for start, interval in values:
+            self.pending[start] = interval
+        self.fields.update(fields)
+
+        if (len(self.pending) >= METER_BUFFER_MAX_VALUES
+                or time.monotonic() - self.buffered_since >= METER_BUFFER_MAX_AGE_SECONDS):
+            self.flush()
+
+    def _reindex(self, current: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Rebuild the start index after the series was replaced through POST /v1/time-series"""
+        keyed = []
+        for interval in (current or {}).get('intervals', []):
+            try:
+                keyed.append((timeseries_codec.parse_timestamp(interval['start']), interval))
+            except (KeyError, TypeError, ValueError, AttributeError):
+                continue
+        keyed.sort(key=lambda pair: pair[0])
+        self.starts = array('q', [start for start, _ in keyed])
+        return [interval for _, interval in keyed]
+
+    def flush(self) -> int:
+        """Merge buffered values into the published series, returns the number merged"""
+        if not self.pending:
+            return 0
+
+        batch = sorted(self.pending.items(), key=lambda pair: pair[0])
+        self.pending = {}
+
+        current = time_series_store.get(self.ts_id)
+        if current is not None and current is self.published:
+            intervals = current['intervals']
+        else:
+            intervals = self._reindex(current)
+
+        starts = self.starts
+        pos = bisect.bisect_left(starts, batch[0][0])
+
+        if pos == len(starts):
+            # In-order append: extend index and interval list
+            merged = []
+            for offset, (start, interval) in enumerate(batch, pos + 1):
+                interval['position'] = offset
+                merged.append(interval)
+            starts.extend(start for start, _ in batch)
+        else:
+            # Late or corrected values: merge the batch into the tail only
+            tail_starts, tail = starts[pos:], intervals[pos:]
+            merged_starts, merged = [], []
+            i = 0
+            for start, interval in batch:
+                while i < len(tail_starts) and tail_starts[i] < start:
+                    merged_starts.append(tail_starts[i])
+                    merged.append(tail[i])
+                    i += 1
+                if i < len(tail_starts) and tail_starts[i] == start:
+                    i += 1
+                merged_starts.append(start)
+                merged.append(interval)
+            merged_starts.extend(tail_starts[i:])
+            merged.extend(tail[i:])
+
+            for offset, interval in enumerate(merged, pos + 1):
+                if interval.get('position') != offset:
+                    merged[offset - pos - 1] = {**interval, 'position': offset}
+            starts[pos:] = array('q', merged_starts)
+
+        series = {
+            **(current or {
+                'timeSeriesId': self.ts_id,
+                'meteringPointId': self.metering_point_id,
+                'meterLocationId': self.metering_point_id,
+                'measurementType': 'CONSUMPTION',
+                'unit': 'KWH',
+                'resolution': 'PT15M'
+            }),
+            **self.fields,
+            'period': {
+                'start': timeseries_codec.format_timestamp(starts[0]),
+                'end': timeseries_codec.format_timestamp(starts[-1] + METERING_INTERVAL_SECONDS)
+            },
+            'intervals': intervals[:pos] + merged
+        }
+
+        self.published = put_time_series(self.ts_id, series, changed=[interval for _, interval in batch])
+        return len(batch)
+
+
+meter_writers: Dict[str, MeterSeriesWriter] = {}   # timeSeriesId -> writer
+
+
+def parse_metering_values(values: Any) -> Tuple[List[Tuple[int, Dict[str, Any]]], List[Dict[str, Any]]]:
+    """
+    Validate MeteringValue entries and convert them to PT15M intervals
+
+    Returns:
+        ([(start epoch, interval)], validation errors)
+    """
+    accepted, errors = [], []
+    for i, value in enumerate(values):
+        field = f'values[{i}]'
+        if not isinstance(value, dict):
+            errors.append({'code': 'INVALID_VALUE', 'message': 'Value must be an object', 'field': field})
+            continue
+
+        try:
+            start = timeseries_codec.parse_timestamp(value['timestamp'])
+        except (KeyError, TypeError, ValueError, AttributeError):
+            errors.append({'code': 'INVALID_TIMESTAMP', 'message': 'timestamp must be ISO 8601',
+                           'field': f'{field}.timestamp'})
+            continue
+        if start % METERING_INTERVAL_SECONDS:
+            errors.append({'code': 'INVALID_TIMESTAMP', 'message': 'timestamp must be on the 15-minute grid',
+                           'field': f'{field}.timestamp'})
+            continue
+
+        factor = METERING_UNIT_FACTORS.get(value.get('unit'))
+        if factor is None:
+            errors.append({'code': 'INVALID_UNIT', 'message': 'unit must be KWH or MWH', 'field': f'{field}.unit'})
+            continue
+
+        try:
+            quantity = float(value['value'])
+        except (KeyError, TypeError, ValueError):
+            quantity = float('nan')
+        if quantity != quantity or quantity in (float('inf'), float('-inf')):
+            errors.append({'code': 'INVALID_QUANTITY_FORMAT', 'message': 'value must be a decimal string',
+                           'field': f'{field}.value'})
+            continue
+
+        quality = value.get('quality')
+        if quality is not None and quality not in METERING_QUALITIES:
+            errors.append({'code': 'INVALID_QUALITY', 'message': 'Invalid quality indicator',
+                           'field': f'{field}.quality'})
+            continue
+
+        interval = {
+            'start': timeseries_codec.format_timestamp(start),
+            'end': timeseries_codec.format_timestamp(start + METERING_INTERVAL_SECONDS),
+            'quantity': value['value'] if factor == 1.0 else timeseries_codec.format_quantity(quantity * factor)
+        }
+        if quality is not None:
+            interval['quality'] = quality
+        accepted.append((start, interval))
+
+    return accepted, errors
+
+
+def submit_metering_values(metering_point_id: str, data: Any) -> Tuple[Dict[str, Any], int]:
+    """
+    Buffer a MeteringValuesSubmission for a metering point
+
+    Besides messageId, measurementDate and values the body may carry
+    measurementType, marketLocationId and balancingGroupId for the series.
+
+    Returns:
+        (response_body, status_code)
+    """
+    if not isinstance(data, dict) or not data.get('messageId') or not data.get('measurementDate') \
+            or not isinstance(data.get('values'), list):
+        return {
+            'error': 'Bad Request',
+            'message': 'messageId, measurementDate and values are required'
+        }, 400
+
+    accepted, errors = parse_metering_values(data['values'])
+    if errors and not accepted:
+        return {
+            'error': 'Unprocessable Entity',
+            'message': 'Metering values validation failed',
+            'messageId': data['messageId'],
+            'validationErrors': errors
+        }, 422
+
+    ts_id = metering_series_id(metering_point_id)
+    fields = {name: data[name] for name in METERING_SERIES_FIELDS if data.get(name)}
+    with time_series_store.lock(ts_id):
+        writer = meter_writers.get(ts_id)
+        if writer is None:
+            writer = meter_writers.setdefault(ts_id, MeterSeriesWriter(metering_point_id))
+        writer.append(accepted, fields)
+        if state is not None:
+            state.log(METERING_VALUES_RECORD, metering_point_id, {'values': accepted, 'fields': fields})
+    if accepted:
+        notifications.broker.publish('timeseries.ingested', {
+            'timeSeriesIds': [ts_id],
+            'meteringPointId': metering_point_id,
+            'messageId': data['messageId'],
+            'acceptedCount': len(accepted)
+        })
+
+    return {
+        'messageId': data['messageId'],
+        'acceptanceTime': get_current_timestamp(),
+        'acceptedCount': len(accepted),
+        'rejectedCount': len(errors),
+        'validationErrors': errors
+    }, 201
+
+
+def flush_meter_writer(ts_id: str) -> None:
+    """Publish buffered metering values of one series (read-your-writes for readers)"""
+    writer = meter_writers.get(ts_id)
+    if writer is not None and writer.pending:
+        with time_series_store.lock(ts_id):
+            writer.flush()
+
+
+def flush_meter_writers() -> None:
+    """Publish all buffered metering values"""
+    for ts_id in list(meter_writers):
+        flush_meter_writer(ts_id)
+
+
+def read_time_series(ts_id: str) -> Optional[Dict[str, Any]]:
+    """Current version of a time series including buffered metering values"""
+    flush_meter_writer(ts_id)
+    return time_series_store.get(ts_id)
+
+
+# =============================================================================
+# Time Series Endpoints
+# =============================================================================
+
+@app.route('/v1/time-series', methods=['POST'])
+def submit_time_series():
+    """
+    Submit time series data
+
+    Accepts application/json or the packed binary format
+    (Content-Type: application/vnd.energy-timeseries.packed, see timeseries_codec)
+    """
+    claims, denied = authorize(request.headers.get('Authorization'), 'timeseries.write')
+    if denied is not None:
+        return jsonify(denied[0]), denied[1]
+    admit_submission(claims)
+
+    if request.mimetype == timeseries_codec.MEDIA_TYPE:
+        try:
+            time_series_list = timeseries_codec.decode_time_series(request.get_data())
+        except ValueError as e:
+            return jsonify({'error': 'Bad Request', 'message': f'Invalid packed time series: {e}'}), 400
+    else:
+        data = request.json
+        time_series_list = data.get('timeSeries', [])
+
+    return jsonify(store_time_series(time_series_list)), 201
+
+
+def store_time_series(time_series_list: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Store submitted time series (replacing existing ones), returns the acceptance body"""
+    accepted_ids = []
+    for ts in time_series_list:
+        ts_id = ts.get('timeSeriesId')
+        if ts_id:
+            put_time_series(ts_id, ts)
+            accepted_ids.append(ts_id)
+    if accepted_ids:
+        notifications.broker.publish('timeseries.ingested', {'timeSeriesIds': accepted_ids})
+
+    return {
+        'acceptanceTime': get_current_timestamp(),
+        'status': 'ACCEPTED',
+        'timeSeriesIds': accepted_ids
+    }
+
+
+@app.route('/v1/time-series', methods=['GET'])
+def query_time_series():
+    """
+    Query time series data
+
+    view=summary omits intervals (adds intervalCount) for listings.
+    """
+    _, denied = authorize(request.headers.get('Authorization'), 'timeseries.read')
+    if denied is not None:
+        return jsonify(denied[0]), denied[1]
+
+    results = find_time_series(request.args.get('marketLocationId'), request.args.get('meterLocationId'))
+    if request.args.get('view') == 'summary':
+        results = [summarize_time_series(ts) for ts in results]
+
+    return jsonify({
+        'timeSeries': results,
+        'totalCount': len(results)
+    })
+
+
+def summarize_time_series(ts: Dict[str, Any]) -> Dict[str, Any]:
+    """Series metadata with an interval count instead of the intervals"""
+    summary = {key: value for key, value in ts.items() if key != 'intervals'}
+    summary['intervalCount'] = len(ts.get('intervals', []))
+    return summary
+
+
+def find_time_series(market_location_id: Optional[str], meter_location_id: Optional[str]) -> List[Dict[str, Any]]:
+    """Return stored time series matching the optional location filters (index lookup when filtered)"""
+    flush_meter_writers()
+    filters = [(field, value) for field, value in zip(LOCATION_FIELDS, (market_location_id, meter_location_id)) if value]
+    if not filters:
+        return list(time_series_store.values())
+
+    candidates = time_series_locations.series_ids(*filters[0])
+    for field, value in filters[1:]:
+        matching = set(time_series_locations.series_ids(field, value))
+        candidates = [ts_id for ts_id in candidates if ts_id in matching]
+
+    results = []
+    for ts_id in candidates:
+        ts_data = time_series_store.get(ts_id)
+        # Re-check: the series may have been replaced since the index was read
+        if ts_data is not None and all(ts_data.get(field) == value for field, value in filters):
+            results.append(ts_data)
+    return results
+
+
+@app.route('/v1/time-series/<time_series_id>', methods=['GET'])
+def get_time_series(time_series_id):
+    """
+    Get specific time series
+
+    Returns the packed binary format when requested via
+    Accept: application/vnd.energy-timeseries.packed, JSON otherwise.
+    resolution/aggregate return hourly, daily or monthly rollups and
+    downsample=N an LTTB-downsampled series for charts (see time_series_view).
+    """
+    _, denied = authorize(request.headers.get('Authorization'), 'timeseries.read')
+    if denied is not None:
+        return jsonify(denied[0]), denied[1]
+
+    ts_data = read_time_series(time_series_id)
+    if ts_data is None:
+        return jsonify({'error': 'Not found'}), 404
+
+    ts_data, status_code = time_series_view(time_series_id, ts_data, request.args)
+    if status_code != 200:
+        return jsonify(ts_data), status_code
+
+    best = request.accept_mimetypes.best_match(['application/json', timeseries_codec.MEDIA_TYPE])
+    if best == timeseries_codec.MEDIA_TYPE:
+        try:
+            payload = timeseries_codec.encode_time_series([ts_data])
+        except ValueError as e:
+            return jsonify({'error': 'Not Acceptable', 'message': str(e)}), 406
+        return Response(payload, mimetype=timeseries_codec.MEDIA_TYPE)
+
+    return jsonify(ts_data)
+
+
+# =============================================================================
+# Metering Point Endpoints
+# =============================================================================
+
+@app.route('/v1/metering-points/<metering_point_id>/values', methods=['POST'])
+def submit_metering_point_values(metering_point_id):
+    """
+    Submit metering values for a metering point (MeteringValuesSubmission)
+
+    Values are appended to time series TS-MP-{meteringPointId} (PT15M, KWH)
+    through a per-meter write buffer; late values and corrections replace
+    the interval with the same timestamp.
+    """
+    claims, denied = authorize(request.headers.get('Authorization'), 'timeseries.write')
+    if denied is not None:
+        return jsonify(denied[0]), denied[1]
+    admit_submission(claims)
+
+    response, status_code = submit_metering_values(metering_point_id, request.get_json(silent=True))
+    return jsonify(response), status_code
+
+
+# =============================================================================
+# Balancing Group Endpoints
 # =============================================================================
 
-@app.route('/formulas', methods=['GET'])
-def list_formulas():
-    """List all stored formulas (convenience endpoint)"""
-    if not validate_token(request.headers.get('Authorization')):
-        return jsonify({'error': 'Unauthorized'}), 401
+@app.route('/v1/balancing-groups/<balancing_group_id>/aggregated-values', methods=['GET'])
+def get_balancing_group_aggregation(balancing_group_id):
+    """
+    Aggregated balancing group time series (sum of member series per interval)
 
-    formulas = []
-    for location_id, stored in formula_location_store.items():
-        formulas.append({
-            'locationId': location_id,
-            'locationType': 'maloId' if stored['data'].get('maloId') else 'neloId',
-            'timeSliceCount': len(stored['data']['calculationFormulaTimeSlices']),
-            'transactionId': stored['transactionId'],
-            'acceptedAt': stored['acceptedAt']
-        })
+    Members are time series submitted with a balancingGroupId; aggregationType
+    selects members by measurementType.
 
-    return jsonify({
-        'formulas': formulas,
-        'totalCount': len(formulas)
-    })
+    Query Parameters:
+        - periodStart (required): ISO 8601, inclusive
+        - periodEnd (required): ISO 8601, exclusive
+        - aggregationType (required): CONSUMPTION, GENERATION, FEED_IN, WITHDRAWAL
+    """
+    _, denied = authorize(request.headers.get('Authorization'), 'timeseries.read')
+    if denied is not None:
+        return jsonify(denied[0]), denied[1]
 
+    aggregation_type = request.args.get('aggregationType')
+    if aggregation_type not in AGGREGATION_TYPES:
+        return jsonify({
+            'error': 'Bad Request',
+            'message': f'aggregationType must be one of: {", ".join(AGGREGATION_TYPES)}'
+        }), 400
 
-@app.route('/formulas/<location_id>', methods=['GET'])
-def get_formula(location_id):
-    """Get specific formula by location ID"""
-    if not validate_token(request.headers.get('Authorization')):
-        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        period_start = timeseries_codec.parse_timestamp(request.args['periodStart'])
+        period_end = timeseries_codec.parse_timestamp(request.args['periodEnd'])
+    except (KeyError, ValueError):
+        return jsonify({
+            'error': 'Bad Request',
+            'message': 'periodStart and periodEnd are required in ISO 8601 format'
+        }), 400
 
-    if location_id not in formula_location_store:
+    if period_end <= period_start:
+        return jsonify({'error': 'Bad Request', 'message': 'periodEnd must be after periodStart'}), 400
+
+    flush_meter_writers()
+    if not balancing_group_aggregator.has_group(balancing_group_id):
         return jsonify({'error': 'Not found'}), 404
 
-    stored = formula_location_store[location_id]
     return jsonify({
-        'locationId': location_id,
-        'formulaLocation': stored['data'],
-        'transactionId': stored['transactionId'],
-        'acceptedAt': stored['acceptedAt']
+        'balancingGroupId': balancing_group_id,
+        'aggregationType': aggregation_type,
+        'period': {
+            'start': request.args['periodStart'],
+            'end': request.args['periodEnd']
+        },
+        'resolution': 'PT15M',
+        'intervals': balancing_group_aggregator.aggregate(
+            balancing_group_id, aggregation_type, period_start, period_end)
     })
 
 
 # =============================================================================
-# Time Series Endpoints
+# Calculation Result Cache
 # =============================================================================
 
-@app.route('/v1/time-series', methods=['POST'])
-def submit_time_series():
-    """Submit time series data"""
-    if not validate_token(request.headers.get('Authorization')):
-        return jsonify({'error': 'Unauthorized'}), 401
+CALCULATION_CACHE_SIZE = int(os.environ.get('CALCULATION_CACHE_SIZE', '1000'))
 
-    data = request.json
-    time_series_list = data.get('timeSeries', [])
+# (location, formula version, timeSlice, input series versions, period, output id, gap strategy)
+#   -> {'calculationId', 'outputTimeSeriesId', 'outputVersion'}
+calculation_result_cache = LRUCache(CALCULATION_CACHE_SIZE)
 
-    accepted_ids = []
-    for ts in time_series_list:
-        ts_id = ts.get('timeSeriesId')
-        if ts_id:
-            time_series_store[ts_id] = ts
-            accepted_ids.append(ts_id)
 
-    return jsonify({
-        'acceptanceTime': get_current_timestamp(),
-        'status': 'ACCEPTED',
-        'timeSeriesIds': accepted_ids
-    }), 201
+def calculation_cache_key(location_id: str, formula_version: int, time_slice_id: Any,
+                          input_ts_map: Dict[str, str], input_series: Dict[str, Optional[Dict[str, Any]]],
+                          period: Dict[str, Any], output_ts_id: Optional[str], gap_strategy: str) -> Tuple:
+    """Identify a calculation by everything its result depends on (a formula version never changes)"""
+    inputs = tuple(sorted(
+        (melo_id, ts_id, input_series[melo_id].get('version') if input_series[melo_id] else None)
+        for melo_id, ts_id in input_ts_map.items()
+    ))
+    return (location_id, formula_version, time_slice_id, inputs,
+            period.get('start'), period.get('end'), output_ts_id, gap_strategy)
 
 
-@app.route('/v1/time-series', methods=['GET'])
-def query_time_series():
-    """Query time series data"""
-    if not validate_token(request.headers.get('Authorization')):
-        return jsonify({'error': 'Unauthorized'}), 401
+def cached_calculation(key: Tuple) -> Optional[Dict[str, Any]]:
+    """
+    Completed calculation for the key, if its output series is unchanged
 
-    market_location_id = request.args.get('marketLocationId')
-    meter_location_id = request.args.get('meterLocationId')
+    Entries whose calculation or output series was replaced since are dropped.
+    """
+    entry = calculation_result_cache.get(key)
+    if entry is None:
+        return None
 
-    results = []
-    for ts_id, ts_data in time_series_store.items():
-        include = True
-        if market_location_id and ts_data.get('marketLocationId') != market_location_id:
-            include = False
-        if meter_location_id and ts_data.get('meterLocationId') != meter_location_id:
-            include = False
-        if include:
-            results.append(ts_data)
+    calculation = calculation_store.get(entry['calculationId'])
+    output = time_series_store.get(entry['outputTimeSeriesId'])
+    if (calculation is None or calculation.get('status') != 'COMPLETED'
+            or output is None or output.get('version') != entry['outputVersion']):
+        calculation_result_cache.discard(key)
+        return None
+    return calculation
 
-    return jsonify({
-        'timeSeries': results,
-        'totalCount': len(results)
-    })
 
+# =============================================================================
+# Gap Detection
+# =============================================================================
+
+# Before a calculation, every input series is checked against the timeline
+# the inputs share: slots of the first input's interval length from the
+# period start (or the earliest input interval) to the period end (or the
+# latest one). Missing slots are handled by the request's gapStrategy:
+#   fail          reject the calculation with the gap report (422)
+#   zero          calculate missing values as 0.0, quality MISSING
+#   linear        interpolate between the values around the gap
+#   carryForward  repeat the last value before the gap
+# linear and carryForward take the nearest value for gaps at the start or
+# end of an input and mark filled values SUBSTITUTE; an input without any
+# value (empty or not found) is missing throughout: reported under fail,
+# calculated as 0.0, quality MISSING otherwise. Without any input interval
+# the timeline comes from the period alone and needs both of its bounds.
+GAP_STRATEGIES = ('fail', 'zero', 'linear', 'carryForward')
+CALCULATION_GAP_STRATEGY = os.environ.get('CALCULATION_GAP_STRATEGY', 'fail')
+CALCULATION_MAX_INTERVALS = int(os.environ.get('CALCULATION_MAX_INTERVALS', '1000000'))
+GAP_REPORT_MAX_RANGES = 100
+DEFAULT_INTERVAL_SECONDS = 900  # PT15M, for inputs without any interval
+
+
+def calculation_timeline(input_data: Dict[str, List[Dict]], window_start: Optional[int],
+                         window_end: Optional[int]) -> Tuple[int, int, int]:
+    """
+    Timeline of a calculation: (first slot start, slot count, slot length in seconds)
 
-@app.route('/v1/time-series/<time_series_id>', methods=['GET'])
-def get_time_series(time_series_id):
-    """Get specific time series"""
-    if not validate_token(request.headers.get('Authorization')):
-        return jsonify({'error': 'Unauthorized'}), 401
+    Only the first and last interval of each input are parsed. Raises
+    ValueError for intervals without a valid start or end, and for a
+    timeline that is empty or longer than CALCULATION_MAX_INTERVALS: with
+    every input empty or not found, only a period with start and end gives
+    the timeline.
+    """
+    step = first = last = None
+    for intervals in input_data.values():
+        if intervals:
+            start = timeseries_codec.parse_timestamp(intervals[0]['start'])
+            end = timeseries_codec.parse_timestamp(intervals[-1]['end'])
+            if step is None:
+                step = timeseries_codec.parse_timestamp(intervals[0]['end']) - start
+            first = start if first is None else min(first, start)
+            last = end if last is None else max(last, end)
+    if step is None or step <= 0:
+        step = DEFAULT_INTERVAL_SECONDS
+
+    # Period bounds are moved onto the slot grid the inputs are on
+    phase = first % step if first is not None else 0
+    timeline_start = window_start + (phase - window_start) % step if window_start is not None else first
+    timeline_end = window_end + (phase - window_end) % step if window_end is not None else last
+    if timeline_start is None or timeline_end is None:
+        raise ValueError('No input series has intervals in the calculation period; '
+                         'give period.start and period.end to calculate without input data')
+    if timeline_end <= timeline_start:
+        raise ValueError(f'Calculation period contains no start of a {step} s input interval')
+
+    count = (timeline_end - timeline_start + step - 1) // step
+    if count > CALCULATION_MAX_INTERVALS:
+        raise ValueError(f'Calculation period spans more than {CALCULATION_MAX_INTERVALS} intervals')
+    return timeline_start, count, step
+
+
+def timeline_slots(intervals: List[Dict], timeline_start: int, count: int, step: int) -> Optional[List[Optional[Dict]]]:
+    """
+    Place an input's intervals in their timeline slots (None where missing)
 
-    if time_series_id not in time_series_store:
-        return jsonify({'error': 'Not found'}), 404
+    Returns None if the input fills the timeline: chronological intervals
+    whose count, first and last start match it need no scan. Raises
+    ValueError for intervals off the slot grid.
+    """
+    if (len(intervals) == count and count
+            and timeseries_codec.parse_timestamp(intervals[0]['start']) == timeline_start
+            and timeseries_codec.parse_timestamp(intervals[-1]['start']) == timeline_start + (count - 1) * step):
+        return None
+
+    slots: List[Optional[Dict]] = [None] * count
+    for interval in intervals:
+        index, offset = divmod(timeseries_codec.parse_timestamp(interval['start']) - timeline_start, step)
+        if offset or not 0 <= index < count:
+            raise ValueError(f'interval {interval["start"]} is not on the {step} s grid of the calculation')
+        if slots[index] is None:
+            slots[index] = interval
+    return slots
+
+
+def gap_ranges(slots: List[Optional[Dict]]) -> List[Tuple[int, int]]:
+    """Runs of missing slots as [first, last + 1) index pairs"""
+    missing = [index for index, interval in enumerate(slots) if interval is None]
+    return [(run[0][1], run[-1][1] + 1)
+            for run in (list(group) for _, group in itertools.groupby(enumerate(missing), lambda p: p[1] - p[0]))]
+
+
+def fill_gaps(slots: List[Optional[Dict]], ranges: List[Tuple[int, int]], strategy: str,
+              timeline_start: int, step: int) -> List[Dict]:
+    """Fill the missing slots in place with intervals computed by the gap strategy, one gap at a time"""
+    for first, end in ranges:
+        length = end - first
+        before = slots[first - 1] if first > 0 else None
+        after = slots[end] if end < len(slots) else None
+        if strategy == 'zero' or (before is None and after is None):
+            values, quality = [0.0] * length, 'MISSING'
+        elif strategy == 'linear' and before is not None and after is not None:
+            low, high = float(before.get('quantity', 0)), float(after.get('quantity', 0))
+            values, quality = [low + (high - low) * k / (length + 1) for k in range(1, length + 1)], 'SUBSTITUTE'
+        else:
+            # carryForward, or linear at the start or end of the input
+            values, quality = [float((before or after).get('quantity', 0))] * length, 'SUBSTITUTE'
+        slots[first:end] = [{
+            'start': timeseries_codec.format_timestamp(timeline_start + index * step),
+            'end': timeseries_codec.format_timestamp(timeline_start + (index + 1) * step),
+            'quantity': timeseries_codec.format_quantity(value),
+            'quality': quality
+        } for index, value in zip(range(first, end), values)]
+    return slots
+
+
+def check_input_gaps(input_data: Dict[str, List[Dict]], input_ts_map: Dict[str, str],
+                     window_start: Optional[int], window_end: Optional[int],
+                     strategy: str) -> Tuple[Dict[str, List[Dict]], Dict[str, Any]]:
+    """
+    Completeness check of the calculation inputs, filling gaps unless the strategy is fail
+
+    Args:
+        input_data: meloId -> intervals in the calculation period (inputs whose series was not found are absent)
+        input_ts_map: meloId -> timeSeriesId of the request
+
+    Returns:
+        (inputs aligned to the timeline, gap report); inputs that fill the
+        timeline are passed through unchanged. Raises ValueError as
+        calculation_timeline and timeline_slots.
+    """
+    timeline_start, count, step = calculation_timeline(input_data, window_start, window_end)
+    aligned = {}
+    report: Dict[str, Any] = {'strategy': strategy, 'expectedIntervals': count, 'missingIntervals': 0, 'inputs': {}}
+    for melo_id, ts_id in input_ts_map.items():
+        intervals = input_data.get(melo_id, [])
+        try:
+            slots = timeline_slots(intervals, timeline_start, count, step)
+        except ValueError as e:
+            raise ValueError(f'Input series {ts_id}: {e}') from e
+        if slots is None:
+            aligned[melo_id] = intervals
+            continue
+
+        ranges = gap_ranges(slots)
+        missing = sum(end - first for first, end in ranges)
+        if missing:
+            report['missingIntervals'] += missing
+            report['inputs'][melo_id] = {
+                'timeSeriesId': ts_id,
+                'missingIntervals': missing,
+                'gaps': [{
+                    'start': timeseries_codec.format_timestamp(timeline_start + first * step),
+                    'end': timeseries_codec.format_timestamp(timeline_start + end * step),
+                    'intervals': end - first
+                } for first, end in ranges[:GAP_REPORT_MAX_RANGES]]
+            }
+        aligned[melo_id] = fill_gaps(slots, ranges, strategy, timeline_start, step) if strategy != 'fail' else slots
 
-    return jsonify(time_series_store[time_series_id])
+    return aligned, report
 
 
 # =============================================================================
@@ -767,59 +3098,165 @@ def get_time_series(time_series_id):
 # =============================================================================
 
 @app.route('/v1/calculations', methods=['POST'])
+@profiled('execute_calculation')
 def execute_calculation():
     """Execute calculation using stored formula"""
-    if not validate_token(request.headers.get('Authorization')):
-        return jsonify({'error': 'Unauthorized'}), 401
+    claims, denied = authorize(request.headers.get('Authorization'), 'calculations.execute')
+    if denied is not None:
+        return jsonify(denied[0]), denied[1]
 
+    client_id = admit_submission(claims)
     data = request.json
-    calculation_id = data.get('calculationId', generate_id('CALC'))
+    with calculation_slot(client_id, lambda: estimate_calculation_cost(data)):
+        response, status_code = run_calculation(data)
+    return jsonify(response), status_code
+
+
+def run_calculation(data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """
+    Execute a calculation request against the stored formula and time series
+
+    Args:
+        data: Calculation request body (maloId/neloId, timeSliceId, inputTimeSeries, ...);
+            an optional period limits evaluation to intervals starting in [start, end),
+            an optional asOf (version number or timestamp) selects an earlier formula version,
+            an optional gapStrategy how missing input intervals are handled (see Gap Detection)
+
+    Returns:
+        (response_body, status_code)
+    """
+    requested_calculation_id = data.get('calculationId')
+    calculation_id = requested_calculation_id or generate_id('CALC')
     location_id = data.get('maloId') or data.get('neloId')
     time_slice_id = data.get('timeSliceId')
-    input_ts_map = data.get('inputTimeSeries', {})  # meloId -> timeSeriesId
-    period = data.get('period', {})
-    output_ts_id = data.get('outputTimeSeriesId', generate_id('TS-CALC'))
+    input_ts_map = data.get('inputTimeSeries')  # meloId -> timeSeriesId
+    period = data.get('period') or {}
+    requested_output_ts_id = data.get('outputTimeSeriesId')
+    output_ts_id = requested_output_ts_id or generate_id('TS-CALC')
+    gap_strategy = data.get('gapStrategy', CALCULATION_GAP_STRATEGY)
+    if gap_strategy not in GAP_STRATEGIES:
+        return {
+            'error': 'Bad Request',
+            'message': f'gapStrategy must be one of {", ".join(GAP_STRATEGIES)}'
+        }, 400
+    if not isinstance(input_ts_map, dict) or not input_ts_map:
+        return {
+            'error': 'Bad Request',
+            'message': 'inputTimeSeries must map at least one meloId to a timeSeriesId'
+        }, 400
 
-    # Get formula
-    if location_id not in formula_location_store:
-        return jsonify({
+    # Get formula (the current version unless asOf selects an earlier one)
+    as_of = data.get('asOf')
+    try:
+        stored_formula = formula_as_of(location_id, as_of)
+    except ValueError:
+        return {
+            'error': 'Bad Request',
+            'message': 'asOf must be a version number or an ISO 8601 timestamp'
+        }, 400
+    if stored_formula is None:
+        return {
             'error': 'Not Found',
-            'message': f'Formula for location {location_id} not found'
-        }), 404
+            'message': f'Formula for location {location_id} not found' + (f' as of {as_of}' if as_of is not None else '')
+        }, 404
 
-    formula_data = formula_location_store[location_id]['data']
+    formula_data = stored_formula['data']
 
     # Find the time slice
     time_slice = None
-    for ts in formula_data['calculationFormulaTimeSlices']:
+    for index, ts in enumerate(formula_data['calculationFormulaTimeSlices']):
         if ts['timeSliceId'] == time_slice_id:
             time_slice = ts
             break
 
     if not time_slice:
-        return jsonify({
+        return {
             'error': 'Not Found',
             'message': f'Time slice {time_slice_id} not found in formula'
-        }), 404
+        }, 404
 
-    # Build input data from time series
+    try:
+        window_start, window_end = calculation_window(period)
+    except ValueError as e:
+        return {'error': 'Bad Request', 'message': str(e)}, 400
+
+    # Resolve input series once: these versions are calculated with and cached on
+    timings: Dict[str, Any] = {}
+    loading_started = time.perf_counter()
+    input_series = {melo_id: read_time_series(ts_id) for melo_id, ts_id in input_ts_map.items()}
+
+    # The key needs only series versions, so a hit skips windowing and the gap check
+    cache_key = calculation_cache_key(location_id, stored_formula['version'], time_slice_id,
+                                      input_ts_map, input_series, period, requested_output_ts_id, gap_strategy)
+    cached = cached_calculation(cache_key)
+    if cached is not None:
+        calculations_total.inc('cached', cached['status'])
+        if requested_calculation_id and requested_calculation_id != cached['calculationId']:
+            # Client-chosen ID: register it against the cached output
+            cached = {**cached, 'calculationId': requested_calculation_id, 'acceptedAt': get_current_timestamp()}
+            calculation_store[requested_calculation_id] = cached
+        publish_calculation_event(cached, 'HIT')
+        return {
+            'calculationId': cached['calculationId'],
+            'status': cached['status'],
+            'acceptedAt': cached['acceptedAt'],
+            'outputTimeSeriesId': cached['outputTimeSeriesId'],
+            'formulaVersion': stored_formula['version'],
+            'cacheStatus': 'HIT'
+        }, 202
+
+    # Only the intervals inside the period are evaluated
     input_data = {}
-    for melo_id, ts_id in input_ts_map.items():
-        if ts_id in time_series_store:
-            input_data[melo_id] = time_series_store[ts_id].get('intervals', [])
-
-    # Store calculation as pending
+    for melo_id, ts_data in input_series.items():
+        if ts_data is not None:
+            try:
+                input_data[melo_id] = window_intervals(ts_data.get('intervals', []), window_start, window_end)
+            except (KeyError, TypeError, ValueError, AttributeError):
+                return {
+                    'error': 'Bad Request',
+                    'message': f'Input series {input_ts_map[melo_id]} has intervals without a valid start'
+                }, 400
+
+    # Completeness check: missing intervals are rejected or filled before anything is calculated
+    try:
+        input_data, gaps = check_input_gaps(input_data, input_ts_map, window_start, window_end, gap_strategy)
+    except (KeyError, TypeError, AttributeError):
+        return {
+            'error': 'Bad Request',
+            'message': 'Input series have intervals without a valid start or end'
+        }, 400
+    except ValueError as e:
+        return {'error': 'Bad Request', 'message': str(e)}, 400
+    if gaps['missingIntervals']:
+        calculation_missing_intervals_total.inc(gap_strategy, amount=gaps['missingIntervals'])
+        if gap_strategy == 'fail':
+            return {
+                'error': 'Unprocessable Entity',
+                'message': f'{gaps["missingIntervals"]} input intervals are missing; '
+                           f'complete the series or choose another gapStrategy',
+                'gaps': gaps
+            }, 422
+
+    timings['load_inputs'] = time.perf_counter() - loading_started
+
+    # Store calculation as pending (every later state change publishes a new record)
     calculation_store[calculation_id] = {
         'calculationId': calculation_id,
         'locationId': location_id,
         'timeSliceId': time_slice_id,
+        'formulaVersion': stored_formula['version'],
+        'inputVersions': {melo_id: ts_data.get('version') for melo_id, ts_data in input_series.items() if ts_data},
+        'gaps': gaps,
         'status': 'PROCESSING',
-        'acceptedAt': get_current_timestamp()
+        'acceptedAt': get_current_timestamp(),
+        'cacheStatus': 'MISS'
     }
 
     # Execute calculation
     try:
-        result_intervals = calculate_time_slice(time_slice, input_data)
+        result_intervals = calculate_time_slice(time_slice, input_data, timings,
+                                                time_slice_formula_key(stored_formula, index))
+        storing_started = time.perf_counter()
 
         # Create output time series
         output_ts = {
@@ -839,59 +3276,475 @@ def execute_calculation():
             }
         }
 
-        time_series_store[output_ts_id] = output_ts
+        # Publish the output series before the calculation record points at it
+        output_version = put_time_series(output_ts_id, output_ts)['version']
 
-        calculation_store[calculation_id].update({
+        calculation = calculation_store.update(calculation_id, {
             'status': 'COMPLETED',
             'outputTimeSeriesId': output_ts_id,
             'completedAt': get_current_timestamp(),
             'intervalsCalculated': len(result_intervals)
         })
+        calculation_result_cache.put(cache_key, {
+            'calculationId': calculation_id,
+            'outputTimeSeriesId': output_ts_id,
+            'outputVersion': output_version
+        })
+        timings['store'] = time.perf_counter() - storing_started
 
     except Exception as e:
-        calculation_store[calculation_id].update({
+        calculation = calculation_store.update(calculation_id, {
             'status': 'FAILED',
             'errors': [{'code': 'CALCULATION_ERROR', 'message': str(e)}]
         })
 
-    return jsonify({
+    observe_calculation(calculation['status'], timings)
+    publish_calculation_event(calculation, 'MISS')
+
+    return {
         'calculationId': calculation_id,
-        'status': calculation_store[calculation_id]['status'],
-        'acceptedAt': calculation_store[calculation_id]['acceptedAt']
-    }), 202
+        'status': calculation['status'],
+        'acceptedAt': calculation['acceptedAt'],
+        'outputTimeSeriesId': calculation.get('outputTimeSeriesId'),
+        'formulaVersion': stored_formula['version'],
+        'cacheStatus': 'MISS'
+    }, 202
 
 
 @app.route('/v1/calculations/<calculation_id>', methods=['GET'])
 def get_calculation(calculation_id):
     """Get calculation result"""
-    if not validate_token(request.headers.get('Authorization')):
-        return jsonify({'error': 'Unauthorized'}), 401
+    _, denied = authorize(request.headers.get('Authorization'), 'calculations.execute')
+    if denied is not None:
+        return jsonify(denied[0]), denied[1]
 
-    if calculation_id not in calculation_store:
+    calculation = calculation_store.get(calculation_id)
+    if calculation is None:
         return jsonify({'error': 'Not found'}), 404
 
-    return jsonify(calculation_store[calculation_id])
+    return jsonify(calculation)
+
+
+# =============================================================================
+# Calculation Batches (cost-ordered scheduling)
+# =============================================================================
+
+# Jobs estimated above CALCULATION_MAX_JOB_COST (units, see INTERVAL_BASE_COST)
+# are rejected without running; the rest run cheapest first in packs of
+# about CALCULATION_PACK_COST, so one expensive formula cannot hold back a
+# settlement run and the async server can interleave other work between packs.
+CALCULATION_MAX_JOB_COST = float(os.environ.get('CALCULATION_MAX_JOB_COST', '3e8'))
+CALCULATION_PACK_COST = float(os.environ.get('CALCULATION_PACK_COST', '1e7'))
+CALCULATION_BATCH_MAX_JOBS = 10000
+
+
+def time_slice_complexity(stored_formula: Dict[str, Any], time_slice: Dict[str, Any]) -> Dict[str, Any]:
+    """Complexity recorded at submission, computed on the fly for older records"""
+    for assessed in stored_formula.get('complexity', []):
+        if assessed['timeSliceId'] == time_slice['timeSliceId']:
+            return assessed
+    return formula_complexity(time_slice['calculationFormula'])
+
+
+def estimate_calculation_cost(data: Any) -> Optional[float]:
+    """
+    Estimated cost of a calculation request: cost per interval x intervals in the period
+
+    Returns None if the request cannot be resolved (run_calculation reports why).
+    """
+    if not isinstance(data, dict):
+        return None
+    try:
+        stored_formula = formula_as_of(data.get('maloId') or data.get('neloId'), data.get('asOf'))
+    except ValueError:
+        return None
+    if stored_formula is None:
+        return None
+    time_slice = next((ts for ts in stored_formula['data']['calculationFormulaTimeSlices']
+                       if ts['timeSliceId'] == data.get('timeSliceId')), None)
+    if time_slice is None:
+        return None
+
+    try:
+        window_start, window_end = calculation_window(data.get('period') or {})
+        interval_count = 0
+        for ts_id in (data.get('inputTimeSeries') or {}).values():
+            ts_data = read_time_series(ts_id)
+            if ts_data is not None:
+                intervals = window_intervals(ts_data.get('intervals', []), window_start, window_end)
+                interval_count = max(interval_count, len(intervals))
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return None
+
+    return float(time_slice_complexity(stored_formula, time_slice)['estimatedCostPerInterval'] * interval_count)
+
+
+def calculation_batch_jobs(data: Any) -> List[Any]:
+    """Calculation requests of a batch body, raises ValueError if malformed"""
+    jobs = data.get('calculations') if isinstance(data, dict) else None
+    if not isinstance(jobs, list) or not jobs:
+        raise ValueError('calculations must be a non-empty array')
+    if len(jobs) > CALCULATION_BATCH_MAX_JOBS:
+        raise ValueError(f'Batch exceeds {CALCULATION_BATCH_MAX_JOBS} calculations')
+    return jobs
+
+
+def plan_calculation_batch(jobs: List[Any]) -> Tuple[List[Optional[Dict[str, Any]]], List[List[int]], List[Optional[float]]]:
+    """
+    Estimate, admit and order the jobs of a calculation batch
+
+    Returns:
+        (results prefilled for rejected jobs, packs of job indices in
+        execution order, estimated cost per job)
+    """
+    costs = [estimate_calculation_cost(job) for job in jobs]
+    results: List[Optional[Dict[str, Any]]] = [None] * len(jobs)
+
+    admitted = []
+    for index, cost in enumerate(costs):
+        if cost is not None and cost > CALCULATION_MAX_JOB_COST:
+            results[index] = {
+                'status': 'REJECTED',
+                'errors': [{'code': 'COST_LIMIT_EXCEEDED',
+                            'message': f'Estimated cost {cost:.0f} exceeds limit {CALCULATION_MAX_JOB_COST:.0f}'}]
+            }
+        else:
+            admitted.append(index)
+
+    # Cheapest first; unresolvable jobs (cost None) fail fast, so they go first too
+    admitted.sort(key=lambda index: (costs[index] or 0.0, index))
+
+    packs, pack, pack_cost = [], [], 0.0
+    for index in admitted:
+        pack.append(index)
+        pack_cost += costs[index] or 0.0
+        if pack_cost >= CALCULATION_PACK_COST:
+            packs.append(pack)
+            pack, pack_cost = [], 0.0
+    if pack:
+        packs.append(pack)
+
+    return results, packs, costs
+
+
+def run_calculation_pack(jobs: List[Any], pack: List[int]) -> List[Tuple[int, Dict[str, Any]]]:
+    """Run one pack of batch jobs, returns (job index, result) pairs"""
+    outcomes = []
+    for index in pack:
+        job = jobs[index]
+        if not isinstance(job, dict):
+            outcomes.append((index, {
+                'status': 'FAILED',
+                'errors': [{'code': 'INVALID_REQUEST', 'message': 'Calculation request must be an object'}]
+            }))
+            continue
+
+        body, status_code = run_calculation(job)
+        if status_code != 202:
+            body = {'status': 'FAILED',
+                    'errors': [{'code': body.get('error', 'Error').upper().replace(' ', '_'),
+                                'message': body.get('message', '')}]}
+        outcomes.append((index, body))
+    return outcomes
+
+
+def calculation_batch_result(results: List[Optional[Dict[str, Any]]], packs: List[List[int]],
+                             costs: List[Optional[float]]) -> Dict[str, Any]:
+    """Batch response body: per-job results in submission order plus counts"""
+    order = {index: position for position, index in enumerate(i for pack in packs for i in pack)}
+    entries = []
+    for index, result in enumerate(results):
+        entries.append({
+            'index': index,
+            'estimatedCost': costs[index],
+            'executionOrder': order.get(index),
+            **(result or {'status': 'FAILED'})
+        })
+
+    def count(status: str) -> int:
+        return sum(1 for entry in entries if entry['status'] == status)
+
+    return {
+        'batchId': generate_id('BATCH'),
+        'totalCount': len(entries),
+        'completedCount': count('COMPLETED'),
+        'failedCount': count('FAILED'),
+        'rejectedCount': count('REJECTED'),
+        'packCount': len(packs),
+        'results': entries
+    }
+
+
+def pack_cost(pack: List[int], costs: List[Optional[float]]) -> float:
+    return sum(costs[index] or 0.0 for index in pack)
+
+
+def run_calculation_batch(data: Any, client_id: Optional[str] = None) -> Tuple[Dict[str, Any], int]:
+    """
+    Execute a batch of calculation requests ordered by estimated cost
+
+    Args:
+        data: {"calculations": [calculation request, ...]}
+        client_id: Schedule each pack as a fair-queued job of this client
+
+    Returns:
+        (response_body, status_code)
+    """
+    try:
+        jobs = calculation_batch_jobs(data)
+    except ValueError as e:
+        return {'error': 'Bad Request', 'message': str(e)}, 400
+
+    results, packs, costs = plan_calculation_batch(jobs)
+    for pack in packs:
+        with calculation_slot(client_id, functools.partial(pack_cost, pack, costs), timeout=None, bounded=False):
+            outcomes = run_calculation_pack(jobs, pack)
+        for index, result in outcomes:
+            results[index] = result
+    return calculation_batch_result(results, packs, costs), 200
+
+
+@app.route('/v1/calculations/batch', methods=['POST'])
+def execute_calculation_batch():
+    """
+    Execute many calculations (e.g. a settlement run) in one request
+
+    Jobs run cheapest first; jobs above CALCULATION_MAX_JOB_COST are
+    rejected, failures are reported per job and do not stop the batch.
+    """
+    claims, denied = authorize(request.headers.get('Authorization'), 'calculations.execute')
+    if denied is not None:
+        return jsonify(denied[0]), denied[1]
+
+    client_id = admit_submission(claims)
+    response, status_code = run_calculation_batch(request.get_json(silent=True), client_id)
+    return jsonify(response), status_code
+
+
+# =============================================================================
+# Notifications: Event Stream and Webhooks (see notifications.py)
+# =============================================================================
+
+# Keep proxies (nginx) from buffering or caching the stream
+EVENT_STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+metrics.REGISTRY.counter('formula_api_events_published_total', 'Notification events published by type', ('type',),
+                         lambda: {(event_type,): count for event_type, count
+                                  in list(notifications.broker.published.items())})
+metrics.REGISTRY.gauge('formula_api_event_streams', 'Open Server-Sent Events streams', (),
+                       lambda: {(): notifications.broker.stream_count()})
+metrics.REGISTRY.counter('formula_api_event_stream_overflows_total',
+                         'Event streams closed for falling EVENTS_QUEUE_SIZE events behind', (),
+                         lambda: {(): notifications.broker.overflowed})
+metrics.REGISTRY.counter('formula_api_webhook_deliveries_total',
+                         'Webhook delivery attempts by result (delivered, retried, failed, dropped)', ('result',),
+                         lambda: {(result,): count for result, count in list(notifications.webhooks.results.items())})
+metrics.REGISTRY.gauge('formula_api_webhook_queue_depth', 'Webhook deliveries waiting to be sent or retried', (),
+                       lambda: {(): notifications.webhooks.depth()})
+
+
+def publish_calculation_event(calculation: Dict[str, Any], cache_status: str) -> None:
+    """Announce a finished calculation (calculation.completed or calculation.failed)"""
+    completed = calculation['status'] == 'COMPLETED'
+    data = {
+        'calculationId': calculation['calculationId'],
+        'status': calculation['status'],
+        'locationId': calculation.get('locationId'),
+        'timeSliceId': calculation.get('timeSliceId'),
+        'formulaVersion': calculation.get('formulaVersion'),
+        'cacheStatus': cache_status
+    }
+    if completed:
+        data['outputTimeSeriesId'] = calculation.get('outputTimeSeriesId')
+        data['intervalsCalculated'] = calculation.get('intervalsCalculated')
+    else:
+        data['errors'] = calculation.get('errors', [])
+    notifications.broker.publish('calculation.completed' if completed else 'calculation.failed', data)
+
+
+def event_stream_authorization(auth_header: Optional[str], args: Any) -> Optional[str]:
+    """
+    Authorization header of an event stream request, else the access_token
+    query parameter (EventSource cannot send headers)
+    """
+    if not auth_header and args.get('access_token'):
+        return f'Bearer {args["access_token"]}'
+    return auth_header
+
+
+def open_event_stream(auth_header: Optional[str], last_event_id: Optional[str], args: Any,
+                      wake: Callable[[], None]) -> Tuple[Any, int]:
+    """
+    Authorize and subscribe an event stream
+
+    Args:
+        last_event_id: Last-Event-ID header of a reconnecting EventSource
+            (or the lastEventId query parameter): buffered events after it
+            are sent first
+        args: Query parameters; types filters by comma-separated event types
+        wake: Called whenever events are waiting for the stream
+
+    Returns:
+        (notifications.Subscription, 200) or (error_body, status_code)
+    """
+    claims, denied = authorize(auth_header)
+    if denied is not None:
+        return denied
+
+    try:
+        types = notifications.parse_event_types(args.get('types', '').split(','))
+    except ValueError as e:
+        return {'error': 'Bad Request', 'message': str(e)}, 400
+
+    last_event_id = last_event_id or args.get('lastEventId')
+    try:
+        resume_after = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return {'error': 'Bad Request', 'message': 'Last-Event-ID must be an event id'}, 400
+
+    try:
+        return notifications.broker.subscribe(claims.scopes, types, wake, resume_after), 200
+    except notifications.EventStreamLimit as e:
+        return {'error': 'Service Unavailable', 'message': str(e)}, 503
+
+
+def register_webhook(auth_header: Optional[str], data: Any) -> Tuple[Dict[str, Any], int]:
+    """
+    Register a webhook for the token's client
+
+    The webhook receives the events the token's scopes allow, optionally
+    limited to data['events']. The signing secret is generated unless the
+    body supplies one and is only returned here.
+
+    Returns:
+        (response_body, status_code)
+    """
+    claims, denied = authorize(auth_header)
+    if denied is not None:
+        return denied
+    if not isinstance(data, dict):
+        return {'error': 'Bad Request', 'message': 'Body must be a JSON object'}, 400
+
+    error = notifications.validate_webhook_url(data.get('url'))
+    if error is not None:
+        return {'error': 'Bad Request', 'message': error}, 400
+    events = data.get('events') or []
+    if not isinstance(events, list) or not all(isinstance(name, str) for name in events):
+        return {'error': 'Bad Request', 'message': 'events must be a list of event types'}, 400
+    try:
+        types = notifications.parse_event_types(events)
+    except ValueError as e:
+        return {'error': 'Bad Request', 'message': str(e)}, 400
+    secret = data.get('secret')
+    if secret is not None and (not isinstance(secret, str) or len(secret) < 16):
+        return {'error': 'Bad Request', 'message': 'secret must be a string of at least 16 characters'}, 400
+
+    try:
+        webhook = notifications.webhooks.register(claims.client_id, data['url'], types, claims.scopes, secret)
+    except ValueError as e:
+        return {'error': 'Conflict', 'message': str(e)}, 409
+    return {**webhook.describe(), 'secret': webhook.secret}, 201
+
+
+def list_webhooks(auth_header: Optional[str]) -> Tuple[Dict[str, Any], int]:
+    """The token client's webhooks with delivery statistics, returns (response_body, status_code)"""
+    claims, denied = authorize(auth_header)
+    if denied is not None:
+        return denied
+    return {'webhooks': [webhook.describe() for webhook in notifications.webhooks.webhooks(claims.client_id)]}, 200
+
+
+def delete_webhook(auth_header: Optional[str], webhook_id: str) -> Tuple[Optional[Dict[str, Any]], int]:
+    """Remove one of the token client's webhooks, returns (response_body, status_code)"""
+    claims, denied = authorize(auth_header)
+    if denied is not None:
+        return denied
+    if not notifications.webhooks.unregister(claims.client_id, webhook_id):
+        return {'error': 'Not Found', 'message': f'Webhook {webhook_id} not found'}, 404
+    return None, 204
+
+
+@app.route('/v1/events', methods=['GET'])
+def stream_events():
+    """
+    Server-Sent Events stream of calculation, formula and time series events
+
+    The stream holds its server thread while connected; a keep-alive comment
+    is sent every EVENTS_HEARTBEAT seconds, which also detects closed
+    connections.
+    """
+    woken = threading.Event()
+
+    def wait(timeout: float) -> bool:
+        fired = woken.wait(timeout)
+        woken.clear()
+        return fired
+
+    subscription, status_code = open_event_stream(
+        event_stream_authorization(request.headers.get('Authorization'), request.args),
+        request.headers.get('Last-Event-ID'), request.args, woken.set
+    )
+    if status_code != 200:
+        return jsonify(subscription), status_code
+    return Response(notifications.event_stream(notifications.broker, subscription, wait),
+                    mimetype='text/event-stream', headers=EVENT_STREAM_HEADERS)
+
+
+@app.route('/v1/webhooks', methods=['POST'])
+def create_webhook():
+    """Register a webhook for calculation, formula and time series events"""
+    response, status_code = register_webhook(request.headers.get('Authorization'), request.get_json(silent=True))
+    return jsonify(response), status_code
+
+
+@app.route('/v1/webhooks', methods=['GET'])
+def get_webhooks():
+    """List the client's webhooks"""
+    response, status_code = list_webhooks(request.headers.get('Authorization'))
+    return jsonify(response), status_code
+
+
+@app.route('/v1/webhooks/<webhook_id>', methods=['DELETE'])
+def remove_webhook(webhook_id):
+    """Remove a webhook"""
+    response, status_code = delete_webhook(request.headers.get('Authorization'), webhook_id)
+    if response is None:
+        return '', status_code
+    return jsonify(response), status_code
 
 
 # =============================================================================
 # Health Check & Root
 # =============================================================================
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    return jsonify({
+def health_status() -> Dict[str, Any]:
+    """Health check body with store sizes"""
+    return {
         'status': 'healthy',
         'timestamp': get_current_timestamp(),
         'version': '0.0.1',
         'specification': 'EDI@Energy formel_v0.0.1',
         'stats': {
             'formulas': len(formula_location_store),
+            'formulaTimeSlices': len(formula_time_slice_store),
             'timeSeries': len(time_series_store),
             'calculations': len(calculation_store),
-            'transactions': len(transaction_store)
+            'transactions': len(transaction_store),
+            'calculationCache': calculation_result_cache.stats()
         }
-    })
+    }
+
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint"""
+    return jsonify(health_status())
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics: request latency, calculation stages, caches, stores"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
 
 
 @app.route('/', methods=['GET'])
@@ -906,22 +3759,39 @@ def root():
             'formula': {
                 'POST /formula/v0.0.1': 'Submit formula (EDI@Energy compliant)',
                 'GET /formulas': 'List all formulas',
-                'GET /formulas/{locationId}': 'Get specific formula'
+                'GET /formulas/{locationId}': 'Get specific formula',
+                'POST /formulas/bulk': 'Bulk import formulas (NDJSON)'
             },
             'timeSeries': {
                 'POST /v1/time-series': 'Submit time series',
                 'GET /v1/time-series': 'Query time series',
-                'GET /v1/time-series/{id}': 'Get specific time series'
+                'GET /v1/time-series/{id}': 'Get specific time series',
+                'POST /v1/metering-points/{id}/values': 'Append metering point values'
+            },
+            'balancingGroups': {
+                'GET /v1/balancing-groups/{id}/aggregated-values': 'Aggregated balancing group values'
             },
             'calculations': {
                 'POST /v1/calculations': 'Execute calculation',
+                'POST /v1/calculations/batch': 'Execute calculations ordered by estimated cost',
                 'GET /v1/calculations/{id}': 'Get calculation result'
             },
+            'notifications': {
+                'GET /v1/events': 'Server-Sent Events stream of calculation, formula and time series events',
+                'POST /v1/webhooks': 'Register a webhook',
+                'GET /v1/webhooks': 'List registered webhooks',
+                'DELETE /v1/webhooks/{id}': 'Remove a webhook'
+            },
             'auth': {
                 'POST /oauth/token': 'Get OAuth2 token'
             },
             'health': {
-                'GET /health': 'Health check'
+                'GET /health': 'Health check',
+                'GET /metrics': 'Prometheus metrics'
+            },
+            'admin': {
+                'GET /admin/profiles': 'List captured request profiles (PROFILING=1)',
+                'GET /admin/profiles/{id}': 'Get profile as collapsed stacks or pstats text'
             }
         },
         'requiredHeaders': {
@@ -964,6 +3834,194 @@ def get_formula_legacy(formula_id):
     return get_formula(formula_id)
 
 
+# =============================================================================
+# State Persistence (see snapshots.py)
+# =============================================================================
+
+# Record names of the stores in snapshots and the WAL
+PERSISTED_STORES = {
+    'formulaTimeSlices': formula_time_slice_store,
+    'formulaLocations': formula_location_store,
+    'formulaVersions': formula_version_store,
+    'timeSeries': time_series_store,
+    'calculations': calculation_store,
+    'transactions': transaction_store,
+}
+# WAL-only record of a metering values submission; buffered values are
+# durable once logged and are merged into their series again on replay
+METERING_VALUES_RECORD = 'meteringValues'
+
+state: Optional[snapshots.StatePersistence] = None   # set by restore_state() if STATE_DIR is configured
+
+
+def restore_time_series(ts_id: str, ts: Dict[str, Any]) -> None:
+    """Publish a restored series unchanged (keeping its version) and rebuild derived state through the listeners"""
+    with time_series_store.lock(ts_id):
+        old = time_series_store.get(ts_id)
+        for field in LOCATION_FIELDS:
+            if isinstance(ts.get(field), str):
+                ts[field] = location_ids.intern(ts[field])
+        time_series_store.put(ts_id, ts)
+        for listener in time_series_listeners:
+            listener(ts_id, old, ts, None)
+
+
+def apply_restored_record(store: str, key: str, value: Any) -> None:
+    """Apply one snapshot record or WAL entry to the stores"""
+    if store == METERING_VALUES_RECORD:
+        ts_id = metering_series_id(key)
+        with time_series_store.lock(ts_id):
+            writer = meter_writers.setdefault(ts_id, MeterSeriesWriter(key))
+            writer.append([(start, interval) for start, interval in value['values']], value['fields'])
+    elif store == 'timeSeries':
+        restore_time_series(key, value)
+    elif store == 'formulaTimeSlices':
+        intern_location_ids(value['timeSlice'])
+        formula_time_slice_store.put(key, value)
+    elif store == 'formulaLocations':
+        intern_location_ids(value['data'])
+        # Share the time slice instances with the version history again
+        time_slices = value['data']['calculationFormulaTimeSlices']
+        for index, slice_key in enumerate(value.get('timeSlices', [])):
+            shared = formula_time_slice_store.get(slice_key)
+            if shared is not None:
+                time_slices[index] = shared['timeSlice']
+        formula_location_store.put(location_ids.intern(key), value)
+    elif store == 'formulaVersions':
+        intern_location_ids(value)
+        formula_version_store.put(location_ids.intern(key), value)
+    elif store in PERSISTED_STORES:
+        PERSISTED_STORES[store].put(key, value)
+
+
+def log_time_series(ts_id: str, old: Optional[Dict[str, Any]], new: Dict[str, Any],
+                    changed: Optional[List[Dict[str, Any]]] = None) -> None:
+    """Time series listener: log replaced series (appends are logged as metering values)"""
+    if state is not None and changed is None:
+        state.log('timeSeries', ts_id, new)
+
+
+time_series_listeners.append(log_time_series)
+
+
+def collect_state() -> Dict[str, Dict[str, Any]]:
+    """Point-in-time records of all persisted stores, buffered metering values published first"""
+    flush_meter_writers()
+    return {name: store.snapshot() for name, store in PERSISTED_STORES.items()}
+
+
+def snapshot_state() -> Optional[Dict[str, float]]:
+    """Write a snapshot now (None if persistence is off)"""
+    if state is None:
+        return None
+    return state.snapshot(collect_state)
+
+
+def snapshot_loop(persistence: snapshots.StatePersistence) -> None:
+    """Background thread: snapshot every SNAPSHOT_INTERVAL seconds if anything was written"""
+    while True:
+        time.sleep(snapshots.SNAPSHOT_INTERVAL)
+        if persistence.needs_snapshot():
+            try:
+                persistence.snapshot(collect_state)
+            except OSError as e:
+                app.logger.error('State snapshot failed: %s', e)
+
+
+def shutdown_state() -> None:
+    """Snapshot on shutdown so the next start reads one file instead of replaying the WAL"""
+    if state is not None:
+        if state.needs_snapshot():
+            snapshot_state()
+        state.close()
+
+
+def restore_state() -> Dict[str, float]:
+    """
+    Restore the stores from STATE_DIR, then log every write and snapshot
+    periodically. Does nothing without STATE_DIR or when already restored.
+
+    Returns:
+        Restore statistics (records restored, WAL entries replayed, seconds)
+    """
+    global state
+    if not snapshots.STATE_DIR or state is not None:
+        return {}
+
+    persistence = snapshots.StatePersistence(snapshots.STATE_DIR)
+    stats = persistence.restore(apply_restored_record)
+    flush_meter_writers()
+
+    for name, store in PERSISTED_STORES.items():
+        if store is not time_series_store:
+            store.journal = functools.partial(persistence.log, name)
+    state = persistence
+
+    threading.Thread(target=snapshot_loop, args=(persistence,), name='state-snapshots', daemon=True).start()
+    atexit.register(shutdown_state)
+    return stats
+
+
+metrics.REGISTRY.gauge('formula_api_state_restore_seconds', 'Duration of the startup restore from STATE_DIR', (),
+                       lambda: {(): state.stats['restoreSeconds']} if state is not None else {})
+metrics.REGISTRY.counter('formula_api_state_snapshots_total', 'Snapshots written', (),
+                         lambda: {(): state.stats['snapshots']} if state is not None else {})
+metrics.REGISTRY.gauge('formula_api_state_snapshot_seconds', 'Duration of the last snapshot', (),
+                       lambda: {(): state.stats['snapshotSeconds']} if state is not None else {})
+metrics.REGISTRY.gauge('formula_api_state_snapshot_bytes', 'Size of the last snapshot file', (),
+                       lambda: {(): state.stats['snapshotBytes']} if state is not None else {})
+metrics.REGISTRY.counter('formula_api_state_wal_entries_total', 'Writes appended to the WAL', (),
+                         lambda: {(): state.wal.entries} if state is not None else {})
+
+
+# =============================================================================
+# Warmup (production serving)
+# =============================================================================
+
+WARMUP_FORMULA = {
+    'add': [
+        {'meloOperand': {
+            'meloId': 'DE0000000000000000000000000000000',
+            'energyDirection': 'consumption',
+            'lossFactorTransformer': {'percentvalue': 0.0},
+            'lossFactorConduction': {'percentvalue': 0.0},
+            'distributionFactorEnergyQuantity': {'percentvalue': 1.0}
+        }},
+        {'const': '0'}
+    ]
+}
+
+
+def warmup() -> Dict[str, int]:
+    """
+    Prepare a freshly started worker before it accepts traffic
+
+    Restores persisted state (STATE_DIR), precompiles the formulas of all
+    stored FormulaLocations and runs one validation and calculation through
+    the engine so first requests do not pay for lazy initialization.
+
+    Returns:
+        Counts of compiled time slices and restored records
+    """
+    restored = restore_state()
+    compiled = 0
+    for stored in formula_location_store.values():
+        for index, time_slice in enumerate(stored['data'].get('calculationFormulaTimeSlices', [])):
+            get_compiled_formula(time_slice['calculationFormula'], time_slice_formula_key(stored, index))
+            compiled += 1
+
+    validate_calculation_formula(WARMUP_FORMULA)
+    calculate_time_slice(
+        {'calculationFormula': WARMUP_FORMULA},
+        {'DE0000000000000000000000000000000': [{'start': '', 'end': '', 'quantity': '0'}]}
+    )
+    with app.app_context():
+        jsonify({'status': 'warm'})
+
+    return {'compiledTimeSlices': compiled,
+            **{name: int(restored[name]) for name in ('restoredRecords', 'replayedEntries') if name in restored}}
+
+
 # =============================================================================
 # Main Entry Point
 # =============================================================================
@@ -987,15 +4045,34 @@ if __name__ == '__main__':
     print('Additional Endpoints:')
     print('  GET    /formulas              - List all formulas')
     print('  GET    /formulas/{id}         - Get specific formula')
+    print('  POST   /formulas/bulk         - Bulk import formulas (NDJSON)')
     print('  POST   /v1/time-series        - Submit time series')
     print('  GET    /v1/time-series        - Query time series')
+    print('  POST   /v1/metering-points/{id}/values - Append metering values')
+    print('  GET    /v1/balancing-groups/{id}/aggregated-values - Balancing group sums')
     print('  POST   /v1/calculations       - Execute calculation')
+    print('  POST   /v1/calculations/batch - Execute calculation batch (cost-ordered)')
     print('  GET    /v1/calculations/{id}  - Get calculation result')
+    print('  GET    /v1/events             - Event stream (Server-Sent Events)')
+    print('  POST   /v1/webhooks           - Register webhook for events')
     print('  POST   /oauth/token           - Get OAuth2 token')
     print('  GET    /health                - Health check')
+    print('  GET    /metrics               - Prometheus metrics')
+    print('  GET    /admin/profiles        - Captured request profiles (PROFILING=1)')
     print()
-    print('Test with: python demo_client.py')
+    print('Test with: python demo_client_edi.py')
+    print()
+    print('Development server only. For production use:')
+    print('  gunicorn --config gunicorn.conf.py mock_api_server:app')
     print('=' * 70)
     print()
 
-    app.run(debug=True, host='0.0.0.0', port=8000)
+    debug = os.environ.get('FLASK_DEBUG') == '1'
+    # With the debug reloader only the serving child process owns STATE_DIR
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        restored = restore_state()
+        if restored:
+            print(f"Restored {restored['restoredRecords']} records and {restored['replayedEntries']} WAL entries "
+                  f"from {snapshots.STATE_DIR} in {restored['restoreSeconds']:.2f}s")
+
+    app.run(debug=debug, threaded=True, host='0.0.0.0', port=8000)
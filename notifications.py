@@ -0,0 +1,515 @@
+# SPDX-License-Identifier: EUPL-1.2
+# SPDX-FileCopyrightText: 2024 Energy Formula API Contributors
+#
+# Licensed under the EUPL
+"""
+Calculation and Ingest Notifications
+
+Push channel for clients that would otherwise poll GET /v1/calculations/{id}:
+
+- EventBroker numbers events (ids increase by one), keeps the last
+  EVENTS_BUFFER_SIZE of them and hands new ones to subscriptions, the
+  servers' Server-Sent Events streams. A stream reconnecting with
+  Last-Event-ID first receives the events it missed, as far as they are
+  still buffered. Each event is serialized once, however many streams
+  receive it. A subscription falling EVENTS_QUEUE_SIZE events behind is
+  closed; its client reconnects and resumes from the buffer.
+- WebhookDispatcher POSTs events to registered URLs from WEBHOOK_WORKERS
+  background threads. A webhook gets one request at a time, so an endpoint
+  that hangs holds one worker and delays only its own events. Failed deliveries (connection errors, 408, 429, 5xx) wait in a
+  local retry queue with exponential backoff, up to WEBHOOK_MAX_ATTEMPTS
+  attempts; other 4xx answers end delivery at once. Each request carries
+  X-Webhook-Signature: sha256=<hex HMAC-SHA256 of the body, keyed with the
+  webhook's secret>. Webhook URLs must resolve to public addresses: hosts
+  on private, loopback or link-local networks are rejected at registration
+  and again before each delivery (redirects are not followed) unless
+  WEBHOOK_ALLOW_PRIVATE=1.
+
+Like scheduling.FairQueue the broker does not block; it calls the wake
+callback a subscriber passes in, so threads (Event.set) and asyncio tasks
+(call_soon_threadsafe) share one broker. Every event names the token scope
+required to receive it; streams and webhooks only get events within the
+scopes of the token they were opened or registered with.
+
+Environment:
+    EVENTS_BUFFER_SIZE    Events kept for Last-Event-ID resumption (default: 1000)
+    EVENTS_QUEUE_SIZE     Undelivered events per stream before it is closed (default: 1000)
+    EVENTS_MAX_STREAMS    Event streams open at the same time (default: 100)
+    EVENTS_HEARTBEAT      Seconds between keep-alive comments on idle streams (default: 15)
+    WEBHOOK_MAX_ATTEMPTS  Delivery attempts per event and webhook (default: 8)
+    WEBHOOK_RETRY_DELAY   Seconds before the first retry, doubled per attempt (default: 1)
+    WEBHOOK_TIMEOUT       Seconds per delivery request (default: 5)
+    WEBHOOK_QUEUE_SIZE    Deliveries waiting to be (re)sent (default: 10000)
+    WEBHOOK_WORKERS       Deliveries sent at the same time, to different webhooks (default: 4)
+    WEBHOOK_ALLOW_PRIVATE Set to 1 to allow webhooks on private, loopback and link-local hosts
+"""
+
+from __future__ import annotations
+
+import hashlib
+import heapq
+import hmac
+import ipaddress
+import itertools
+import json
+import os
+import secrets
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
+
+EVENTS_BUFFER_SIZE = int(os.environ.get('EVENTS_BUFFER_SIZE', '1000'))
+EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', '1000'))
+EVENTS_MAX_STREAMS = int(os.environ.get('EVENTS_MAX_STREAMS', '100'))
+EVENTS_HEARTBEAT = float(os.environ.get('EVENTS_HEARTBEAT', '15'))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', '8'))
+WEBHOOK_RETRY_DELAY = float(os.environ.get('WEBHOOK_RETRY_DELAY', '1'))
+WEBHOOK_TIMEOUT = float(os.environ.get('WEBHOOK_TIMEOUT', '5'))
+WEBHOOK_QUEUE_SIZE = int(os.environ.get('WEBHOOK_QUEUE_SIZE', '10000'))
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', '4'))
+WEBHOOK_ALLOW_PRIVATE = os.environ.get('WEBHOOK_ALLOW_PRIVATE') == '1'
+
+# Event type -> scope a token needs to receive it
+EVENT_SCOPES = {
+    'calculation.completed': 'calculations.execute',
+    'calculation.failed': 'calculations.execute',
+    'formula.accepted': 'formula.read',
+    'timeseries.ingested': 'timeseries.read',
+}
+EVENT_TYPES = tuple(EVENT_SCOPES)
+
+# Longest wait between two delivery attempts of one event
+WEBHOOK_MAX_RETRY_DELAY = 300.0
+MAX_WEBHOOKS_PER_CLIENT = 20
+
+SIGNATURE_HEADER = 'X-Webhook-Signature'
+
+# Sent first on every stream: reconnect delay for EventSource, in milliseconds
+STREAM_PREAMBLE = b'retry: 3000\n\n'
+HEARTBEAT_FRAME = b': keepalive\n\n'
+
+
+class Event(NamedTuple):
+    id: int
+    type: str
+    scope: str
+    payload: bytes   # JSON {"id", "type", "createdAt", "data"}: webhook body and SSE data line
+    frame: bytes     # the event in text/event-stream framing
+
+
+def make_event(event_id: int, event_type: str, data: Dict[str, Any]) -> Event:
+    created_at = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+    payload = json.dumps({'id': event_id, 'type': event_type, 'createdAt': created_at, 'data': data},
+                         separators=(',', ':')).encode('utf-8')
+    frame = b'id: %d\nevent: %s\ndata: %s\n\n' % (event_id, event_type.encode('ascii'), payload)
+    return Event(event_id, event_type, EVENT_SCOPES[event_type], payload, frame)
+
+
+def parse_event_types(names: Iterable[str]) -> FrozenSet[str]:
+    """Event type filter from type names (none: all types), raises ValueError for unknown types"""
+    types = frozenset(filter(None, (name.strip() for name in names)))
+    unknown = sorted(types.difference(EVENT_TYPES))
+    if unknown:
+        raise ValueError(f'Unknown event type: {", ".join(unknown)} (known: {", ".join(EVENT_TYPES)})')
+    return types
+
+
+def receives(scopes: FrozenSet[str], types: FrozenSet[str], event: Event) -> bool:
+    """True if a stream or webhook with these scopes and type filter gets the event"""
+    return event.scope in scopes and (not types or event.type in types)
+
+
+class EventStreamLimit(Exception):
+    """EVENTS_MAX_STREAMS streams are already open (HTTP 503)"""
+
+
+class Subscription:
+    """An open event stream: events waiting to be written and the wake callback"""
+
+    __slots__ = ('scopes', 'types', 'wake', 'pending', 'closed')
+
+    def __init__(self, scopes: FrozenSet[str], types: FrozenSet[str], wake: Callable[[], None]) -> None:
+        self.scopes = scopes
+        self.types = types
+        self.wake = wake
+        self.pending: Deque[Event] = deque()
+        self.closed = False
+
+
+class EventBroker:
+    """Numbers, buffers and fans out events to subscriptions and listeners"""
+
+    def __init__(self, buffer_size: int = EVENTS_BUFFER_SIZE, queue_size: int = EVENTS_QUEUE_SIZE,
+                 max_subscriptions: int = EVENTS_MAX_STREAMS) -> None:
+        self.queue_size = max(queue_size, 1)
+        self.max_subscriptions = max_subscriptions
+        self._buffer: Deque[Event] = deque(maxlen=max(buffer_size, 1))
+        self._subscriptions: List[Subscription] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.listeners: List[Callable[[Event], None]] = []   # called for every event (webhooks)
+        self.published: Dict[str, int] = defaultdict(int)    # event type -> count
+        self.overflowed = 0
+
+    def publish(self, event_type: str, data: Dict[str, Any]) -> Event:
+        """Number and buffer an event, queue it for matching subscriptions and wake them"""
+        woken = []
+        with self._lock:
+            event = make_event(next(self._ids), event_type, data)
+            self._buffer.append(event)
+            self.published[event_type] += 1
+            for subscription in self._subscriptions:
+                if subscription.closed or not receives(subscription.scopes, subscription.types, event):
+                    continue
+                if len(subscription.pending) >= self.queue_size:
+                    # Too slow: close rather than buffer without bound, the client resumes via Last-Event-ID
+                    subscription.closed = True
+                    self.overflowed += 1
+                else:
+                    subscription.pending.append(event)
+                woken.append(subscription.wake)
+        for wake in woken:
+            wake()
+        for listener in self.listeners:
+            listener(event)
+        return event
+
+    def subscribe(self, scopes: FrozenSet[str], types: FrozenSet[str], wake: Callable[[], None],
+                  last_event_id: Optional[int] = None) -> Subscription:
+        """
+        Open a subscription; with last_event_id the buffered events after it are queued at once
+
+        Raises:
+            EventStreamLimit: max_subscriptions are already open
+        """
+        subscription = Subscription(scopes, types, wake)
+        with self._lock:
+            if len(self._subscriptions) >= self.max_subscriptions:
+                raise EventStreamLimit(f'{self.max_subscriptions} event streams are already open')
+            if last_event_id is not None:
+                subscription.pending.extend(
+                    event for event in self._buffer
+                    if event.id > last_event_id and receives(scopes, types, event))
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscription.closed = True
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def drain(self, subscription: Subscription) -> List[Event]:
+        """Take the events waiting for a subscription"""
+        with self._lock:
+            events = list(subscription.pending)
+            subscription.pending.clear()
+        return events
+
+    def close_all(self) -> None:
+        """Close every subscription (server shutdown), their streams end after draining"""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+            for subscription in subscriptions:
+                subscription.closed = True
+        for subscription in subscriptions:
+            subscription.wake()
+
+    def stream_count(self) -> int:
+        with self._lock:
+            return len(self._subscriptions)
+
+
+def event_stream(broker: EventBroker, subscription: Subscription, wait: Callable[[float], bool]) -> Iterable[bytes]:
+    """
+    text/event-stream body for a thread-served subscription
+
+    Args:
+        wait: Blocks until the subscription's wake callback fired or the
+            timeout elapsed, returns True if woken (and resets the wake-up)
+    """
+    try:
+        yield STREAM_PREAMBLE
+        while True:
+            for event in broker.drain(subscription):
+                yield event.frame
+            if subscription.closed:
+                return
+            if not wait(EVENTS_HEARTBEAT):
+                yield HEARTBEAT_FRAME
+    finally:
+        broker.unsubscribe(subscription)
+
+
+# =============================================================================
+# Webhooks
+# =============================================================================
+
+def validate_webhook_url(url: Any, allow_private: Optional[bool] = None) -> Optional[str]:
+    """
+    Error message if url is not an absolute http(s) URL of a public host, None otherwise
+
+    The host is resolved; every address must be public unless allow_private
+    (default: WEBHOOK_ALLOW_PRIVATE).
+    """
+    if not isinstance(url, str) or not url:
+        return 'url is required'
+    try:
+        parsed = urllib.parse.urlsplit(url)
+        parsed.port  # raises ValueError for a malformed port
+    except ValueError:
+        return 'url must be an absolute http or https URL'
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return 'url must be an absolute http or https URL'
+    if allow_private is None:
+        allow_private = WEBHOOK_ALLOW_PRIVATE
+    if allow_private:
+        return None
+    return webhook_host_error(parsed.hostname)
+
+
+def webhook_host_error(host: str) -> Optional[str]:
+    """Error message if host does not resolve or resolves to a non-public address"""
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)}
+    except (OSError, UnicodeError):
+        return f'url host {host} cannot be resolved'
+    for text in addresses:
+        address = ipaddress.ip_address(text.split('%', 1)[0])
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            return f'url host {host} is on a private, loopback or link-local network ({address})'
+    return None
+
+
+class _RefuseRedirects(urllib.request.HTTPRedirectHandler):
+    """A redirect could lead a delivery to a host validate_webhook_url rejects"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_opener = urllib.request.build_opener(_RefuseRedirects)
+
+
+def sign(secret: str, body: bytes) -> str:
+    """X-Webhook-Signature value of a delivery body"""
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+class Webhook:
+    """A registered callback URL and its delivery statistics"""
+
+    __slots__ = ('id', 'client_id', 'url', 'secret', 'types', 'scopes', 'created_at',
+                 'delivered', 'failed', 'last_error')
+
+    def __init__(self, client_id: str, url: str, secret: str, types: FrozenSet[str], scopes: FrozenSet[str]) -> None:
+        self.id = f'WH-{secrets.token_hex(4)}'
+        self.client_id = client_id
+        self.url = url
+        self.secret = secret
+        self.types = types
+        self.scopes = scopes
+        self.created_at = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+        self.delivered = 0
+        self.failed = 0
+        self.last_error: Optional[str] = None
+
+    def describe(self) -> Dict[str, Any]:
+        """API representation (without the secret)"""
+        return {
+            'webhookId': self.id,
+            'url': self.url,
+            'events': [event_type for event_type in EVENT_TYPES
+                       if EVENT_SCOPES[event_type] in self.scopes and (not self.types or event_type in self.types)],
+            'createdAt': self.created_at,
+            'delivered': self.delivered,
+            'failed': self.failed,
+            'lastError': self.last_error,
+        }
+
+
+class Delivery:
+    """One event on its way to one webhook"""
+
+    __slots__ = ('webhook', 'event', 'attempts')
+
+    def __init__(self, webhook: Webhook, event: Event) -> None:
+        self.webhook = webhook
+        self.event = event
+        self.attempts = 0
+
+
+class WebhookDispatcher:
+    """
+    Registered webhooks and the retry queue of their deliveries
+
+    The worker threads start with the first registered webhook and take
+    deliveries in order of due time. A webhook with a request in flight is
+    busy: its due deliveries are held until that request ends, so each
+    webhook occupies at most one worker.
+    """
+
+    def __init__(self, max_attempts: int = WEBHOOK_MAX_ATTEMPTS, retry_delay: float = WEBHOOK_RETRY_DELAY,
+                 timeout: float = WEBHOOK_TIMEOUT, queue_size: int = WEBHOOK_QUEUE_SIZE,
+                 workers: int = WEBHOOK_WORKERS, allow_private: Optional[bool] = None) -> None:
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.queue_size = queue_size
+        self.workers = max(workers, 1)
+        self.allow_private = WEBHOOK_ALLOW_PRIVATE if allow_private is None else allow_private
+        self._webhooks: Dict[str, Webhook] = {}
+        self._queue: List[Tuple[float, int, Delivery]] = []   # (due, sequence, delivery)
+        self._held: Dict[str, List[Tuple[float, int, Delivery]]] = {}   # busy webhook ID -> due deliveries
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self.results: Dict[str, int] = defaultdict(int)        # delivered, retried, failed, dropped
+
+    def register(self, client_id: str, url: str, types: FrozenSet[str], scopes: FrozenSet[str],
+                 secret: Optional[str] = None) -> Webhook:
+        """
+        Register a webhook receiving the events within scopes (and types, if given)
+
+        Raises:
+            ValueError: The client already has MAX_WEBHOOKS_PER_CLIENT webhooks
+        """
+        webhook = Webhook(client_id, url, secret or secrets.token_urlsafe(24), types, scopes)
+        with self._condition:
+            if sum(1 for hook in self._webhooks.values() if hook.client_id == client_id) >= MAX_WEBHOOKS_PER_CLIENT:
+                raise ValueError(f'At most {MAX_WEBHOOKS_PER_CLIENT} webhooks per client')
+            self._webhooks[webhook.id] = webhook
+            if not self._threads:
+                self._threads = [threading.Thread(target=self._deliver_loop, name=f'webhooks-{index}', daemon=True)
+                                 for index in range(self.workers)]
+                for thread in self._threads:
+                    thread.start()
+        return webhook
+
+    def unregister(self, client_id: str, webhook_id: str) -> bool:
+        """Remove a client's webhook (queued deliveries are discarded), False if it has none with that ID"""
+        with self._condition:
+            webhook = self._webhooks.get(webhook_id)
+            if webhook is None or webhook.client_id != client_id:
+                return False
+            del self._webhooks[webhook_id]
+            self._held.pop(webhook_id, None)
+            return True
+
+    def webhooks(self, client_id: str) -> List[Webhook]:
+        with self._condition:
+            return [hook for hook in self._webhooks.values() if hook.client_id == client_id]
+
+    def enqueue(self, event: Event) -> None:
+        """Queue the event for every matching webhook (EventBroker listener)"""
+        if not self._webhooks:
+            return
+        now = time.monotonic()
+        with self._condition:
+            queued = self._depth()
+            for webhook in self._webhooks.values():
+                if not receives(webhook.scopes, webhook.types, event):
+                    continue
+                if queued >= self.queue_size:
+                    self.results['dropped'] += 1
+                    continue
+                heapq.heappush(self._queue, (now, next(self._sequence), Delivery(webhook, event)))
+                queued += 1
+            self._condition.notify_all()
+
+    def depth(self) -> int:
+        with self._condition:
+            return self._depth()
+
+    def _depth(self) -> int:
+        return len(self._queue) + sum(len(held) for held in self._held.values())
+
+    def _deliver_loop(self) -> None:
+        while True:
+            with self._condition:
+                delivery = self._take()
+            try:
+                self._attempt(delivery)
+            finally:
+                with self._condition:
+                    # The webhook is free again: its held deliveries go back in line
+                    for entry in self._held.pop(delivery.webhook.id, []):
+                        heapq.heappush(self._queue, entry)
+                    self._condition.notify_all()
+
+    def _take(self) -> Delivery:
+        """Wait for the next due delivery to a webhook that is not busy and mark it busy (lock held)"""
+        while True:
+            timeout = self._queue[0][0] - time.monotonic() if self._queue else None
+            if timeout is None or timeout > 0:
+                self._condition.wait(timeout)
+                continue
+            entry = heapq.heappop(self._queue)
+            webhook_id = entry[2].webhook.id
+            if webhook_id not in self._webhooks:
+                continue
+            if webhook_id in self._held:
+                self._held[webhook_id].append(entry)
+                continue
+            self._held[webhook_id] = []
+            return entry[2]
+
+    def _attempt(self, delivery: Delivery) -> None:
+        webhook = delivery.webhook
+        delivery.attempts += 1
+        error, retry = self.send(webhook, delivery.event)
+        with self._condition:
+            if error is None:
+                webhook.delivered += 1
+                self.results['delivered'] += 1
+            elif retry and delivery.attempts < self.max_attempts:
+                webhook.last_error = error
+                self.results['retried'] += 1
+                delay = min(self.retry_delay * 2 ** (delivery.attempts - 1), WEBHOOK_MAX_RETRY_DELAY)
+                heapq.heappush(self._queue, (time.monotonic() + delay, next(self._sequence), delivery))
+            else:
+                webhook.last_error = error
+                webhook.failed += 1
+                self.results['failed'] += 1
+
+    def send(self, webhook: Webhook, event: Event) -> Tuple[Optional[str], bool]:
+        """
+        POST the event to the webhook
+
+        Returns:
+            (None, False) if delivered, otherwise (error, worth retrying)
+        """
+        if not self.allow_private:
+            # The host may resolve differently than at registration
+            error = webhook_host_error(urllib.parse.urlsplit(webhook.url).hostname)
+            if error is not None:
+                return error, False
+        request = urllib.request.Request(webhook.url, data=event.payload, method='POST', headers={
+            'Content-Type': 'application/json',
+            'User-Agent': 'formula-api-webhooks',
+            'X-Webhook-Id': webhook.id,
+            'X-Event-Id': str(event.id),
+            'X-Event-Type': event.type,
+            SIGNATURE_HEADER: sign(webhook.secret, event.payload),
+        })
+        try:
+            with _opener.open(request, timeout=self.timeout) as response:
+                response.read()
+            return None, False
+        except urllib.error.HTTPError as e:
+            return f'HTTP {e.code}', e.code in (408, 429) or e.code >= 500
+        except (OSError, ValueError) as e:
+            return f'{type(e).__name__}: {e}', True
+
+
+broker = EventBroker()
+webhooks = WebhookDispatcher()
+broker.listeners.append(webhooks.enqueue)
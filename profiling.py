@@ -0,0 +1,186 @@
+# SPDX-License-Identifier: EUPL-1.2
+# SPDX-FileCopyrightText: 2024 Energy Formula API Contributors
+#
+# Licensed under the EUPL
+"""
+Opt-in Request Profiling
+
+Captures cProfile profiles of selected requests (formula submission,
+calculation) inside the running server and keeps the most recent ones for
+retrieval, as collapsed stacks for flamegraph tools (flamegraph.pl,
+speedscope, inferno) or as a pstats text report.
+
+Disabled unless PROFILING=1. A request is profiled when it carries the
+header `X-Profile: 1` or, with PROFILE_SAMPLE_RATE > 0, when it is sampled.
+Only one request is profiled at a time; concurrent requests run unprofiled.
+
+Environment:
+    PROFILING            1 = enable profiling (default: disabled)
+    PROFILE_SAMPLE_RATE  Fraction of requests profiled without header (default: 0)
+    PROFILE_STORE_SIZE   Number of profiles kept (default: 50)
+"""
+
+from __future__ import annotations
+
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ENABLED = os.environ.get('PROFILING') == '1'
+SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+STORE_SIZE = int(os.environ.get('PROFILE_STORE_SIZE', '50'))
+
+HEADER = 'X-Profile'
+ID_HEADER = 'X-Profile-Id'
+
+# Paths carrying less time than this (seconds) are left out of collapsed stacks
+MIN_STACK_SECONDS = 1e-6
+
+# Function key in pstats: (filename, line number, function name)
+FunctionKey = Tuple[str, int, str]
+
+_active = threading.Lock()
+
+
+class ProfileStore:
+    """Bounded, insertion-ordered store of captured profiles (oldest evicted first)"""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, summary: Dict[str, Any], stats: pstats.Stats) -> None:
+        with self._lock:
+            self._data[summary['profileId']] = (summary, stats)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[Tuple[Dict[str, Any], pstats.Stats]]:
+        with self._lock:
+            return self._data.get(profile_id)
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        """Profile summaries, newest first"""
+        with self._lock:
+            return [summary for summary, _ in reversed(self._data.values())]
+
+
+profile_store = ProfileStore(STORE_SIZE)
+
+
+def should_profile(header_value: Optional[str]) -> Optional[str]:
+    """
+    Decide whether to profile a request
+
+    Returns:
+        The trigger ('header' or 'sample'), or None to run unprofiled
+    """
+    if not ENABLED:
+        return None
+    if header_value is not None and header_value.lower() in ('1', 'true', 'yes'):
+        return 'header'
+    if SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+        return 'sample'
+    return None
+
+
+def run_profiled(name: str, fn: Callable, *args: Any,
+                 metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Tuple[Any, Optional[str]]:
+    """
+    Call fn under cProfile in the current thread and store the profile
+
+    The profile is stored even if fn raises. If another profile is being
+    captured, fn runs unprofiled.
+
+    Returns:
+        (fn result, profile ID or None)
+    """
+    if not _active.acquire(blocking=False):
+        return fn(*args, **kwargs), None
+
+    profile_id = f'PROF-{uuid.uuid4().hex[:8]}'
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    try:
+        return profiler.runcall(fn, *args, **kwargs), profile_id
+    finally:
+        duration = time.perf_counter() - started
+        _active.release()
+        summary = {
+            'profileId': profile_id,
+            'name': name,
+            'capturedAt': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+            'durationMs': round(duration * 1000, 3),
+            **(metadata or {})
+        }
+        profile_store.add(summary, pstats.Stats(profiler))
+
+
+def _frame_label(func: FunctionKey) -> str:
+    filename, line, function_name = func
+    if filename == '~':
+        label = function_name
+    else:
+        label = f'{function_name} ({os.path.basename(filename)}:{line})'
+    return label.replace(';', ',')
+
+
+def render_collapsed(stats: pstats.Stats) -> str:
+    """
+    Render a profile as collapsed stacks ("frame;frame;frame microseconds")
+
+    cProfile records caller -> callee edges, not full stacks, so stacks are
+    reconstructed from the roots down and a function's time is split across
+    its callers in proportion to the edge times. Recursive calls are folded
+    into the first occurrence on the path.
+    """
+    raw = stats.stats
+    callees: Dict[FunctionKey, List[Tuple[FunctionKey, float]]] = {}
+    roots = []
+    for func, (_, _, _, _, callers) in raw.items():
+        known_callers = [caller for caller in callers if caller in raw]
+        if not known_callers:
+            roots.append(func)
+        for caller in known_callers:
+            callees.setdefault(caller, []).append((func, callers[caller][3]))
+
+    weights: Dict[Tuple[str, ...], float] = {}
+    stack = [((root,), raw[root][3]) for root in roots]
+    while stack:
+        path, total = stack.pop()
+        func = path[-1]
+        func_total = raw[func][3]
+        scale = total / func_total if func_total else 0.0
+
+        own = raw[func][2] * scale
+        for callee, edge_total in callees.get(func, ()):
+            child_total = edge_total * scale
+            if callee in path:
+                own += child_total
+            elif child_total >= MIN_STACK_SECONDS:
+                stack.append((path + (callee,), child_total))
+
+        if own >= MIN_STACK_SECONDS:
+            key = tuple(_frame_label(frame) for frame in path)
+            weights[key] = weights.get(key, 0.0) + own
+
+    lines = [f'{";".join(key)} {round(seconds * 1_000_000)}' for key, seconds in sorted(weights.items())]
+    return '\n'.join(line for line in lines if not line.endswith(' 0')) + '\n'
+
+
+def render_text(stats: pstats.Stats, limit: int = 50) -> str:
+    """pstats report of the functions with the highest cumulative time"""
+    out = io.StringIO()
+    report = pstats.Stats(stream=out)
+    report.add(stats)
+    report.sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
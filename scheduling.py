@@ -0,0 +1,273 @@
+# SPDX-License-Identifier: EUPL-1.2
+# SPDX-FileCopyrightText: 2024 Energy Formula API Contributors
+#
+# Licensed under the EUPL
+"""
+Per-Client Rate Limits and Fair Calculation Scheduling
+
+Two mechanisms keep one busy partner from starving the others:
+
+- Token buckets per OAuth client limit submission requests (calculations,
+  time series, metering values, bulk imports). A request finding the bucket
+  empty is rejected with the time until a token is available, which the
+  servers send as 429 with Retry-After.
+- Calculations run on a fixed number of execution slots. When all slots are
+  busy, waiting jobs are granted in weighted fair queuing order (self-clocked
+  fair queuing): each job gets the finish tag
+  max(virtual time, client's previous finish tag) + cost / client weight,
+  and the smallest tag runs next. A client flooding the queue only delays
+  its own jobs, and a small partner's cheap calculation overtakes a large
+  partner's backlog. Queued jobs per client are bounded.
+
+FairQueue does not block; it calls the wake callback a waiter passes in when
+the waiter is granted a slot, so threads (Event.set) and asyncio tasks
+(call_soon_threadsafe) share one queue.
+
+Environment:
+    RATE_LIMIT_RATE               Submission requests per second per client, 0 = off (default: 50)
+    RATE_LIMIT_BURST              Bucket size, requests accepted at once (default: 100)
+    CALCULATION_CONCURRENCY       Calculations executing at the same time (default: 2)
+    CALCULATION_QUEUE_PER_CLIENT  Calculations a client may have waiting (default: 100)
+    CALCULATION_QUEUE_TIMEOUT     Seconds a calculation waits for a slot (default: 30)
+    CLIENT_WEIGHTS                Fair share weights, e.g. "tso-a=4,msb-b=0.5" (default: 1 each)
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def parse_weights(text: str) -> Dict[str, float]:
+    """Parse "client=weight,..." into a dict, raises ValueError if malformed"""
+    weights = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        client_id, _, weight = item.partition('=')
+        weights[client_id.strip()] = float(weight)
+    if any(weight <= 0 for weight in weights.values()):
+        raise ValueError('Client weights must be positive')
+    return weights
+
+
+RATE_LIMIT_RATE = float(os.environ.get('RATE_LIMIT_RATE', '50'))
+RATE_LIMIT_BURST = float(os.environ.get('RATE_LIMIT_BURST', '100'))
+CALCULATION_CONCURRENCY = int(os.environ.get('CALCULATION_CONCURRENCY', '2'))
+CALCULATION_QUEUE_PER_CLIENT = int(os.environ.get('CALCULATION_QUEUE_PER_CLIENT', '100'))
+CALCULATION_QUEUE_TIMEOUT = float(os.environ.get('CALCULATION_QUEUE_TIMEOUT', '30'))
+CLIENT_WEIGHTS = parse_weights(os.environ.get('CLIENT_WEIGHTS', ''))
+
+# Idle buckets are dropped once this many clients are tracked
+MAX_TRACKED_CLIENTS = 10000
+
+
+class Throttled(Exception):
+    """Request rejected by a rate limit or a full calculation queue (HTTP 429)"""
+
+    def __init__(self, message: str, retry_after: float, reason: str) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+    @property
+    def retry_after_header(self) -> str:
+        """Retry-After value: whole seconds, at least 1"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class RateLimiter:
+    """Token bucket per client: `rate` tokens per second, at most `burst` stored"""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._buckets: Dict[str, List[float]] = {}   # client -> [tokens, last refill]
+        self._lock = threading.Lock()
+        self.throttled: Dict[str, int] = defaultdict(int)
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def acquire(self, client_id: str, tokens: float = 1.0) -> float:
+        """
+        Take tokens from the client's bucket
+
+        Returns:
+            0.0 if the request may proceed, otherwise seconds until the
+            bucket holds enough tokens (nothing is taken)
+        """
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client_id)
+            if bucket is None:
+                if len(self._buckets) >= MAX_TRACKED_CLIENTS:
+                    self._drop_idle(now)
+                bucket = self._buckets[client_id] = [self.burst, now]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] >= tokens:
+                bucket[0] -= tokens
+                return 0.0
+            self.throttled[client_id] += 1
+            return (tokens - bucket[0]) / self.rate
+
+    def _drop_idle(self, now: float) -> None:
+        # A bucket that has refilled completely behaves like a new one
+        for client_id, (tokens, last) in list(self._buckets.items()):
+            if tokens + (now - last) * self.rate >= self.burst:
+                del self._buckets[client_id]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class Ticket:
+    """A calculation's place in the FairQueue"""
+
+    __slots__ = ('client_id', 'cost', 'finish', 'wake', 'granted', 'cancelled', 'queued_at')
+
+    def __init__(self, client_id: str, cost: float, wake: Callable[[], None]) -> None:
+        self.client_id = client_id
+        self.cost = cost
+        self.finish = 0.0
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+        self.queued_at = time.monotonic()
+
+
+class FairQueue:
+    """
+    Weighted fair queuing of jobs onto `slots` execution slots
+
+    submit() grants a free slot immediately or queues the job; release()
+    frees a slot and grants it to the queued job with the smallest finish
+    tag. Job costs are in any consistent unit (the calculation engine's cost
+    estimate); costs below 1 count as 1.
+    """
+
+    def __init__(self, slots: int, max_queued_per_client: int,
+                 weights: Optional[Dict[str, float]] = None) -> None:
+        self.slots = max(slots, 1)
+        self.max_queued_per_client = max_queued_per_client
+        self.weights = weights or {}
+        self.busy = 0
+        self._heap: List[Tuple[float, int, Ticket]] = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._queued: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self.rejected: Dict[str, int] = defaultdict(int)   # reason -> count
+
+    def submit(self, client_id: str, cost: Callable[[], Optional[float]], wake: Callable[[], None],
+               bounded: bool = True) -> Ticket:
+        """
+        Request a slot; ticket.granted tells whether it was granted at once,
+        otherwise wake() is called (from the releasing thread) once it is
+
+        Args:
+            cost: Returns the job's cost estimate; only called if the job has
+                to queue, so uncontended jobs skip the estimation
+            bounded: Enforce the per-client queue limit (False for work that
+                was already admitted, e.g. later packs of a batch)
+
+        Raises:
+            Throttled: The client already has max_queued_per_client jobs waiting
+        """
+        ticket = Ticket(client_id, 1.0, wake)
+        if self._grant_free_slot(ticket):
+            return ticket
+        ticket.cost = max(float(cost() or 0.0), 1.0)
+
+        with self._lock:
+            # A slot may have been freed while the cost was estimated
+            if self.busy < self.slots:
+                self.busy += 1
+                ticket.granted = True
+                return ticket
+            if bounded and self._queued[client_id] >= self.max_queued_per_client:
+                self.rejected['queue_full'] += 1
+                raise Throttled(f'Client {client_id} has {self.max_queued_per_client} calculations queued',
+                                1.0, 'queue_full')
+
+            start = max(self._virtual_time, self._last_finish.get(client_id, 0.0))
+            ticket.finish = start + ticket.cost / self.weights.get(client_id, 1.0)
+            self._last_finish[client_id] = ticket.finish
+            self._queued[client_id] += 1
+            heapq.heappush(self._heap, (ticket.finish, next(self._sequence), ticket))
+        return ticket
+
+    def _grant_free_slot(self, ticket: Ticket) -> bool:
+        with self._lock:
+            if self.busy < self.slots:
+                self.busy += 1
+                ticket.granted = True
+            return ticket.granted
+
+    def release(self, ticket: Ticket) -> None:
+        """Free the slot held by a granted ticket and grant it to the next job"""
+        with self._lock:
+            ticket.granted = False
+            successor = self._next()
+            if successor is None:
+                self.busy -= 1
+        if successor is not None:
+            successor.wake()
+
+    def cancel(self, ticket: Ticket, reason: str = 'timeout') -> bool:
+        """
+        Withdraw a queued ticket (wait timed out, client went away)
+
+        Returns:
+            True if the ticket was granted in the meantime; the caller then
+            holds the slot and must release() it
+        """
+        with self._lock:
+            if ticket.granted:
+                return True
+            if not ticket.cancelled:
+                ticket.cancelled = True
+                self._dequeued(ticket.client_id)
+                self.rejected[reason] += 1
+            return False
+
+    def _next(self) -> Optional[Ticket]:
+        """Pop the live ticket with the smallest finish tag and grant it (lock held)"""
+        while self._heap:
+            _, _, ticket = heapq.heappop(self._heap)
+            if ticket.cancelled:
+                continue
+            ticket.granted = True
+            self._virtual_time = ticket.finish
+            self._dequeued(ticket.client_id)
+            return ticket
+        # Nothing is waiting, so past service no longer counts against anyone
+        self._last_finish.clear()
+        return None
+
+    def _dequeued(self, client_id: str) -> None:
+        self._queued[client_id] -= 1
+        if not self._queued[client_id]:
+            del self._queued[client_id]
+
+    def depth(self) -> int:
+        """Jobs waiting for a slot"""
+        with self._lock:
+            return sum(self._queued.values())
+
+    def queued_clients(self) -> int:
+        with self._lock:
+            return len(self._queued)
+
+
+submission_limits = RateLimiter(RATE_LIMIT_RATE, RATE_LIMIT_BURST)
+calculation_queue = FairQueue(CALCULATION_CONCURRENCY, CALCULATION_QUEUE_PER_CLIENT, CLIENT_WEIGHTS)
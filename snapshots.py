@@ -0,0 +1,730 @@
+# SPDX-License-Identifier: EUPL-1.2
+# SPDX-FileCopyrightText: 2024 Energy Formula API Contributors
+#
+# Licensed under the EUPL
+"""
+State Snapshots and Write-Ahead Log
+
+Keeps the in-memory stores across restarts. Every write is appended to a
+write-ahead log (WAL); periodically all stores are written to one compact
+snapshot file and the log is started over. A restart maps the latest
+snapshot into memory, rebuilds the records from it and replays the log
+written since.
+
+Records holding an interval list (time series) are stored as columnar
+frames: one JSON header with the series fields, then the interval columns
+as arrays (float64 quantities, one quality code byte, epoch-second
+timestamps, or just start and step for regular series). Restoring a series
+builds its intervals column by column instead of parsing JSON per interval.
+The frames are lossless: timestamps, quantity strings (e.g. "100.000"), key
+order and positions come back exactly as stored. Intervals that do not fit
+the series' columns are kept verbatim next to them; series where that
+would be more than a quarter of the intervals are stored as JSON.
+
+Directory layout (STATE_DIR):
+    snapshot-<seq>.bin  all stores as of the start of WAL segment <seq>
+    wal-<seq>.log       writes since then, one segment per snapshot period
+    lock                locked (flock) by the one process persisting to the directory
+
+A second process restoring from a locked directory waits up to
+STATE_LOCK_TIMEOUT for it (a replaced worker writing its final snapshot),
+then gets StateDirectoryLocked: its snapshots would delete the WAL
+segments the first one still writes.
+
+Snapshot file:
+    magic    4 bytes  b'EFSS'
+    version  uint16   1
+    reserved uint16
+    seq      uint64   first WAL segment to replay on top of the snapshot
+    records until end of file
+
+Record:
+    kind       uint8   RECORD_JSON or RECORD_SERIES
+    store_len  uint8   length of the store name
+    key_len    uint32  length of the record key
+    value_len  uint32  length of the value
+    store, key         UTF-8
+    value              JSON or time series frame
+
+Time series frame:
+    meta_len   uint32  length of the JSON meta data
+    meta               series fields, interval key order, quantity format,
+                       verbatim intervals by index
+    n          uint32  number of intervals
+    step       uint32  interval length in seconds, 0 = explicit timestamps
+    start      int64   epoch seconds of the first interval start
+    quantities         n x float64
+    qualities          n x uint8 quality code (timeseries_codec.QUALITY_CODES)
+    starts, ends       n x int64 epoch seconds each, only present when step == 0
+
+All integers and floats are little-endian.
+
+WAL entry:
+    length   uint32   length of the record that follows
+    crc32    uint32   checksum of the record
+    record            same layout as in snapshots
+
+A record is logged after the store write it describes, so replay never
+sees a write that did not happen. Replaying an entry already contained in
+the snapshot writes the same record again. A torn entry at the end of a
+segment (crash during a write) ends the replay of that segment.
+
+Without WAL_FSYNC, logged writes survive a crash of the process but not of
+the machine (they are in the OS page cache); snapshots are always synced.
+
+Environment:
+    STATE_DIR          Directory for snapshots and WAL, persistence is off if unset
+    SNAPSHOT_INTERVAL  Seconds between snapshots, taken only after writes (default: 300)
+    WAL_FSYNC          1 = fsync every WAL entry (default: 0)
+    STATE_LOCK_TIMEOUT Seconds to wait for another process to release STATE_DIR (default: 30)
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: directories are not locked
+    fcntl = None
+
+from timeseries_codec import QUALITY_BY_NAME, QUALITY_CODES, format_timestamp, parse_timestamp
+
+STATE_DIR = os.environ.get('STATE_DIR', '')
+SNAPSHOT_INTERVAL = float(os.environ.get('SNAPSHOT_INTERVAL', '300'))
+WAL_FSYNC = os.environ.get('WAL_FSYNC', '0') == '1'
+STATE_LOCK_TIMEOUT = float(os.environ.get('STATE_LOCK_TIMEOUT', '30'))
+
+MAGIC = b'EFSS'
+VERSION = 1
+
+# Record kinds
+RECORD_JSON = 1     # value is UTF-8 JSON
+RECORD_SERIES = 2   # value is a columnar time series frame
+
+_FILE_HEADER = struct.Struct('<4sHHQ')
+RECORD = struct.Struct('<BBII')          # kind, store name length, key length, value length
+_ENTRY = struct.Struct('<II')            # length, crc32
+_FRAME_META_LEN = struct.Struct('<I')
+_FRAME_LAYOUT = struct.Struct('<IIq')    # n, step (0 = explicit timestamps), first start
+
+_SNAPSHOT_NAME = re.compile(r'snapshot-(\d+)\.bin$')
+_SEGMENT_NAME = re.compile(r'wal-(\d+)\.log$')
+
+_NEEDS_BYTESWAP = sys.byteorder != 'little'
+
+# Interval fields a frame has columns for; other fields make a series JSON
+INTERVAL_FIELDS = frozenset(('position', 'start', 'end', 'quantity', 'quality'))
+
+# Series with more verbatim intervals than this share are stored as JSON
+MAX_EXCEPTION_SHARE = 0.25
+
+
+# =============================================================================
+# Time Series Frames
+# =============================================================================
+
+_day_prefixes: Dict[int, str] = {}
+_clock_texts: Dict[int, str] = {}
+_clock_columns: Dict[Tuple[int, int], List[str]] = {}
+
+
+def _day_prefix(day: int) -> str:
+    prefix = _day_prefixes.get(day)
+    if prefix is None:
+        if len(_day_prefixes) > 100000:
+            _day_prefixes.clear()
+        prefix = _day_prefixes[day] = format_timestamp(day * 86400)[:11]
+    return prefix
+
+
+def _timestamp_text(epoch: int) -> str:
+    """format_timestamp with the date and time-of-day parts cached"""
+    day, clock = divmod(epoch, 86400)
+    text = _clock_texts.get(clock)
+    if text is None:
+        text = _clock_texts[clock] = format_timestamp(clock)[11:]
+    return _day_prefix(day) + text
+
+
+def _timestamp_texts(first: int, step: int, count: int) -> List[str]:
+    """Texts of count timestamps step seconds apart, built day by day from cached time-of-day columns"""
+    if 86400 % step:
+        return list(map(_timestamp_text, range(first, first + count * step, step)))
+    phase = first % step
+    clocks = _clock_columns.get((step, phase))
+    if clocks is None:
+        clocks = _clock_columns[(step, phase)] = [format_timestamp(clock)[11:] for clock in range(phase, 86400, step)]
+
+    texts: List[str] = []
+    epoch, end = first, first + count * step
+    while epoch < end:
+        day = epoch - epoch % 86400
+        prefix = _day_prefix(day // 86400)
+        low = (epoch - day - phase) // step
+        high = min(len(clocks), (end - day - phase + step - 1) // step)
+        texts.extend([prefix + clock for clock in clocks[low:high]])
+        epoch = day + phase + high * step
+    return texts
+
+
+def _canonical_epoch(text: Any) -> Optional[int]:
+    """Epoch seconds of a timestamp that _timestamp_text reproduces exactly, else None"""
+    if type(text) is not str:
+        return None
+    try:
+        epoch = parse_timestamp(text)
+    except (TypeError, ValueError):
+        return None
+    return epoch if _timestamp_text(epoch) == text else None
+
+
+def _quantity_format(value: Any) -> Optional[Tuple[str, int]]:
+    """(kind, decimals) reproducing value from a float64, None if there is none"""
+    if type(value) is str:
+        whole, _, fraction = value.partition('.')
+        if whole.lstrip('-').isdigit() and (not fraction or fraction.isdigit()) and value.isascii():
+            return 'fixed', len(fraction)
+        return None
+    if type(value) is float:
+        return 'float', 0
+    if type(value) is int and abs(value) < 2 ** 53:
+        return 'int', 0
+    return None
+
+
+def _quantity_formatter(kind: str, decimals: int) -> Callable[[float], Any]:
+    if kind == 'fixed':
+        return f'{{:.{decimals}f}}'.format
+    if kind == 'int':
+        return int
+    return float
+
+
+def _le_bytes(column: array) -> bytes:
+    if _NEEDS_BYTESWAP:
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _le_array(typecode: str, payload: memoryview) -> array:
+    column = array(typecode)
+    column.frombytes(payload)
+    if _NEEDS_BYTESWAP:
+        column.byteswap()
+    return column
+
+
+# Interval constructors for the key orders the API writes (dict displays
+# build intervals about twice as fast as dict(zip(keys, row)))
+_INTERVAL_BUILDERS: Dict[Tuple[str, ...], Callable[..., Dict[str, Any]]] = {
+    # Submitted and calculated series
+    ('position', 'start', 'end', 'quantity', 'quality'):
+        lambda position, start, end, quantity, quality:
+            {'position': position, 'start': start, 'end': end, 'quantity': quantity, 'quality': quality},
+    ('position', 'start', 'end', 'quantity'):
+        lambda position, start, end, quantity: {'position': position, 'start': start, 'end': end, 'quantity': quantity},
+    # Metering point series (position is assigned when values are merged)
+    ('start', 'end', 'quantity', 'quality', 'position'):
+        lambda start, end, quantity, quality, position:
+            {'start': start, 'end': end, 'quantity': quantity, 'quality': quality, 'position': position},
+    ('start', 'end', 'quantity', 'position'):
+        lambda start, end, quantity, position: {'start': start, 'end': end, 'quantity': quantity, 'position': position},
+}
+
+
+def encode_series(ts: Dict[str, Any]) -> Optional[bytes]:
+    """
+    Encode a time series record as a columnar frame
+
+    Returns:
+        The frame, or None if the series has no interval columns worth
+        storing (no or irregular intervals); store it as JSON then
+    """
+    intervals = ts.get('intervals')
+    if not isinstance(intervals, list) or not intervals or type(intervals[0]) is not dict:
+        return None
+    keys = tuple(intervals[0])
+    if not INTERVAL_FIELDS.issuperset(keys) or not {'start', 'end', 'quantity'}.issubset(keys):
+        return None
+    quantity_format = _quantity_format(intervals[0]['quantity'])
+    if quantity_format is None:
+        return None
+    without_quality = tuple(key for key in keys if key != 'quality')
+    quantity_type = type(intervals[0]['quantity'])
+    format_quantity = _quantity_formatter(*quantity_format)
+    has_position = 'position' in keys
+
+    n = len(intervals)
+    starts = array('q', bytes(8 * n))
+    ends = array('q', bytes(8 * n))
+    quantities = array('d', bytes(8 * n))
+    qualities = bytearray(n)
+    exceptions: Dict[str, Any] = {}
+    previous_end_text, previous_end = None, 0
+    length = 0
+
+    for i, interval in enumerate(intervals):
+        try:
+            layout = tuple(interval)
+            if layout != keys and layout != without_quality:
+                raise ValueError('fields')
+            if has_position and (type(interval['position']) is not int or interval['position'] != i + 1):
+                raise ValueError('position')
+
+            start_text = interval['start']
+            if previous_end_text is not None and start_text == previous_end_text:
+                start = previous_end
+            else:
+                start = _canonical_epoch(start_text)
+            if start is None:
+                raise ValueError('timestamp')
+            # Most intervals are as long as the previous one: format instead of parsing
+            end_text = interval['end']
+            end = start + length
+            if type(end_text) is not str or _timestamp_text(end) != end_text:
+                end = _canonical_epoch(end_text)
+                if end is None:
+                    raise ValueError('timestamp')
+                length = end - start
+
+            value = interval['quantity']
+            quantity = float(value)
+            if type(value) is not quantity_type or format_quantity(quantity) != value:
+                raise ValueError('quantity')
+
+            if 'quality' in interval:
+                qualities[i] = QUALITY_BY_NAME[interval['quality']]
+        except (TypeError, ValueError, KeyError, OverflowError):
+            exceptions[str(i)] = interval
+            previous_end_text = None
+            continue
+
+        starts[i] = start
+        ends[i] = end
+        quantities[i] = quantity
+        previous_end_text, previous_end = interval['end'], end
+
+    if len(exceptions) > n * MAX_EXCEPTION_SHARE:
+        return None
+
+    step = ends[0] - starts[0]
+    regular = not exceptions and 0 < step <= 0xFFFFFFFF and all(
+        ends[i] - starts[i] == step and starts[i] == starts[0] + i * step for i in range(n))
+
+    meta = {
+        'series': {key: None if key == 'intervals' else value for key, value in ts.items()},
+        'keys': list(keys),
+        'quantity': quantity_format[0],
+        'decimals': quantity_format[1],
+        'exceptions': exceptions,
+    }
+    meta_bytes = json.dumps(meta, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    parts = [_FRAME_META_LEN.pack(len(meta_bytes)), meta_bytes,
+             _FRAME_LAYOUT.pack(n, step if regular else 0, starts[0]),
+             _le_bytes(quantities), bytes(qualities)]
+    if not regular:
+        parts.append(_le_bytes(starts))
+        parts.append(_le_bytes(ends))
+    return b''.join(parts)
+
+
+def decode_series(frame: memoryview) -> Dict[str, Any]:
+    """Rebuild the time series record encoded by encode_series"""
+    (meta_len,) = _FRAME_META_LEN.unpack_from(frame, 0)
+    offset = _FRAME_META_LEN.size
+    meta = json.loads(bytes(frame[offset:offset + meta_len]).decode('utf-8'))
+    offset += meta_len
+    n, step, first_start = _FRAME_LAYOUT.unpack_from(frame, offset)
+    offset += _FRAME_LAYOUT.size
+    quantities = _le_array('d', frame[offset:offset + 8 * n])
+    offset += 8 * n
+    qualities = bytes(frame[offset:offset + n])
+    offset += n
+
+    if step:
+        # Contiguous: each end text is the next interval's start text
+        texts = _timestamp_texts(first_start, step, n + 1)
+        start_texts, end_texts = texts[:-1], texts[1:]
+    else:
+        start_texts = list(map(_timestamp_text, _le_array('q', frame[offset:offset + 8 * n])))
+        end_texts = list(map(_timestamp_text, _le_array('q', frame[offset + 8 * n:offset + 16 * n])))
+
+    keys = tuple(meta['keys'])
+    columns = {
+        'position': range(1, n + 1),
+        'start': start_texts,
+        'end': end_texts,
+        'quantity': list(map(_quantity_formatter(meta['quantity'], meta['decimals']), quantities)),
+        'quality': [QUALITY_CODES[code] for code in qualities],
+    }
+    build = _INTERVAL_BUILDERS.get(keys)
+    if build is not None:
+        intervals = list(map(build, *[columns[key] for key in keys]))
+    else:
+        intervals = [dict(zip(keys, row)) for row in zip(*[columns[key] for key in keys])]
+
+    if 'quality' in keys and 0 in qualities:
+        for i, code in enumerate(qualities):
+            if not code:
+                del intervals[i]['quality']
+    for index, interval in meta['exceptions'].items():
+        intervals[int(index)] = interval
+
+    series = meta['series']
+    series['intervals'] = intervals
+    return series
+
+
+# =============================================================================
+# Records
+# =============================================================================
+
+def encode_value(value: Any) -> Tuple[int, bytes]:
+    """(kind, payload) of a store record: frames for time series, JSON otherwise"""
+    if isinstance(value, dict) and 'intervals' in value:
+        frame = encode_series(value)
+        if frame is not None:
+            return RECORD_SERIES, frame
+    return RECORD_JSON, json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def decode_value(kind: int, payload: memoryview) -> Any:
+    if kind == RECORD_SERIES:
+        return decode_series(payload)
+    if kind == RECORD_JSON:
+        return json.loads(bytes(payload).decode('utf-8'))
+    raise ValueError(f'Unknown record kind {kind}')
+
+
+def pack_record(kind: int, store: str, key: str, payload: bytes) -> bytes:
+    store_bytes, key_bytes = store.encode('utf-8'), key.encode('utf-8')
+    return b''.join((RECORD.pack(kind, len(store_bytes), len(key_bytes), len(payload)),
+                     store_bytes, key_bytes, payload))
+
+
+def unpack_record(view: memoryview, offset: int) -> Tuple[int, str, str, memoryview, int]:
+    """
+    Record at offset
+
+    Returns:
+        (kind, store, key, payload view, offset after the record)
+
+    Raises:
+        ValueError: The record is truncated
+    """
+    if offset + RECORD.size > len(view):
+        raise ValueError('Record header truncated')
+    kind, store_len, key_len, value_len = RECORD.unpack_from(view, offset)
+    offset += RECORD.size
+    end = offset + store_len + key_len + value_len
+    if end > len(view):
+        raise ValueError('Record truncated')
+    store = bytes(view[offset:offset + store_len]).decode('utf-8')
+    offset += store_len
+    key = bytes(view[offset:offset + key_len]).decode('utf-8')
+    offset += key_len
+    return kind, store, key, view[offset:end], end
+
+
+# =============================================================================
+# Snapshot Files and WAL Segments
+# =============================================================================
+
+def _fsync_directory(directory: str) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _numbered_files(directory: str, pattern: re.Pattern) -> List[Tuple[int, str]]:
+    """(seq, path) of the matching files in ascending seq order"""
+    found = []
+    for name in os.listdir(directory):
+        match = pattern.match(name)
+        if match:
+            found.append((int(match.group(1)), os.path.join(directory, name)))
+    return sorted(found)
+
+
+def write_snapshot(path: str, seq: int, records: Iterable[bytes]) -> int:
+    """Write packed records as snapshot file atomically (temp file, fsync, rename); returns its size"""
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(_FILE_HEADER.pack(MAGIC, VERSION, 0, seq))
+        for record in records:
+            f.write(record)
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.tell()
+    os.replace(temporary, path)
+    _fsync_directory(os.path.dirname(path) or '.')
+    return size
+
+
+def read_snapshot(path: str) -> Iterator[Tuple[int, str, str, memoryview]]:
+    """
+    Records of a snapshot file, read through a memory map
+
+    Payload views point into the map: decode or copy them before the next
+    record is requested.
+
+    Raises:
+        ValueError: The file is not a snapshot or is truncated
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < _FILE_HEADER.size:
+            raise ValueError(f'{path}: not a snapshot')
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    try:
+        magic, version, _, _ = _FILE_HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path}: not a version {VERSION} snapshot')
+        offset = _FILE_HEADER.size
+        while offset < len(view):
+            kind, store, key, payload, offset = unpack_record(view, offset)
+            yield kind, store, key, payload
+            payload.release()
+    finally:
+        view.release()
+        mapped.close()
+
+
+def read_segment(path: str) -> Iterator[Tuple[int, str, str, memoryview]]:
+    """Records of a WAL segment up to the first torn or corrupt entry"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    view = memoryview(data)
+    offset = 0
+    while offset + _ENTRY.size <= len(view):
+        length, checksum = _ENTRY.unpack_from(view, offset)
+        body = view[offset + _ENTRY.size:offset + _ENTRY.size + length]
+        if len(body) < length or zlib.crc32(body) != checksum:
+            return
+        kind, store, key, payload, _ = unpack_record(body, 0)
+        yield kind, store, key, payload
+        offset += _ENTRY.size + length
+
+
+class WriteAheadLog:
+    """Append-only WAL segment, switched to a new segment at every snapshot"""
+
+    def __init__(self, directory: str, seq: int, fsync: bool = WAL_FSYNC) -> None:
+        self.directory = directory
+        self.fsync = fsync
+        self.entries = 0           # entries written by this process
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._open(seq)
+
+    def _open(self, seq: int) -> None:
+        self.seq = seq
+        self.path = os.path.join(self.directory, f'wal-{seq}.log')
+        self._fd: Optional[int] = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.pending = 0           # entries in the current segment
+
+    def append(self, record: bytes) -> None:
+        entry = _ENTRY.pack(len(record), zlib.crc32(record)) + record
+        with self._lock:
+            os.write(self._fd, entry)
+            if self.fsync:
+                os.fsync(self._fd)
+            self.entries += 1
+            self.pending += 1
+            self.bytes += len(entry)
+
+    @property
+    def closed(self) -> bool:
+        return self._fd is None
+
+    def rotate(self, seq: int) -> None:
+        """Close the current segment (synced) and continue in segment seq"""
+        with self._lock:
+            os.fsync(self._fd)
+            os.close(self._fd)
+            self._open(seq)
+
+    def close(self) -> None:
+        """Sync and close the segment; closing again does nothing"""
+        with self._lock:
+            if self._fd is None:
+                return
+            os.fsync(self._fd)
+            os.close(self._fd)
+            self._fd = None
+
+
+# =============================================================================
+# Persistence of a Set of Stores
+# =============================================================================
+
+# Applies one restored record: apply(store name, key, value)
+ApplyRecord = Callable[[str, str, Any], None]
+
+
+class StateDirectoryLocked(RuntimeError):
+    """STATE_DIR is already used by another process"""
+
+
+def lock_directory(directory: str, timeout: float = STATE_LOCK_TIMEOUT) -> Optional[int]:
+    """
+    Take the directory's lock file for this process, waiting up to timeout seconds
+
+    Returns:
+        The lock file descriptor (None where flock is unavailable); the
+        lock is held until it is closed or the process exits
+
+    Raises:
+        StateDirectoryLocked: Another process still holds the lock after timeout
+    """
+    if fcntl is None:
+        return None
+    fd = os.open(os.path.join(directory, 'lock'), os.O_RDWR | os.O_CREAT, 0o644)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except OSError as e:
+            if time.monotonic() >= deadline:
+                os.close(fd)
+                raise StateDirectoryLocked(f'{directory} is in use by another process; '
+                                           f'only one process (one gunicorn worker) may persist to it') from e
+            time.sleep(0.1)
+
+
+class StatePersistence:
+    """
+    Snapshots plus WAL for named stores
+
+    The owner restores once at startup, then logs every write with log()
+    and calls snapshot() periodically with a function returning the
+    current records per store. Encoded records are cached by identity:
+    store records are immutable, so a snapshot re-encodes only records
+    published since the previous one.
+    """
+
+    def __init__(self, directory: str, fsync: bool = WAL_FSYNC) -> None:
+        self.directory = directory
+        self.fsync = fsync
+        self.wal: Optional[WriteAheadLog] = None
+        self._lock_fd: Optional[int] = None
+        self.replayed = 0          # WAL entries replayed at startup and not yet in a snapshot
+        # (store, key) -> (record, packed record); replaced wholesale by snapshot()
+        self._encoded: Dict[Tuple[str, str], Tuple[Any, bytes]] = {}
+        self._snapshot_lock = threading.Lock()
+        self.stats: Dict[str, float] = {
+            'restoreSeconds': 0.0, 'restoredRecords': 0, 'replayedEntries': 0,
+            'snapshots': 0, 'snapshotSeconds': 0.0, 'snapshotBytes': 0, 'snapshotRecords': 0,
+        }
+
+    def restore(self, apply: ApplyRecord) -> Dict[str, float]:
+        """
+        Load the latest snapshot and replay the WAL written since, then open
+        a new WAL segment. Call once, before the first log().
+
+        Raises:
+            StateDirectoryLocked: Another process persists to the directory
+        """
+        started = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_fd = lock_directory(self.directory)
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                os.remove(os.path.join(self.directory, name))
+
+        snapshots = _numbered_files(self.directory, _SNAPSHOT_NAME)
+        seq = 0
+        restored = 0
+        if snapshots:
+            seq, path = snapshots[-1]
+            for kind, store, key, payload in read_snapshot(path):
+                value = decode_value(kind, payload)
+                self._encoded[(store, key)] = (value, pack_record(kind, store, key, bytes(payload)))
+                apply(store, key, value)
+                restored += 1
+
+        replayed = 0
+        segments = [(segment, path) for segment, path in _numbered_files(self.directory, _SEGMENT_NAME)
+                    if segment >= seq]
+        for _, path in segments:
+            for kind, store, key, payload in read_segment(path):
+                apply(store, key, decode_value(kind, payload))
+                replayed += 1
+
+        self.wal = WriteAheadLog(self.directory, max([seq] + [segment for segment, _ in segments]) + 1, self.fsync)
+        self.replayed = replayed
+        self.stats.update(restoreSeconds=time.perf_counter() - started, restoredRecords=restored,
+                          replayedEntries=replayed)
+        return dict(self.stats)
+
+    def needs_snapshot(self) -> bool:
+        """Whether writes were logged (or replayed) since the latest snapshot and the WAL is still open"""
+        return not self.wal.closed and (self.wal.pending > 0 or self.replayed > 0)
+
+    def log(self, store: str, key: str, value: Any) -> None:
+        """Append a store write to the WAL (call after the write, under the key's lock)"""
+        kind, payload = encode_value(value)
+        record = pack_record(kind, store, key, payload)
+        self.wal.append(record)
+        self._encoded[(store, key)] = (value, record)
+
+    def snapshot(self, collect: Callable[[], Dict[str, Dict[str, Any]]]) -> Dict[str, float]:
+        """
+        Write a snapshot of the stores returned by collect() (store name ->
+        point-in-time record dict) and drop the WAL and snapshots it replaces
+        """
+        with self._snapshot_lock:
+            started = time.perf_counter()
+            seq = self.wal.seq + 1
+            # Writes from here on go to the new segment and are replayed on top
+            self.wal.rotate(seq)
+            stores = collect()
+
+            encoded: Dict[Tuple[str, str], Tuple[Any, bytes]] = {}
+            previous = self._encoded
+            for store, records in stores.items():
+                for key, value in records.items():
+                    cached = previous.get((store, key))
+                    if cached is None or cached[0] is not value:
+                        kind, payload = encode_value(value)
+                        cached = (value, pack_record(kind, store, key, payload))
+                    encoded[(store, key)] = cached
+            # Records logged while encoding are cached again by their next write
+            self._encoded = encoded
+
+            path = os.path.join(self.directory, f'snapshot-{seq}.bin')
+            size = write_snapshot(path, seq, (record for _, record in encoded.values()))
+            self.replayed = 0
+            for old_seq, old_path in _numbered_files(self.directory, _SNAPSHOT_NAME):
+                if old_seq < seq:
+                    os.remove(old_path)
+            for old_seq, old_path in _numbered_files(self.directory, _SEGMENT_NAME):
+                if old_seq < seq:
+                    os.remove(old_path)
+
+            self.stats.update(snapshots=self.stats['snapshots'] + 1, snapshotSeconds=time.perf_counter() - started,
+                              snapshotBytes=size, snapshotRecords=sum(len(records) for records in stores.values()))
+            return dict(self.stats)
+
+    def close(self) -> None:
+        if self.wal is not None:
+            self.wal.close()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
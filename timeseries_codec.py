@@ -0,0 +1,278 @@
+# SPDX-License-Identifier: EUPL-1.2
+# SPDX-FileCopyrightText: 2024 Energy Formula API Contributors
+#
+# Licensed under the EUPL
+"""
+Packed Binary Time Series Format
+
+Compact columnar wire format for POST /v1/time-series and
+GET /v1/time-series/{id}, negotiated via Content-Type / Accept:
+
+    application/vnd.energy-timeseries.packed
+
+All integers and floats are little-endian.
+
+Container:
+    magic       4 bytes   b'ETSP'
+    version     uint16    1
+    count       uint16    number of series frames that follow
+
+Frame (one per time series):
+    header_len  uint32    length of the JSON header in bytes
+    header      bytes     UTF-8 JSON with all TimeSeries fields except
+                          "intervals" (timeSeriesId, marketLocationId, ...)
+    n           uint32    number of intervals
+    step        uint32    interval length in seconds, 0 = explicit timestamps
+    start       int64     epoch seconds of the first interval start
+    quantities  n x float64
+    qualities   n x uint8 quality code (see QUALITY_CODES, 0 = not set)
+    starts      n x int64 epoch seconds, only present when step == 0
+    ends        n x int64 epoch seconds, only present when step == 0
+
+Decoded quantities are the shortest decimal strings that parse back to the
+same float64: a packed upload stores the same values as the JSON one, only
+the notation may differ ("100.000" decodes as "100.0").
+
+A regular PT15M day is 96 * 9 bytes plus the header, compared to roughly
+120 bytes per interval in the JSON representation.
+"""
+
+from __future__ import annotations
+
+from array import array
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, List, Any, Tuple
+import json
+import struct
+import sys
+
+MEDIA_TYPE = 'application/vnd.energy-timeseries.packed'
+
+MAGIC = b'ETSP'
+VERSION = 1
+
+# Quality indicators from the OpenAPI QualityIndicator enum plus the
+# EDI@Energy timeSliceQuality values. Codes are part of the wire format:
+# append new values, never reorder.
+QUALITY_CODES = (
+    None,
+    'METERED',
+    'ESTIMATED',
+    'SUBSTITUTE',
+    'FORECASTED',
+    'VALIDATED',
+    'MISSING',
+    'Gültige Daten',
+    'Keine Daten',
+)
+QUALITY_BY_NAME = {name: code for code, name in enumerate(QUALITY_CODES) if name}
+
+_CONTAINER = struct.Struct('<4sHH')
+_FRAME_HEADER_LEN = struct.Struct('<I')
+_FRAME_LAYOUT = struct.Struct('<IIq')
+
+_NEEDS_BYTESWAP = sys.byteorder != 'little'
+
+
+# =============================================================================
+# Column Conversion
+# =============================================================================
+
+def parse_timestamp(value: str) -> int:
+    """Convert an ISO 8601 timestamp to epoch seconds (naive = UTC)"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def format_timestamp(epoch_seconds: int) -> str:
+    """Convert epoch seconds to an ISO 8601 UTC timestamp"""
+    return datetime.fromtimestamp(epoch_seconds, timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def format_quantity(value: float) -> str:
+    """Format a quantity as decimal string with at most 6 decimal places"""
+    text = f'{value:.6f}'.rstrip('0')
+    return text + '0' if text.endswith('.') else text
+
+
+def format_exact_quantity(value: float) -> str:
+    """Format a quantity as the shortest decimal string that parses back to value"""
+    text = repr(value)
+    if 'e' in text or 'E' in text:
+        # 1e-07, 1e+16: written out positionally, as a JSON client would send them
+        text = format(Decimal(text), 'f')
+    return text if '.' in text or not text[-1:].isdigit() else text + '.0'
+
+
+def intervals_to_columns(intervals: List[Dict[str, Any]]) -> Tuple[array, array, array, bytearray]:
+    """
+    Split interval objects into columns
+
+    Returns:
+        (starts, ends, quantities, qualities) with epoch-second timestamps,
+        float64 quantities and one quality code byte per interval
+
+    Raises:
+        ValueError: On unparseable timestamps/quantities or unknown quality values
+    """
+    n = len(intervals)
+    starts = array('q', bytes(8 * n))
+    ends = array('q', bytes(8 * n))
+    quantities = array('d', bytes(8 * n))
+    qualities = bytearray(n)
+
+    for i, interval in enumerate(intervals):
+        try:
+            starts[i] = parse_timestamp(interval['start'])
+            ends[i] = parse_timestamp(interval['end'])
+            quantities[i] = float(interval.get('quantity', 0))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f'intervals[{i}]: {e}') from e
+
+        quality = interval.get('quality')
+        if quality is not None:
+            if quality not in QUALITY_BY_NAME:
+                raise ValueError(f'intervals[{i}]: quality {quality!r} has no packed encoding')
+            qualities[i] = QUALITY_BY_NAME[quality]
+
+    return starts, ends, quantities, qualities
+
+
+def columns_to_intervals(starts, ends, quantities, qualities) -> List[Dict[str, Any]]:
+    """Build interval objects from columns (inverse of intervals_to_columns)"""
+    intervals = []
+    for i in range(len(quantities)):
+        interval = {
+            'position': i + 1,
+            'start': format_timestamp(starts[i]),
+            'end': format_timestamp(ends[i]),
+            'quantity': format_exact_quantity(quantities[i]),
+        }
+        quality = QUALITY_CODES[qualities[i]] if qualities[i] < len(QUALITY_CODES) else None
+        if quality is not None:
+            interval['quality'] = quality
+        intervals.append(interval)
+    return intervals
+
+
+def _regular_step(starts: array, ends: array) -> int:
+    """Return the uniform interval length in seconds, or 0 if irregular"""
+    if not starts:
+        return 0
+    step = ends[0] - starts[0]
+    if step <= 0 or step > 0xFFFFFFFF:
+        return 0
+    for i in range(len(starts)):
+        if ends[i] - starts[i] != step or starts[i] != starts[0] + i * step:
+            return 0
+    return step
+
+
+def _to_le_bytes(column: array) -> bytes:
+    if _NEEDS_BYTESWAP:
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _from_le_bytes(typecode: str, payload: bytes) -> array:
+    column = array(typecode)
+    column.frombytes(payload)
+    if _NEEDS_BYTESWAP:
+        column.byteswap()
+    return column
+
+
+# =============================================================================
+# Encoding / Decoding
+# =============================================================================
+
+def encode_time_series(time_series_list: List[Dict[str, Any]]) -> bytes:
+    """
+    Encode TimeSeries objects into the packed binary format
+
+    Raises:
+        ValueError: If a series cannot be represented (see intervals_to_columns)
+    """
+    if len(time_series_list) > 0xFFFF:
+        raise ValueError('Packed container holds at most 65535 time series')
+
+    parts = [_CONTAINER.pack(MAGIC, VERSION, len(time_series_list))]
+
+    for ts in time_series_list:
+        header = {key: value for key, value in ts.items() if key != 'intervals'}
+        header_bytes = json.dumps(header, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+        starts, ends, quantities, qualities = intervals_to_columns(ts.get('intervals', []))
+        step = _regular_step(starts, ends)
+
+        parts.append(_FRAME_HEADER_LEN.pack(len(header_bytes)))
+        parts.append(header_bytes)
+        parts.append(_FRAME_LAYOUT.pack(len(quantities), step, starts[0] if starts else 0))
+        parts.append(_to_le_bytes(quantities))
+        parts.append(bytes(qualities))
+        if step == 0:
+            parts.append(_to_le_bytes(starts))
+            parts.append(_to_le_bytes(ends))
+
+    return b''.join(parts)
+
+
+def decode_time_series(payload: bytes) -> List[Dict[str, Any]]:
+    """
+    Decode a packed binary payload into TimeSeries objects
+
+    Raises:
+        ValueError: On malformed or truncated payloads
+    """
+    view = memoryview(payload)
+    if len(view) < _CONTAINER.size:
+        raise ValueError('Packed payload too short')
+
+    magic, version, count = _CONTAINER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ValueError('Packed payload has invalid magic bytes')
+    if version != VERSION:
+        raise ValueError(f'Unsupported packed format version: {version}')
+
+    offset = _CONTAINER.size
+    time_series_list = []
+
+    def take(size: int) -> memoryview:
+        nonlocal offset
+        if offset + size > len(view):
+            raise ValueError('Packed payload truncated')
+        chunk = view[offset:offset + size]
+        offset += size
+        return chunk
+
+    for _ in range(count):
+        (header_len,) = _FRAME_HEADER_LEN.unpack(take(_FRAME_HEADER_LEN.size))
+        try:
+            header = json.loads(bytes(take(header_len)).decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ValueError(f'Invalid frame header: {e}') from e
+        if not isinstance(header, dict):
+            raise ValueError('Frame header must be a JSON object')
+
+        n, step, start = _FRAME_LAYOUT.unpack(take(_FRAME_LAYOUT.size))
+        quantities = _from_le_bytes('d', take(8 * n))
+        qualities = bytes(take(n))
+
+        if step:
+            starts = range(start, start + n * step, step)
+            ends = range(start + step, start + (n + 1) * step, step)
+        else:
+            starts = _from_le_bytes('q', take(8 * n))
+            ends = _from_le_bytes('q', take(8 * n))
+
+        header['intervals'] = columns_to_intervals(starts, ends, quantities, qualities)
+        time_series_list.append(header)
+
+    if offset != len(view):
+        raise ValueError('Trailing bytes after last packed frame')
+
+    return time_series_list